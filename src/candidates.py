@@ -0,0 +1,112 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .features import get_genre_matrix
+from utils.title_index import get_title_index
+
+# Candidates taken from each retrieval source before the overall cap
+DEFAULT_SOURCE_COUNTS = {
+    'content': 150,
+    'collaborative': 100,
+    'popular': 100
+}
+
+def content_neighbors(anime_df: pd.DataFrame, selected_anime: List[str], n: int) -> np.ndarray:
+    """Anime IDs of the n titles whose genres are most similar to the selection."""
+    selected = get_title_index(anime_df).mask(selected_anime)
+    if n <= 0 or not selected.any():
+        return np.array([], dtype=anime_df['anime_id'].dtype)
+
+    genre_matrix = get_genre_matrix(anime_df)
+
+    # TF-IDF rows are L2-normalized, so the mean cosine similarity is one product
+    profile = np.asarray(genre_matrix[selected].mean(axis=0))
+    scores = np.asarray(genre_matrix @ profile.T).ravel()
+    scores[selected] = -np.inf
+
+    n = min(n, len(scores))
+    top = np.argpartition(-scores, n - 1)[:n]
+    top = top[np.isfinite(scores[top])]
+    return anime_df['anime_id'].values[top[np.argsort(-scores[top])]]
+
+def collaborative_neighbors(svd_model, anime_df: pd.DataFrame, selected_anime: List[str], n: int) -> np.ndarray:
+    """Anime IDs whose SVD item factors are closest (cosine) to those of the selection."""
+    if svd_model is None or n <= 0:
+        return np.array([], dtype=anime_df['anime_id'].dtype)
+
+    trainset = svd_model.trainset
+    selected_ids = anime_df['anime_id'].values[get_title_index(anime_df).positions(selected_anime)]
+    selected_inner = [trainset.to_inner_iid(aid) for aid in selected_ids if trainset.knows_item_raw(aid)]
+    if not selected_inner:
+        return np.array([], dtype=anime_df['anime_id'].dtype)
+
+    factors = svd_model.qi
+    norms = np.linalg.norm(factors, axis=1)
+    norms[norms == 0] = 1.0
+    unit = factors / norms[:, None]
+    scores = unit @ unit[selected_inner].mean(axis=0)
+    scores[selected_inner] = -np.inf
+
+    n = min(n, len(scores))
+    top = np.argpartition(-scores, n - 1)[:n]
+    top = top[np.argsort(-scores[top])]
+    return np.array([trainset.to_raw_iid(inner) for inner in top if np.isfinite(scores[inner])])
+
+def popular_titles(anime_df: pd.DataFrame, n: int) -> np.ndarray:
+    """Anime IDs of the n titles with the most members."""
+    if n <= 0:
+        return np.array([], dtype=anime_df['anime_id'].dtype)
+    return anime_df.nlargest(n, 'members')['anime_id'].values
+
+def generate_candidates(
+    anime_df: pd.DataFrame,
+    selected_anime: List[str],
+    svd_model=None,
+    max_candidates: int = 300,
+    source_counts: Optional[Dict[str, int]] = None
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Cheap retrieval stage ahead of model scoring.
+
+    Takes the union of content neighbors of the selection, collaborative item
+    neighbors (SVD item factors) and popular titles, in that priority order,
+    without the selected titles, capped at max_candidates.
+
+    Args:
+        anime_df (pd.DataFrame): DataFrame with anime information
+        selected_anime (list): Titles the user selected
+        svd_model (SVD): Trained SVD model for item neighbors (optional)
+        max_candidates (int): Maximum number of candidates returned
+        source_counts (dict): Candidates per source, defaults in DEFAULT_SOURCE_COUNTS
+
+    Returns:
+        tuple: (candidate anime IDs, seconds spent per source)
+    """
+    counts = {**DEFAULT_SOURCE_COUNTS, **(source_counts or {})}
+    timings = {}
+
+    sources = []
+    source_start = time.time()
+    sources.append(content_neighbors(anime_df, selected_anime, counts['content']))
+    timings['content'] = time.time() - source_start
+
+    source_start = time.time()
+    sources.append(collaborative_neighbors(svd_model, anime_df, selected_anime, counts['collaborative']))
+    timings['collaborative'] = time.time() - source_start
+
+    source_start = time.time()
+    sources.append(popular_titles(anime_df, counts['popular']))
+    timings['popular'] = time.time() - source_start
+
+    selected_ids = set(anime_df['anime_id'].values[get_title_index(anime_df).positions(selected_anime)])
+    candidates = []
+    seen = set(selected_ids)
+    for source in sources:
+        for anime_id in source:
+            if anime_id not in seen:
+                seen.add(anime_id)
+                candidates.append(anime_id)
+    return np.array(candidates[:max_candidates], dtype=anime_df['anime_id'].dtype), timings
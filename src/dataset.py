@@ -0,0 +1,109 @@
+import os
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Optional
+
+import pandas as pd
+
+from .filters import CatalogFilterIndex, get_filter_index
+from .rating_store import RatingStore, get_rating_store
+from .result_cache import dataset_fingerprint
+from utils.title_index import TitleIndex, get_title_index
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+
+@dataclass(frozen=True, eq=False)
+class DatasetHandle:
+    """
+    One loaded version of the catalog and ratings.
+
+    The handle is immutable and identified by its version, a fingerprint of
+    the data files' metadata (plus the event log's compaction generation)
+    computed once at load time. It hashes and
+    compares by that version, so caches can key on the handle (or
+    handle.version) in O(1) instead of hashing DataFrames. The rating store
+    and the lookup indexes are built on first access and shared by everything
+    holding the handle.
+
+    Named DatasetHandle to avoid confusion with surprise.Dataset.
+    """
+
+    version: str
+    catalog: pd.DataFrame
+    ratings: pd.DataFrame
+
+    def __hash__(self) -> int:
+        return hash(self.version)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, DatasetHandle) and other.version == self.version
+
+    @cached_property
+    def rating_store(self) -> RatingStore:
+        """CSR/CSC rating store, memory-mapped from cache/rating_store."""
+        return get_rating_store(self.ratings, self.version)
+
+    @cached_property
+    def title_index(self) -> TitleIndex:
+        return get_title_index(self.catalog)
+
+    @cached_property
+    def filter_index(self) -> CatalogFilterIndex:
+        return get_filter_index(self.catalog)
+
+# Most recently loaded handle per data directory
+_HANDLES = {}
+_HANDLES_LOCK = threading.Lock()
+
+def load_dataset(data_dir: Optional[str] = None, event_log=None) -> DatasetHandle:
+    """
+    The dataset in data_dir (anime.csv and ratings.csv), loaded once per version.
+
+    Each call only stats the files; the data is loaded again when their
+    fingerprint changes. With an event log, the explicit ratings of its last
+    compaction replace the file's ratings of the same (user, anime) pairs, and
+    the compaction generation is part of the version, so every compaction
+    gives a new version (and rating store).
+
+    Args:
+        data_dir (str): Directory with anime.csv and ratings.csv (default: data/)
+        event_log (EventLog): Log whose compacted ratings are merged in (optional)
+
+    Returns:
+        DatasetHandle: Handle for the current version of the files and log
+    """
+    from utils.helpers import load_anime_data
+    from utils.data_cache import load_table, RATINGS_SCHEMA
+
+    data_dir = data_dir or DEFAULT_DATA_DIR
+    anime_path = os.path.join(data_dir, "anime.csv")
+    ratings_path = os.path.join(data_dir, "ratings.csv")
+    files_version = dataset_fingerprint(anime_path, ratings_path)
+
+    def make_version(generation):
+        return files_version if generation is None else f"{files_version}-g{generation}"
+
+    with _HANDLES_LOCK:
+        handle = _HANDLES.get(data_dir)
+        generation = event_log.generation() if event_log is not None else None
+        if handle is not None and handle.version == make_version(generation):
+            return handle
+
+        catalog = load_anime_data(anime_path).reset_index(drop=True)
+        ratings = load_table(ratings_path, RATINGS_SCHEMA)
+        if event_log is not None:
+            generation, log_ratings = event_log.compacted_ratings()
+            ratings = _merge_ratings(ratings, log_ratings)
+        handle = DatasetHandle(make_version(generation), catalog, ratings)
+        _HANDLES[data_dir] = handle
+        return handle
+
+def _merge_ratings(ratings: pd.DataFrame, log_ratings: pd.DataFrame) -> pd.DataFrame:
+    """ratings with log_ratings added, replacing earlier ratings of the same (user, anime) pairs."""
+    if log_ratings.empty:
+        return ratings
+    keys = pd.MultiIndex.from_arrays([ratings['user_id'].values, ratings['anime_id'].values])
+    replaced = keys.isin(pd.MultiIndex.from_arrays([log_ratings['user_id'].values, log_ratings['anime_id'].values]))
+    return pd.concat([ratings.loc[~replaced, ['user_id', 'anime_id', 'rating']], log_ratings], ignore_index=True)
@@ -0,0 +1,322 @@
+import glob
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.cache_storage import file_lock
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_EVENT_DIR = os.path.join(PROJECT_ROOT, "data/events")
+
+# Event types
+EVENT_RATING = 1     # value: rating 1-10, or -1 for watched but not rated
+EVENT_FAVORITE = 2   # value: 1 added, 0 removed
+EVENT_STATUS = 3     # value: code from STATUS_CODES, 0 clears the status
+EVENT_WATCHLIST = 4  # value: 1 added, 0 removed
+EVENT_FEEDBACK = 5   # value: 1 liked, -1 disliked
+
+STATUS_CODES = {'none': 0, 'plan_to_watch': 1, 'watching': 2, 'completed': 3}
+
+# Segment files: a magic header, then fixed-size little-endian records
+SEGMENT_MAGIC = b"KRSEVT1\n"
+RECORD = struct.Struct("<qiiBb2x")  # timestamp_ms, user_id, anime_id, event_type, value, padding
+EVENT_DTYPE = np.dtype([
+    ('timestamp_ms', '<i8'), ('user_id', '<i4'), ('anime_id', '<i4'),
+    ('event_type', 'u1'), ('value', 'i1'), ('pad', 'V2')
+])
+assert EVENT_DTYPE.itemsize == RECORD.size
+
+# Columns of the compacted tables
+COMPACTED_COLUMNS = ['timestamp_ms', 'user_id', 'anime_id', 'event_type', 'value']
+
+class EventLog:
+    """
+    Append-only log of rating events and implicit signals.
+
+    Events are appended as fixed-size binary records to the newest segment
+    file under an exclusive file lock. compact() seals the active segment,
+    folds the sealed segments into a compacted columnar table (the latest
+    event per user, anime and type), and deletes them, so the log stays
+    bounded by the number of distinct (user, anime, type) keys.
+
+    delta() reads the events appended since a position. Each compaction bumps
+    the generation, and load_dataset() merges the compacted explicit ratings
+    into a new dataset version.
+    """
+
+    def __init__(self, directory: str = DEFAULT_EVENT_DIR, fsync: bool = True):
+        """
+        Args:
+            directory (str): Directory for the segments and compacted tables
+            fsync (bool): Flush every append to disk before returning
+        """
+        self.directory = directory
+        self.fsync = fsync
+        self._lock_path = os.path.join(directory, "log")
+        self._compact_lock_path = os.path.join(directory, "compact")
+        self._checkpoint_path = os.path.join(directory, "checkpoint.json")
+        os.makedirs(os.path.join(directory, "segments"), exist_ok=True)
+
+    # Segments
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, "segments", f"{seq:08d}.log")
+
+    def _segments(self) -> list:
+        """Sequence numbers of the segments on disk, oldest first."""
+        paths = glob.glob(os.path.join(self.directory, "segments", "*.log"))
+        return sorted(int(os.path.basename(p)[:-4]) for p in paths)
+
+    def _active_segment(self) -> int:
+        """Sequence number of the segment appends go to (created if needed); call with the log lock held."""
+        segments = self._segments()
+        if segments:
+            return segments[-1]
+        seq = self._checkpoint().get('through_segment', 0) + 1
+        with open(self._segment_path(seq), 'wb') as f:
+            f.write(SEGMENT_MAGIC)
+        return seq
+
+    def _read_segment(self, seq: int) -> np.ndarray:
+        """Records of a segment; a torn last record is ignored."""
+        try:
+            with open(self._segment_path(seq), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        n = (len(data) - len(SEGMENT_MAGIC)) // RECORD.size
+        return np.frombuffer(data, dtype=EVENT_DTYPE, count=max(n, 0), offset=len(SEGMENT_MAGIC))
+
+    def _segment_records(self, seq: int) -> int:
+        """Number of whole records in a segment."""
+        try:
+            size = os.path.getsize(self._segment_path(seq))
+        except FileNotFoundError:
+            return 0
+        return max(size - len(SEGMENT_MAGIC), 0) // RECORD.size
+
+    # Writing
+
+    def append(self, user_id: int, anime_id: int, event_type: int, value: int,
+               timestamp_ms: Optional[int] = None) -> None:
+        """Append one event."""
+        self.append_many([(user_id, anime_id, event_type, value, timestamp_ms)])
+
+    def append_many(self, events: Iterable[Tuple]) -> None:
+        """
+        Append events in one write.
+
+        Args:
+            events (iterable): (user_id, anime_id, event_type, value[, timestamp_ms]) tuples;
+                a missing or None timestamp means now
+        """
+        now = int(time.time() * 1000)
+        payload = b"".join(
+            RECORD.pack(
+                event[4] if len(event) > 4 and event[4] is not None else now,
+                int(event[0]), int(event[1]), int(event[2]), int(event[3])
+            )
+            for event in events
+        )
+        if not payload:
+            return
+        with file_lock(self._lock_path):
+            with open(self._segment_path(self._active_segment()), 'r+b') as f:
+                # Drop a torn record left by a crashed writer, so records stay aligned
+                size = f.seek(0, os.SEEK_END)
+                torn = (size - len(SEGMENT_MAGIC)) % RECORD.size
+                if torn:
+                    f.truncate(size - torn)
+                    f.seek(size - torn)
+                f.write(payload)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+    # Reading
+
+    def position(self) -> Tuple[int, int]:
+        """Current end of the log as (segment, record index), for delta() later."""
+        with file_lock(self._lock_path, shared=True):
+            segments = self._segments()
+            if not segments:
+                return self._checkpoint().get('through_segment', 0) + 1, 0
+            return segments[-1], self._segment_records(segments[-1])
+
+    def delta(self, since: Optional[Tuple[int, int]] = None) -> Tuple[np.ndarray, Tuple[int, int], bool]:
+        """
+        Events appended after a position, e.g. to fold new ratings into a model.
+
+        Args:
+            since (tuple): Position from position() or an earlier delta(); None for
+                everything not yet compacted
+
+        Returns:
+            tuple: (events, new position, complete) - complete is False when part
+                of the requested range was compacted meanwhile; it is in the
+                dataset from load_dataset() since that compaction
+        """
+        with file_lock(self._lock_path, shared=True):
+            segments = self._segments()
+            through = self._checkpoint().get('through_segment', 0)
+            since_seq, since_index = since if since is not None else (0, 0)
+            complete = since is None or since_seq > through
+
+            chunks = []
+            for seq in segments:
+                if seq < since_seq:
+                    continue
+                records = self._read_segment(seq)
+                chunks.append(records[since_index:] if seq == since_seq else records)
+            if segments:
+                end = (segments[-1], self._segment_records(segments[-1]))
+            else:
+                end = (through + 1, 0)
+
+        events = np.concatenate(chunks) if chunks else np.empty(0, dtype=EVENT_DTYPE)
+        return events, end, complete
+
+    def generation(self) -> int:
+        """Generation of the compacted table (0 before the first compaction); compact() bumps it."""
+        return self._checkpoint().get('generation', 0)
+
+    def compacted_ratings(self) -> Tuple[int, pd.DataFrame]:
+        """
+        Latest explicit rating per (user, anime) in the compacted table.
+
+        Returns:
+            tuple: (generation, DataFrame of user_id, anime_id, rating)
+        """
+        with file_lock(self._compact_lock_path, shared=True):
+            generation = self.generation()
+            compacted = self._compacted()
+            ratings = compacted[compacted['event_type'].values == EVENT_RATING]
+            # Copies, so the table can be deleted by the next compaction
+            return generation, pd.DataFrame({
+                'user_id': ratings['user_id'].values.astype(np.int32),
+                'anime_id': ratings['anime_id'].values.astype(np.int32),
+                'rating': ratings['value'].values.astype(np.int8)
+            })
+
+    # Compaction
+
+    def _checkpoint(self) -> dict:
+        try:
+            with open(self._checkpoint_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _compacted(self) -> pd.DataFrame:
+        """The compacted table: latest event per (user, anime, type) up to the last compaction."""
+        generation = self._checkpoint().get('generation')
+        if generation is None:
+            return pd.DataFrame({name: np.empty(0, dtype=EVENT_DTYPE[name]) for name in COMPACTED_COLUMNS})
+        path = os.path.join(self.directory, f"compacted-{generation}")
+        return pd.DataFrame({
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in COMPACTED_COLUMNS
+        })
+
+    def compact(self) -> int:
+        """
+        Fold all sealed segments into a new compacted table.
+
+        The active segment is sealed first (appends move to a new segment), so
+        appends only wait for the rotation, not for the fold. Without pending
+        events nothing is written and the generation stays the same.
+
+        Returns:
+            int: Number of events folded
+        """
+        with file_lock(self._compact_lock_path):
+            with file_lock(self._lock_path):
+                sealed = self._segments()
+                if not any(self._segment_records(seq) for seq in sealed):
+                    return 0
+                # New active segment; everything before it is immutable from here on
+                with open(self._segment_path(sealed[-1] + 1), 'wb') as f:
+                    f.write(SEGMENT_MAGIC)
+
+            chunks = [self._read_segment(seq) for seq in sealed]
+            new_events = np.concatenate(chunks)
+            frame = pd.concat([
+                self._compacted(),
+                pd.DataFrame({name: new_events[name] for name in COMPACTED_COLUMNS})
+            ], ignore_index=True)
+            folded = _latest_per_key(frame)
+
+            # Write the new generation, then switch the checkpoint to it
+            checkpoint = self._checkpoint()
+            generation = checkpoint.get('generation', 0) + 1
+            path = os.path.join(self.directory, f"compacted-{generation}")
+            os.makedirs(path, exist_ok=True)
+            for name in COMPACTED_COLUMNS:
+                np.save(os.path.join(path, f"{name}.npy"), folded[name].values.astype(EVENT_DTYPE[name]))
+
+            tmp_path = self._checkpoint_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'generation': generation, 'through_segment': sealed[-1],
+                           'events': len(folded), 'compacted_at': time.time()}, f)
+            with file_lock(self._lock_path):
+                os.replace(tmp_path, self._checkpoint_path)
+                for seq in sealed:
+                    os.remove(self._segment_path(seq))
+
+            # Readers open the compacted table under the shared compact lock, so the old one is unused
+            old = checkpoint.get('generation')
+            if old is not None:
+                shutil.rmtree(os.path.join(self.directory, f"compacted-{old}"), ignore_errors=True)
+
+            print(f"Compacted {len(new_events)} events from {len(sealed)} segments")
+            return len(new_events)
+
+    def pending_count(self) -> int:
+        """Number of events not yet compacted."""
+        with file_lock(self._lock_path, shared=True):
+            return sum(self._segment_records(seq) for seq in self._segments())
+
+def _latest_per_key(frame: pd.DataFrame) -> pd.DataFrame:
+    """Latest event per (user, anime, type), by timestamp and then log order."""
+    if frame.empty:
+        return frame.reset_index(drop=True)
+    order = np.lexsort((
+        np.arange(len(frame)), frame['timestamp_ms'].values,
+        frame['event_type'].values, frame['anime_id'].values, frame['user_id'].values
+    ))
+    frame = frame.iloc[order]
+    keys = frame[['user_id', 'anime_id', 'event_type']].values
+    last = np.ones(len(frame), dtype=bool)
+    last[:-1] = (keys[1:] != keys[:-1]).any(axis=1)
+    return frame[last].reset_index(drop=True)
+
+def start_compactor(log: EventLog, interval: float = 60.0, min_events: int = 1000) -> threading.Thread:
+    """
+    Compact the log in a background thread whenever at least min_events are pending.
+
+    Args:
+        log (EventLog): Log to compact
+        interval (float): Seconds between checks
+        min_events (int): Pending events that trigger a compaction
+
+    Returns:
+        threading.Thread: The (daemon) compactor thread
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                if log.pending_count() >= min_events:
+                    log.compact()
+            except Exception as e:
+                print(f"Event log compaction failed: {e}")
+
+    thread = threading.Thread(target=run, name="event-log-compactor", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,32 @@
+import threading
+from typing import Dict
+
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# TF-IDF genre matrices per catalog DataFrame; the DataFrame is kept so an id is never reused
+_GENRE_MATRICES: Dict[int, tuple] = {}
+_GENRE_MATRICES_MAX = 4
+_GENRE_MATRICES_LOCK = threading.Lock()
+
+def get_genre_matrix(anime_df: pd.DataFrame) -> sparse.csr_matrix:
+    """
+    Fit the TF-IDF genre matrix of a catalog once and reuse it.
+
+    Rows are L2-normalized, so cosine similarities are plain dot products.
+    Shared by the content stage, batch scoring and candidate retrieval.
+    """
+    key = id(anime_df)
+    with _GENRE_MATRICES_LOCK:
+        entry = _GENRE_MATRICES.get(key)
+        if entry is not None and entry[0] is anime_df and entry[1].shape[0] == len(anime_df):
+            return entry[1]
+
+    tfidf = TfidfVectorizer(stop_words='english')
+    genre_matrix = tfidf.fit_transform(anime_df['genre'].fillna('')).tocsr()
+    with _GENRE_MATRICES_LOCK:
+        _GENRE_MATRICES[key] = (anime_df, genre_matrix)
+        while len(_GENRE_MATRICES) > _GENRE_MATRICES_MAX:
+            _GENRE_MATRICES.pop(next(iter(_GENRE_MATRICES)))
+    return genre_matrix
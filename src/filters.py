@@ -0,0 +1,228 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .rating_store import get_rating_store
+
+# Genres that satisfy each mood in the app's "Mood" selector (any of them)
+MOOD_GENRES = {
+    "Happy & Uplifting": ["Comedy", "Slice of Life", "Music"],
+    "Dark & Serious": ["Psychological", "Thriller", "Horror", "Dementia"],
+    "Action-Packed": ["Action", "Martial Arts", "Mecha", "Military"],
+    "Romantic": ["Romance", "Shoujo", "Josei"],
+    "Mysterious": ["Mystery", "Supernatural", "Police"],
+    "Comedy": ["Comedy", "Parody"],
+    "Emotional": ["Drama", "Romance", "Tragedy"]
+}
+
+# Episode ranges (inclusive) for the app's "Length Preference" selector
+LENGTH_EPISODES = {
+    "Short (1-12 episodes)": (1, 12),
+    "Medium (13-26 episodes)": (13, 26),
+    "Long (27+ episodes)": (27, np.inf)
+}
+
+def _split_genres(genre_string) -> List[str]:
+    if not isinstance(genre_string, str):
+        return []
+    return [genre.strip() for genre in genre_string.split(',') if genre.strip()]
+
+class CatalogFilterIndex:
+    """
+    Precomputed indexes for filtering the anime catalog.
+
+    Numeric columns keep a sorted copy and its argsort, so a range filter is
+    two binary searches plus a scatter into the mask. Genres are stored as a
+    bitset per title, so "must have all" / "any of" genre filters are bitwise
+    operations over one small integer array.
+    """
+
+    # Numeric columns with a sorted index, and whether a missing value passes a range filter
+    RANGE_COLUMNS = {'rating': False, 'episodes': True, 'members': False, 'year': True}
+
+    def __init__(self, anime_df: pd.DataFrame):
+        """
+        Args:
+            anime_df (pd.DataFrame): DataFrame with anime information
+        """
+        self.anime_ids = anime_df['anime_id'].values
+        self.n_items = len(anime_df)
+
+        self._sorted = {}
+        for column, keep_missing in self.RANGE_COLUMNS.items():
+            if column not in anime_df.columns:
+                continue
+            values = pd.to_numeric(anime_df[column], errors='coerce').values.astype(float)
+            order = np.argsort(values, kind='stable')  # NaN sorts last
+            self._sorted[column] = (order, values[order], np.isnan(values), keep_missing)
+
+        # Genre bitsets: one bit per genre, in as many 64-bit words as needed
+        genre_lists = [_split_genres(g) for g in anime_df['genre'].values]
+        self.genres = sorted({genre for genres in genre_lists for genre in genres})
+        self._genre_bit = {genre: i for i, genre in enumerate(self.genres)}
+        n_words = max(1, (len(self.genres) + 63) // 64)
+        self._genre_bits = np.zeros((self.n_items, n_words), dtype=np.uint64)
+        for row, genres in enumerate(genre_lists):
+            for genre in genres:
+                bit = self._genre_bit[genre]
+                self._genre_bits[row, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+
+        types = anime_df['type'].astype(object).fillna('Unknown').values if 'type' in anime_df.columns else None
+        self._types = types
+
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _genre_word(self, genres: Iterable[str]) -> Optional[np.ndarray]:
+        """Bitset for a set of genres, or None if one of them is unknown."""
+        word = np.zeros(self._genre_bits.shape[1], dtype=np.uint64)
+        for genre in genres:
+            bit = self._genre_bit.get(genre)
+            if bit is None:
+                return None
+            word[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return word
+
+    def range_mask(self, column: str, low: float, high: float) -> np.ndarray:
+        """Titles with low <= column <= high (missing values pass if the column allows it)."""
+        mask = np.zeros(self.n_items, dtype=bool)
+        if column not in self._sorted:
+            # Column not in this catalog: the filter can't be applied
+            mask[:] = True
+            return mask
+        order, sorted_values, missing, keep_missing = self._sorted[column]
+        start = np.searchsorted(sorted_values, low, side='left')
+        end = np.searchsorted(sorted_values, high, side='right')
+        mask[order[start:end]] = True
+        if keep_missing:
+            mask |= missing
+        return mask
+
+    def genre_mask(self, all_of: Iterable[str] = (), any_of: Iterable[str] = ()) -> np.ndarray:
+        """Titles having every genre in all_of and at least one genre in any_of."""
+        mask = np.ones(self.n_items, dtype=bool)
+        all_of, any_of = list(all_of), list(any_of)
+        if all_of:
+            required = self._genre_word(all_of)
+            if required is None:
+                return np.zeros(self.n_items, dtype=bool)
+            mask &= ((self._genre_bits & required) == required).all(axis=1)
+        if any_of:
+            known = [genre for genre in any_of if genre in self._genre_bit]
+            wanted = self._genre_word(known)
+            mask &= ((self._genre_bits & wanted) != 0).any(axis=1)
+        return mask
+
+    def type_mask(self, anime_type: str) -> np.ndarray:
+        """Titles of one type (e.g. 'Movie')."""
+        if self._types is None:
+            return np.ones(self.n_items, dtype=bool)
+        return self._types == anime_type
+
+    def compile(self, filters: Dict[str, Any], excluded_ids: Optional[Iterable[int]] = None) -> np.ndarray:
+        """
+        Turn the app's active filters into a boolean mask over the catalog.
+
+        Recognized keys: year_range, episode_range, rating_range, genres (all
+        required), mood, length_pref and exclude_watched (uses excluded_ids).
+        Masks without excluded_ids are cached per filter combination.
+
+        Args:
+            filters (dict): Active filters, as stored in st.session_state.active_filters
+            excluded_ids (iterable): Anime IDs to exclude when exclude_watched is set
+
+        Returns:
+            np.ndarray: Boolean mask aligned with the catalog rows
+        """
+        cache_key = filters_key(filters)
+        with self._lock:
+            mask = self._cache.get(cache_key)
+
+        if mask is None:
+            mask = np.ones(self.n_items, dtype=bool)
+            if filters.get('year_range'):
+                mask &= self.range_mask('year', *filters['year_range'])
+            if filters.get('episode_range'):
+                mask &= self.range_mask('episodes', *filters['episode_range'])
+            if filters.get('rating_range'):
+                mask &= self.range_mask('rating', *filters['rating_range'])
+            if filters.get('genres'):
+                mask &= self.genre_mask(all_of=filters['genres'])
+
+            mood = filters.get('mood')
+            if mood and mood in MOOD_GENRES:
+                mask &= self.genre_mask(any_of=MOOD_GENRES[mood])
+
+            length_pref = filters.get('length_pref')
+            if length_pref == "Movies only":
+                mask &= self.type_mask("Movie")
+            elif length_pref in LENGTH_EPISODES:
+                mask &= self.range_mask('episodes', *LENGTH_EPISODES[length_pref])
+                if 'episodes' in self._sorted:
+                    # An unknown episode count doesn't satisfy an explicit length
+                    mask &= ~self._sorted['episodes'][2]
+
+            with self._lock:
+                self._cache[cache_key] = mask
+
+        if filters.get('exclude_watched') and excluded_ids is not None:
+            mask = mask & ~np.isin(self.anime_ids, np.fromiter(excluded_ids, dtype=np.int64))
+        return mask
+
+def filters_key(filters: Optional[Dict[str, Any]]) -> Tuple:
+    """Hashable, order-independent form of a filters dict (for cache keys)."""
+    if not filters:
+        return ()
+    frozen = []
+    for name, value in sorted(filters.items()):
+        if isinstance(value, (list, tuple, set)):
+            value = tuple(sorted(value)) if isinstance(value, set) else tuple(value)
+        frozen.append((name, value))
+    return tuple(frozen)
+
+# Indexes built per catalog DataFrame; the DataFrame is kept so an id is never reused
+_INDEXES = {}
+_INDEXES_MAX = 4
+_INDEXES_LOCK = threading.Lock()
+
+def get_filter_index(anime_df: pd.DataFrame) -> CatalogFilterIndex:
+    """Build the filter index for a catalog once and reuse it."""
+    key = id(anime_df)
+    with _INDEXES_LOCK:
+        entry = _INDEXES.get(key)
+        if entry is not None and entry[0] is anime_df and entry[1].n_items == len(anime_df):
+            return entry[1]
+
+    index = CatalogFilterIndex(anime_df)
+    with _INDEXES_LOCK:
+        _INDEXES[key] = (anime_df, index)
+        while len(_INDEXES) > _INDEXES_MAX:
+            _INDEXES.pop(next(iter(_INDEXES)))
+    return index
+
+def catalog_mask(
+    anime_df: pd.DataFrame,
+    filters: Dict[str, Any],
+    user_id: Optional[int] = None,
+    ratings_df: Optional[pd.DataFrame] = None,
+    dataset_version: Optional[str] = None
+) -> np.ndarray:
+    """
+    Boolean mask of the catalog rows passing the filters.
+
+    Args:
+        anime_df (pd.DataFrame): DataFrame with anime information
+        filters (dict): Active filters (see CatalogFilterIndex.compile)
+        user_id (int): User whose rated anime exclude_watched removes
+        ratings_df (pd.DataFrame): Ratings used for exclude_watched
+        dataset_version (str): Version of ratings_df, shares its on-disk rating store
+
+    Returns:
+        np.ndarray: Boolean mask aligned with anime_df rows
+    """
+    watched_ids = None
+    if filters.get('exclude_watched') and user_id is not None and ratings_df is not None:
+        watched_ids = get_rating_store(ratings_df, dataset_version).items_of(user_id)
+    return get_filter_index(anime_df).compile(filters, watched_ids)
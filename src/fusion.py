@@ -0,0 +1,218 @@
+import heapq
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# A component's scores in descending order: (item, score) pairs
+ScoreIterator = Iterator[Tuple[Hashable, float]]
+
+def threshold_topk(
+    sorted_scores: Dict[str, Iterable[Tuple[Hashable, float]]],
+    lookups: Dict[str, Callable[[Hashable], Optional[float]]],
+    weights: Dict[str, float],
+    top_n: int,
+    missing_score: Union[float, Dict[str, float]] = 0.0
+) -> Tuple[List[Tuple[Hashable, float]], int]:
+    """
+    Top-N items by weighted score sum using Fagin's threshold algorithm.
+
+    The component lists are read in parallel, one position at a time. Each newly
+    seen item is completed by random access into the other components, and the
+    weighted sum of the scores last read from each list bounds what any unseen
+    item can reach. Reading stops as soon as the current N-th best is at least
+    that bound, so usually only a prefix of each list is examined.
+
+    Scores must be non-negative for the threshold to be valid (e.g. min-max
+    normalized). Weights must be non-negative.
+
+    Args:
+        sorted_scores (dict): Component -> (item, score) pairs in descending score order
+        lookups (dict): Component -> function returning an item's score, or None if absent
+        weights (dict): Component -> weight
+        top_n (int): Number of items to return
+        missing_score (float or dict): Score of an item a component has no score
+            for (a dict gives one per component)
+
+    Returns:
+        tuple: ([(item, fused score)] best first, number of distinct items examined)
+    """
+    components = [name for name, weight in weights.items() if weight > 0 and name in sorted_scores]
+    if not isinstance(missing_score, dict):
+        missing_score = {name: missing_score for name in components}
+    iterators = {name: iter(sorted_scores[name]) for name in components}
+    last_seen = {name: None for name in components}
+
+    top = []  # min-heap of (fused score, tiebreak, item)
+    seen = set()
+    counter = 0
+
+    while iterators:
+        for name in list(iterators):
+            try:
+                item, score = next(iterators[name])
+            except StopIteration:
+                # Nothing unseen remains in this list
+                del iterators[name]
+                last_seen[name] = missing_score[name]
+                continue
+            last_seen[name] = score
+
+            if item in seen:
+                continue
+            seen.add(item)
+
+            fused = 0.0
+            for other in components:
+                if other == name:
+                    value = score
+                else:
+                    value = lookups[other](item)
+                    if value is None:
+                        value = missing_score[other]
+                fused += weights[other] * value
+
+            counter += 1
+            entry = (fused, -counter, item)
+            if len(top) < top_n:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+        # Best fused score any unseen item could still reach: further down each
+        # list, or absent from it
+        if any(value is None for value in last_seen.values()):
+            continue
+        threshold = sum(weights[name] * max(last_seen[name], missing_score[name]) for name in components)
+        if len(top) >= top_n and top[0][0] >= threshold:
+            break
+
+    ranked = sorted(top, reverse=True)
+    return [(item, fused) for fused, _, item in ranked], len(seen)
+
+def _union_ranges(component_recs: Dict[str, pd.DataFrame]) -> Dict[str, Tuple[float, float]]:
+    """
+    (low, high) of each component's scores over the union of all components'
+    items, a missing score counting as 0, as fuse_sort normalizes them.
+    """
+    union = set()
+    for recs in component_recs.values():
+        if not recs.empty:
+            union.update(recs['anime_id'].values)
+    ranges = {}
+    for col, recs in component_recs.items():
+        if recs.empty:
+            ranges[col] = (0.0, 0.0)
+            continue
+        scores = recs[col].astype(float).values
+        low, high = scores.min(), scores.max()
+        if recs['anime_id'].nunique() < len(union):
+            low, high = min(low, 0.0), max(high, 0.0)
+        ranges[col] = (low, high)
+    return ranges
+
+def _normalizer(low: float, high: float) -> Callable[[np.ndarray], np.ndarray]:
+    # Like fuse_sort, a constant column is left as it is
+    if high > low:
+        return lambda values: (values - low) / (high - low)
+    return lambda values: values
+
+def sorted_scores_from_frame(
+    recs: pd.DataFrame,
+    score_col: str,
+    score_range: Optional[Tuple[float, float]] = None
+) -> Tuple[ScoreIterator, Callable]:
+    """
+    Sorted iterator and lookup for one component's recommendation frame.
+
+    Scores are min-max normalized over score_range (default: the frame's own
+    minimum and maximum); fuse_threshold passes the range over the union of
+    all components so the scores match fuse_sort's.
+    """
+    if recs.empty:
+        return iter(()), lambda item: None
+
+    scores = recs[score_col].astype(float).values
+    low, high = score_range if score_range is not None else (scores.min(), scores.max())
+    scores = _normalizer(low, high)(scores)
+    order = np.argsort(-scores, kind='stable')
+    anime_ids = recs['anime_id'].values
+
+    lookup_table = dict(zip(anime_ids, scores))
+    iterator = ((anime_ids[i], float(scores[i])) for i in order)
+    return iterator, lookup_table.get
+
+def fuse_sort(
+    component_recs: Dict[str, pd.DataFrame],
+    weights: Dict[str, float],
+    top_n: int
+) -> pd.DataFrame:
+    """
+    Fuse component recommendation frames by scoring their whole union.
+
+    Every item of any component gets each component's score (0 where a
+    component has none); each score column is min-max normalized over that
+    union, and the top_n items by weighted sum are returned.
+
+    Args:
+        component_recs (dict): Score column -> frame with anime_id and that column
+        weights (dict): Score column -> weight
+        top_n (int): Number of recommendations
+
+    Returns:
+        pd.DataFrame: anime_id, the normalized score columns and final_score, best first
+    """
+    all_anime_ids = set()
+    for recs in component_recs.values():
+        if not recs.empty:
+            all_anime_ids.update(recs['anime_id'])
+    hybrid_recs = pd.DataFrame({'anime_id': list(all_anime_ids)})
+
+    for col, recs in component_recs.items():
+        if recs.empty:
+            recs = pd.DataFrame(columns=['anime_id', col])
+        hybrid_recs = hybrid_recs.merge(recs[['anime_id', col]], on='anime_id', how='left')
+        hybrid_recs[col] = hybrid_recs[col].astype(float).fillna(0)
+        hybrid_recs[col] = _normalizer(hybrid_recs[col].min(), hybrid_recs[col].max())(hybrid_recs[col])
+
+    hybrid_recs['final_score'] = sum(weights[col] * hybrid_recs[col] for col in component_recs)
+    return hybrid_recs.sort_values('final_score', ascending=False).head(top_n)
+
+def fuse_threshold(
+    component_recs: Dict[str, pd.DataFrame],
+    weights: Dict[str, float],
+    top_n: int
+) -> Tuple[pd.DataFrame, int]:
+    """
+    Fuse component recommendation frames with threshold_topk.
+
+    Scores are normalized exactly as in fuse_sort, so both rank the same
+    items. The frames are already fully computed, so what the threshold
+    saves is the fused scoring of the whole union: only the prefix of each
+    sorted list needed to settle the top_n is examined.
+
+    Args:
+        component_recs (dict): Score column (e.g. 'predicted_rating') -> frame
+            with anime_id and that column
+        weights (dict): Score column -> weight
+        top_n (int): Number of recommendations
+
+    Returns:
+        tuple: (frame with anime_id, the normalized score columns and
+            final_score, best first; number of items examined)
+    """
+    ranges = _union_ranges(component_recs)
+    iterators, lookups, missing = {}, {}, {}
+    for col, recs in component_recs.items():
+        iterators[col], lookups[col] = sorted_scores_from_frame(recs, col, ranges[col])
+        # What fuse_sort gives an item the component has no score for
+        missing[col] = float(_normalizer(*ranges[col])(np.float64(0.0)))
+
+    ranked, examined = threshold_topk(iterators, lookups, weights, top_n, missing)
+
+    fused = pd.DataFrame({'anime_id': [item for item, _ in ranked]})
+    for col in component_recs:
+        values = [lookups[col](item) for item, _ in ranked]
+        fused[col] = [missing[col] if value is None else value for value in values]
+    fused['final_score'] = [score for _, score in ranked]
+    return fused, examined
@@ -1,14 +1,28 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any
-from .svd import train_svd_model, get_svd_recommendations
-from .neural_net import train_neural_model, get_neural_recommendations
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from .svd import train_svd_model, get_svd_recommendations, svd_score_matrix, fold_in_users
+from .neural_net import train_neural_model, get_neural_recommendations, neural_score_matrix
+from .latency import STAGE_TIMINGS, DEFAULT_CANDIDATES, plan_request
+from .model_cache import ModelCache
+from .rating_store import get_rating_store
+from .dataset import DatasetHandle
+from .candidates import generate_candidates
+from .features import get_genre_matrix
+from .fusion import fuse_sort, fuse_threshold
+from .filters import catalog_mask
+from .result_cache import RecommendationCache
 from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
 from utils.helpers import enrich_with_images
+from utils.single_flight import SingleFlight
+from utils.title_index import get_title_index
 import time
 import os
-import pickle
+import hashlib
+from functools import partial
 import cProfile
 import pstats
 import io
@@ -17,21 +31,58 @@ import io
 os.makedirs("cache", exist_ok=True)
 os.makedirs("profiles", exist_ok=True)  # Create directory for profile results
 
-# Cache for trained models
-MODEL_CACHE = {}
+# Concurrent training / scoring of the same work is done once and shared
+TRAINING_FLIGHTS = SingleFlight()
+SCORING_FLIGHTS = SingleFlight()
+
+# Bump when training or scoring changes, so cached results are not reused
+MODEL_VERSION = "2"
+
+# Limits for the trained model cache
+MODEL_CACHE_MEMORY_MB = 512
+MODEL_CACHE_DISK_MB = 2048
+
+# Cache for trained models (memory budget + disk quota, see src/model_cache.py)
+MODEL_CACHE = ModelCache(
+    "cache",
+    memory_budget_bytes=MODEL_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_quota_bytes=MODEL_CACHE_DISK_MB * 1024 * 1024,
+    policies={'svd': 'lru', 'neural': 'lfu'}
+)
+
+# Per-stage deadlines (seconds) used by the concurrent execution mode
+DEFAULT_STAGE_DEADLINE = 5.0
+DEFAULT_STAGE_DEADLINES = {
+    'content': 2.0,
+    'svd': DEFAULT_STAGE_DEADLINE,
+    'neural': DEFAULT_STAGE_DEADLINE
+}
+
+# Long-lived pool for the concurrent execution mode, shared by all requests so
+# no request pays for starting workers (3 stages for up to 4 requests at once)
+STAGE_WORKERS = 12
+STAGE_POOL = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="hybrid-stage")
+
+# Ratings the batch models are trained on, however many users a batch has
+BATCH_SAMPLE_SIZE = 100_000
+
+# Most recent result per request (user, selection, weights, dataset and model
+# version, settings), served when a latency budget leaves no room for the models
+RECENT_RESULTS_MAX = 256
+RECENT_RESULTS = RecommendationCache(max_entries=RECENT_RESULTS_MAX)
 
 def get_content_based_recommendations(
     anime_df: pd.DataFrame,
     selected_anime: List[str],
-    top_n: int = 10
+    top_n: int = 10,
+    candidate_ids: Optional[np.ndarray] = None
 ) -> pd.DataFrame:
-    """Get content-based recommendations based on selected anime."""
-    # Create TF-IDF matrix for genres
-    tfidf = TfidfVectorizer(stop_words='english')
-    genre_matrix = tfidf.fit_transform(anime_df['genre'].fillna(''))
+    """Get content-based recommendations based on selected anime (optionally only among candidate_ids)."""
+    # TF-IDF matrix for genres (fitted once per catalog)
+    genre_matrix = get_genre_matrix(anime_df)
     
-    # Get indices of selected anime
-    selected_indices = anime_df[anime_df['name'].isin(selected_anime)].index
+    # Get positions of selected anime
+    selected_indices = get_title_index(anime_df).positions(selected_anime)
     
     if len(selected_indices) == 0:
         return pd.DataFrame()  # Return empty DataFrame if no matches
@@ -44,110 +95,402 @@ def get_content_based_recommendations(
     recommendations['content_score'] = selected_similarity
     
     # Remove selected anime from recommendations
-    recommendations = recommendations[~recommendations['name'].isin(selected_anime)]
+    selected_mask = np.zeros(len(recommendations), dtype=bool)
+    selected_mask[selected_indices] = True
+    recommendations = recommendations[~selected_mask]
+    
+    # Keep only the retrieved candidates, if a retrieval stage ran
+    if candidate_ids is not None:
+        recommendations = recommendations[recommendations['anime_id'].isin(candidate_ids)]
     
     return recommendations.sort_values('content_score', ascending=False).head(top_n)
 
-def get_model_cache_key(user_id, model_type):
-    """Generate a cache key for models"""
-    return f"{model_type}_{user_id}"
+def get_model_cache_key(user_id, model_type, data_version=None):
+    """Generate a cache key for models, distinct per version of the ratings they are trained on"""
+    if data_version is None:
+        return f"{model_type}_{user_id}"
+    return f"{model_type}_{user_id}_{hashlib.md5(str(data_version).encode()).hexdigest()[:12]}"
+
+def load_cached_model(user_id, model_type, data_version=None):
+    """Load model from cache if available (memory first, then disk)"""
+    return MODEL_CACHE.get(get_model_cache_key(user_id, model_type, data_version), model_type)
+
+def save_model_to_cache(user_id, model_type, model_data, data_version=None):
+    """Save model to the memory and disk cache, evicting old models past the limits"""
+    MODEL_CACHE.put(get_model_cache_key(user_id, model_type, data_version), model_type, model_data)
+
+def is_model_cached(user_id, model_type, data_version=None):
+    """Check whether a trained model exists in memory or on disk, without loading it."""
+    cache_key = get_model_cache_key(user_id, model_type, data_version)
+    return cache_key in MODEL_CACHE or os.path.exists(MODEL_CACHE.path_for(cache_key))
+
+def load_or_train_model(user_id, model_type, train, data_version=None):
+    """
+    Load a cached model, or train it once for all concurrent callers.
+    
+    Models are cached per (model type, user, data version), so a model trained
+    on older ratings is never served for newer ones. Callers in this process
+    that miss the cache together wait on a single training run. Across processes a
+    file lock next to the model pickle serializes training, and the cache is
+    re-checked under it so a model trained elsewhere is loaded instead.
+    
+    Args:
+        user_id: User (or batch) the model is cached under
+        model_type (str): 'svd' or 'neural'
+        train (callable): Trains and returns the model, without arguments
+        data_version (str): Version of the ratings the model is trained on
+    """
+    cached = load_cached_model(user_id, model_type, data_version)
+    if cached:
+        return cached
+    
+    def train_once():
+        # Another caller may have finished training while we waited
+        cached = load_cached_model(user_id, model_type, data_version)
+        if cached:
+            return cached
+        model = train()
+        save_model_to_cache(user_id, model_type, model, data_version)
+        return model
+    
+    lock_path = MODEL_CACHE.path_for(get_model_cache_key(user_id, model_type, data_version)) + ".train"
+    return TRAINING_FLIGHTS.do((model_type, user_id, data_version), train_once, lock_path=lock_path)
+
+def _coalesced(flight_key, fn, *args):
+    """Run a stage, sharing the result with identical stages already in flight."""
+    def run():
+        stage_start = time.time()
+        result = fn(*args)
+        result.attrs['stage_seconds'] = time.time() - stage_start
+        return result
+    return SCORING_FLIGHTS.do(flight_key, run)
+
+def _train_timed(stage, train_fn, ratings_df):
+    """Train a model and record the training time for the latency planner."""
+    train_start = time.time()
+    model = train_fn(ratings_df)
+    STAGE_TIMINGS.record(stage, time.time() - train_start)
+    return model
+
+def _renormalize_weights(weights: Dict[str, float]) -> Dict[str, float]:
+    """Rescale the weights of the remaining components so they sum to 1."""
+    total = sum(weights.values())
+    if total <= 0:
+        # Nothing left with a positive weight, split evenly
+        return {name: 1.0 / len(weights) for name in weights} if weights else {}
+    return {name: weight / total for name, weight in weights.items()}
+
+def _run_content_stage(
+    anime_df: pd.DataFrame,
+    selected_anime: List[str],
+    top_n: int,
+    candidate_ids: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """Content stage: genre similarity to the selected anime."""
+    stage_start = time.time()
+    recs = get_content_based_recommendations(anime_df, selected_anime, top_n, candidate_ids)
+    STAGE_TIMINGS.record('content', time.time() - stage_start)
+    return recs
+
+def _run_svd_stage(
+    user_id: int,
+    sampled_ratings: pd.DataFrame,
+    anime_df: pd.DataFrame,
+    top_n: int,
+    data_version: Optional[str] = None,
+    candidate_ids: Optional[np.ndarray] = None,
+    max_candidates: int = DEFAULT_CANDIDATES['svd']
+) -> pd.DataFrame:
+    """SVD stage: load or train the user's SVD model and score the catalog (or candidate_ids)."""
+    svd_model = load_or_train_model(
+        user_id, 'svd', partial(_train_timed, 'svd_train', train_svd_model, sampled_ratings), data_version
+    )
+    
+    score_start = time.time()
+    recs = get_svd_recommendations(svd_model, user_id, anime_df, top_n, max_candidates, candidate_ids)
+    n_scored = len(candidate_ids) if candidate_ids is not None else len(anime_df)
+    STAGE_TIMINGS.record('svd_score', time.time() - score_start, min(max_candidates, n_scored))
+    return recs
+
+def _run_neural_stage(
+    user_id: int,
+    sampled_ratings: pd.DataFrame,
+    anime_df: pd.DataFrame,
+    top_n: int,
+    data_version: Optional[str] = None,
+    candidate_ids: Optional[np.ndarray] = None,
+    max_candidates: int = DEFAULT_CANDIDATES['neural']
+) -> pd.DataFrame:
+    """Neural stage: load or train the user's neural model and score candidates."""
+    neural_model, user_encoder, anime_encoder = load_or_train_model(
+        user_id, 'neural', partial(_train_timed, 'neural_train', train_neural_model, sampled_ratings),
+        data_version
+    )
+    
+    score_start = time.time()
+    recs = get_neural_recommendations(
+        neural_model, user_id, anime_df, user_encoder, anime_encoder, sampled_ratings,
+        top_n, max_candidates, candidate_ids
+    )
+    n_scored = len(candidate_ids) if candidate_ids is not None else len(anime_df)
+    STAGE_TIMINGS.record('neural_score', time.time() - score_start, min(max_candidates, n_scored))
+    return recs
 
-def load_cached_model(user_id, model_type):
-    """Load model from cache if available"""
-    cache_key = get_model_cache_key(user_id, model_type)
+def _run_stages_concurrently(
+    stage_calls: Dict[str, Tuple[Callable, tuple]],
+    stage_deadlines: Dict[str, float]
+) -> Tuple[Dict[str, pd.DataFrame], List[str]]:
+    """
+    Run independent recommendation stages on the shared stage pool.
     
-    # Check memory cache first
-    if cache_key in MODEL_CACHE:
-        return MODEL_CACHE[cache_key]
+    Stages run as threads of this process, so models they train, MODEL_CACHE
+    entries and STAGE_TIMINGS updates are visible to later requests.
     
-    # Check disk cache
-    cache_file = f"cache/{cache_key}.pkl"
-    if os.path.exists(cache_file):
+    Args:
+        stage_calls (dict): Stage name -> (function, args)
+        stage_deadlines (dict): Stage name -> seconds allowed from submission
+        
+    Returns:
+        tuple: (results, dropped) - DataFrames of the stages that finished in
+            time, and the names of the stages that missed their deadline or failed
+    """
+    submitted_at = time.time()
+    futures = {name: STAGE_POOL.submit(fn, *args) for name, (fn, args) in stage_calls.items()}
+    
+    results = {}
+    dropped = []
+    # Wait on the stages with the earliest deadlines first
+    for name in sorted(futures, key=lambda n: stage_deadlines.get(n, DEFAULT_STAGE_DEADLINE)):
+        deadline = submitted_at + stage_deadlines.get(name, DEFAULT_STAGE_DEADLINE)
         try:
-            with open(cache_file, 'rb') as f:
-                model_data = pickle.load(f)
-                MODEL_CACHE[cache_key] = model_data
-                return model_data
-        except:
-            # If loading fails, just return None
-            return None
-    
-    return None
-
-def save_model_to_cache(user_id, model_type, model_data):
-    """Save model to cache"""
-    cache_key = get_model_cache_key(user_id, model_type)
-    
-    # Save to memory cache
-    MODEL_CACHE[cache_key] = model_data
-    
-    # Save to disk cache
-    cache_file = f"cache/{cache_key}.pkl"
-    try:
-        with open(cache_file, 'wb') as f:
-            pickle.dump(model_data, f)
-    except:
-        # If saving fails, just continue
-        pass
+            results[name] = futures[name].result(timeout=max(0.0, deadline - time.time()))
+        except FuturesTimeoutError:
+            print(f"Stage '{name}' missed its deadline, dropping it")
+            # Not started yet: never run it; running: its result is simply discarded
+            futures[name].cancel()
+            dropped.append(name)
+        except Exception as e:
+            print(f"Stage '{name}' failed: {e}")
+            dropped.append(name)
+    
+    return results, dropped
 
 def hybrid_recommend(
     user_id: int,
     selected_anime: List[str],
-    ratings_df: pd.DataFrame,
-    anime_df: pd.DataFrame,
+    ratings_df: Optional[pd.DataFrame] = None,
+    anime_df: Optional[pd.DataFrame] = None,
     top_n: int = 10,
     alpha: float = 0.4,  # Adjusted weight distribution
     beta: float = 0.3,   # Weight for neural network
-    gamma: float = 0.3   # Weight for content-based
+    gamma: float = 0.3,  # Weight for content-based
+    concurrent: bool = False,
+    stage_deadlines: Optional[Dict[str, float]] = None,
+    latency_budget_ms: Optional[float] = None,
+    dataset_version: Optional[str] = None,
+    candidate_stage: bool = False,
+    n_candidates: int = 300,
+    n_ranked: Optional[int] = None,
+    candidate_source_counts: Optional[Dict[str, int]] = None,
+    fusion: str = "sort",
+    filters: Optional[Dict[str, Any]] = None,
+    dataset: Optional[DatasetHandle] = None
 ) -> pd.DataFrame:
-    """Get hybrid recommendations combining SVD, neural network, and content-based approaches."""
+    """
+    Get hybrid recommendations combining SVD, neural network, and content-based approaches.
+    
+    With concurrent=True the content, SVD and neural stages run in parallel on
+    the shared thread pool STAGE_POOL. A stage that misses its deadline in
+    stage_deadlines (seconds, defaults in DEFAULT_STAGE_DEADLINES) is dropped and
+    the remaining weights are renormalized. Dropped stages are listed in result.attrs['dropped_stages'].
+    
+    With latency_budget_ms set, a planner (see src/latency.py) uses running stage
+    timings to choose which stages to run, how many candidates to score, or to
+    serve the most recent result for the request instead. The degradations it
+    applied are listed in result.attrs['degradations'].
+    
+    Concurrent requests that need the same model training or the same stage
+    computation share one run. dataset_version (e.g. from
+    src.result_cache.dataset_fingerprint) keeps work on different data apart;
+    without it the number of ratings is used.
+    
+    With candidate_stage=True a cheap retrieval stage (src/candidates.py) first
+    collects up to n_candidates titles from content neighbors of the selection,
+    SVD item neighbors and popular titles; the model stages then rank only
+    those (at most n_ranked each). Per-stage seconds are reported in
+    result.attrs['stage_timings'].
+    
+    fusion="threshold" fuses the component lists with Fagin's threshold
+    algorithm (src/fusion.py), reading each sorted list only until the top N is
+    provably final. Scores are normalized as with fusion="sort", so both give
+    the same ranking; the threshold only saves fusing the whole union, since
+    the component lists are computed in full either way. The number of items
+    examined is reported in result.attrs['items_examined'].
+    
+    filters (the app's active filters, see src/filters.py) are compiled into a
+    catalog mask before any model runs: the SVD and neural stages only score
+    titles that pass, and content and retrieved candidates are restricted to them.
+    
+    dataset (a src.dataset.DatasetHandle) replaces ratings_df, anime_df and
+    dataset_version: its catalog, ratings and version fingerprint are used.
+    """
     # Limit ratings to improve performance
     start_time = time.time()
     
+    if dataset is not None:
+        ratings_df, anime_df, dataset_version = dataset.ratings, dataset.catalog, dataset.version
+    
+    # Only a caller-supplied dataset version is trusted to name on-disk data
+    store_version = dataset_version
+    
     # Sample ratings data (at most 100,000 ratings) if the dataset is large
     sample_size = min(500, len(ratings_df))
     if len(ratings_df) > sample_size:
-        # Ensure user's ratings are included in the sample
-        user_ratings = ratings_df[ratings_df['user_id'] == user_id]
-        other_ratings = ratings_df[ratings_df['user_id'] != user_id].sample(
-            sample_size - len(user_ratings), 
-            random_state=42
+        # Ensure user's ratings are included in the sample (CSR rating store, no full scans)
+        sampled_ratings = get_rating_store(ratings_df, store_version).sample_with_user(
+            user_id, sample_size, random_state=42
         )
-        sampled_ratings = pd.concat([user_ratings, other_ratings])
     else:
         sampled_ratings = ratings_df
     
-    # Get content-based recommendations (fast, do this first)
-    content_recs = get_content_based_recommendations(anime_df, selected_anime, top_n * 2)
-    
-    # Get SVD recommendations
-    svd_cached = load_cached_model(user_id, 'svd')
-    if svd_cached:
-        svd_model = svd_cached
-    else:
-        svd_model = train_svd_model(sampled_ratings)
-        save_model_to_cache(user_id, 'svd', svd_model)
-    
-    svd_recs = get_svd_recommendations(svd_model, user_id, anime_df, top_n * 2)
-    
+    if dataset_version is None:
+        dataset_version = f"rows{len(ratings_df)}"
+    
+    # Retrieval stage: a few hundred cheap candidates for the models to rank
+    candidate_ids = None
+    candidates_key = None
+    stage_timings = {}
+    if candidate_stage:
+        retrieval_start = time.time()
+        svd_model = load_or_train_model(
+            user_id, 'svd', partial(_train_timed, 'svd_train', train_svd_model, sampled_ratings),
+            dataset_version
+        )
+        candidate_ids, source_timings = generate_candidates(
+            anime_df, selected_anime, svd_model, n_candidates, candidate_source_counts
+        )
+        candidates_key = hashlib.md5(np.ascontiguousarray(candidate_ids).tobytes()).hexdigest()
+        stage_timings['retrieval'] = time.time() - retrieval_start
+        stage_timings.update({f'retrieval_{source}': seconds for source, seconds in source_timings.items()})
+    
+    # Apply the filters to the catalog before anything is scored
+    scoring_df = anime_df
+    content_ids = candidate_ids
+    filters_digest = None
+    if filters:
+        filter_start = time.time()
+        mask = catalog_mask(anime_df, filters, user_id, ratings_df, store_version)
+        filters_digest = hashlib.md5(np.packbits(mask).tobytes()).hexdigest()
+        allowed_ids = anime_df['anime_id'].values[mask]
+        # Model stages score the filtered catalog; content needs the selection
+        # itself for similarity, so it keeps the catalog and filters its output
+        scoring_df = anime_df[mask].reset_index(drop=True)
+        if candidate_ids is not None:
+            candidate_ids = candidate_ids[np.isin(candidate_ids, allowed_ids)]
+            content_ids = candidate_ids
+        else:
+            content_ids = allowed_ids
+        stage_timings['filters'] = time.time() - filter_start
+    
+    # Stages are independent of each other
+    stage_calls = {
+        'content': (_run_content_stage, (anime_df, selected_anime, top_n * 2, content_ids)),
+        'svd': (_run_svd_stage,
+                (user_id, sampled_ratings, scoring_df, top_n * 2, dataset_version, candidate_ids)),
+    }
     # Get neural network recommendations only if needed (based on beta weight)
     if beta > 0.1:  # Only use neural if weight is significant
-        neural_cached = load_cached_model(user_id, 'neural')
-        if neural_cached:
-            neural_model, user_encoder, anime_encoder = neural_cached
-        else:
-            neural_model, user_encoder, anime_encoder = train_neural_model(sampled_ratings)
-            save_model_to_cache(user_id, 'neural', (neural_model, user_encoder, anime_encoder))
-        
-        neural_recs = get_neural_recommendations(
-            neural_model, user_id, anime_df, user_encoder, anime_encoder, sampled_ratings, top_n * 2
+        stage_calls['neural'] = (
+            _run_neural_stage,
+            (user_id, sampled_ratings, scoring_df, top_n * 2, dataset_version, candidate_ids)
         )
+    
+    # Ranking stage size when candidates were retrieved
+    ranked = {}
+    if candidate_stage:
+        ranked = {name: n_ranked or n_candidates for name in ('svd', 'neural')}
+    
+    # Fit the request into its latency budget
+    result_key = RecommendationCache.make_key(
+        user_id, selected_anime, (alpha, beta, gamma), dataset_version, MODEL_VERSION,
+        filters=filters_digest
+    ) + (top_n, fusion, candidate_stage, n_candidates, n_ranked,
+         tuple(sorted((candidate_source_counts or {}).items())))
+    degradations = []
+    deadlines = {**DEFAULT_STAGE_DEADLINES, **(stage_deadlines or {})}
+    if latency_budget_ms is not None:
+        remaining = latency_budget_ms / 1000.0 - (time.time() - start_time)
+        recent = RECENT_RESULTS.get(result_key)
+        plan = plan_request(
+            remaining,
+            use_neural='neural' in stage_calls,
+            trained={name: is_model_cached(user_id, name, dataset_version) for name in ('svd', 'neural')},
+            has_cached_result=recent is not None,
+            concurrent=concurrent
+        )
+        degradations = plan.degradations
+        
+        if plan.serve_cached:
+            result = recent
+            result.attrs['dropped_stages'] = []
+            result.attrs['degradations'] = degradations
+            return result
+        
+        stage_calls = {name: call for name, call in stage_calls.items() if name in plan.stages}
+        for name in ('svd', 'neural'):
+            ranked[name] = min(plan.candidates[name], ranked.get(name, plan.candidates[name]))
+        # No stage may outlive the request
+        deadlines = {name: min(deadline, max(remaining, 0.0)) for name, deadline in deadlines.items()}
+    
+    # Number of candidates each model stage scores
+    for name, n_scored in ranked.items():
+        if name in stage_calls:
+            fn, args = stage_calls[name]
+            stage_calls[name] = (fn, args + (n_scored,))
+    
+    # Identical stages already running for another request are shared
+    flight_keys = {
+        'content': ('content', tuple(sorted(selected_anime)), top_n, dataset_version, candidates_key,
+                    filters_digest),
+        'svd': ('svd', user_id, top_n, dataset_version, candidates_key, filters_digest, ranked.get('svd')),
+        'neural': ('neural', user_id, top_n, dataset_version, candidates_key, filters_digest,
+                   ranked.get('neural'))
+    }
+    stage_calls = {
+        name: (_coalesced, (flight_keys[name], fn) + args)
+        for name, (fn, args) in stage_calls.items()
+    }
+    
+    dropped = []
+    if not stage_calls:
+        stage_results = {}
+    elif concurrent:
+        stage_results, dropped = _run_stages_concurrently(stage_calls, deadlines)
     else:
-        neural_recs = pd.DataFrame()  # Empty DF if neural weight is too low
+        # Content first (fast), then SVD, then neural
+        stage_results = {name: fn(*args) for name, (fn, args) in stage_calls.items()}
+    
+    stage_timings.update({name: recs.attrs.get('stage_seconds') for name, recs in stage_results.items()})
+    
+    merge_start = time.time()
+    content_recs = stage_results.get('content', pd.DataFrame())
+    svd_recs = stage_results.get('svd', pd.DataFrame())
+    neural_recs = stage_results.get('neural', pd.DataFrame())
     
     # Handle empty recommendation sets
     if content_recs.empty and neural_recs.empty:
-        return svd_recs.head(top_n)
+        result = svd_recs.head(top_n)
+        result.attrs['dropped_stages'] = dropped
+        result.attrs['degradations'] = degradations
+        result.attrs['stage_timings'] = stage_timings
+        return result
+    elif svd_recs.empty:
+        # If SVD was dropped, renormalize between neural and content
+        weights = _renormalize_weights({
+            'neural': beta if not neural_recs.empty else 0.0,
+            'content': gamma if not content_recs.empty else 0.0
+        })
+        alpha, beta, gamma = 0.0, weights['neural'], weights['content']
     elif content_recs.empty:
         # If no content recommendations, adjust weights between SVD and neural
         alpha = 0.6
@@ -160,49 +503,22 @@ def hybrid_recommend(
         beta = 0.0
     
     # Prepare DataFrames for merge
-    svd_df = svd_recs[['anime_id', 'predicted_rating']].copy()
-    
-    # Merge recommendations
-    all_anime_ids = set(svd_df['anime_id'])
-    
-    # Add neural recommendations if available
-    if not neural_recs.empty:
-        neural_df = neural_recs[['anime_id', 'neural_score']].copy()
-        all_anime_ids.update(neural_df['anime_id'])
+    if not svd_recs.empty:
+        svd_df = svd_recs[['anime_id', 'predicted_rating']].copy()
     else:
-        neural_df = pd.DataFrame(columns=['anime_id', 'neural_score'])
-    
-    # Add content recommendations if available
-    if not content_recs.empty:
-        content_df = content_recs[['anime_id', 'content_score']].copy()
-        all_anime_ids.update(content_df['anime_id'])
+        svd_df = pd.DataFrame(columns=['anime_id', 'predicted_rating'])
+    
+    items_examined = None
+    component_recs = {'predicted_rating': svd_df, 'neural_score': neural_recs, 'content_score': content_recs}
+    component_weights = {'predicted_rating': alpha, 'neural_score': beta, 'content_score': gamma}
+    if fusion == "threshold":
+        # Read the sorted component lists only until the top N is provably final
+        hybrid_recs, items_examined = fuse_threshold(component_recs, component_weights, top_n)
+    elif fusion == "sort":
+        # Score the union of all component lists and sort it
+        hybrid_recs = fuse_sort(component_recs, component_weights, top_n)
     else:
-        content_df = pd.DataFrame(columns=['anime_id', 'content_score'])
-    
-    # Create a unified DataFrame with all anime IDs
-    hybrid_recs = pd.DataFrame({'anime_id': list(all_anime_ids)})
-    
-    # Merge with individual recommendation DataFrames
-    hybrid_recs = hybrid_recs.merge(svd_df, on='anime_id', how='left')
-    hybrid_recs = hybrid_recs.merge(neural_df, on='anime_id', how='left')
-    hybrid_recs = hybrid_recs.merge(content_df, on='anime_id', how='left')
-    
-    # Fill missing values with 0
-    hybrid_recs = hybrid_recs.fillna(0)
-    
-    # Normalize scores
-    for col in ['predicted_rating', 'neural_score', 'content_score']:
-        if hybrid_recs[col].max() > hybrid_recs[col].min():
-            hybrid_recs[col] = (hybrid_recs[col] - hybrid_recs[col].min()) / \
-                               (hybrid_recs[col].max() - hybrid_recs[col].min())
-    
-    # Calculate final score with three components
-    hybrid_recs['final_score'] = (alpha * hybrid_recs['predicted_rating'] + 
-                                  beta * hybrid_recs['neural_score'] + 
-                                  gamma * hybrid_recs['content_score'])
-    
-    # Sort by final score and get top N
-    hybrid_recs = hybrid_recs.sort_values('final_score', ascending=False).head(top_n)
+        raise ValueError(f"Unknown fusion '{fusion}', use 'sort' or 'threshold'")
     
     # Add anime details
     hybrid_recs = hybrid_recs.merge(
@@ -213,11 +529,256 @@ def hybrid_recommend(
     # Get only necessary images to speed up loading
     hybrid_recs_with_images = enrich_with_images(hybrid_recs)
     
+    STAGE_TIMINGS.record('merge', time.time() - merge_start)
+    hybrid_recs_with_images.attrs['dropped_stages'] = dropped
+    hybrid_recs_with_images.attrs['degradations'] = degradations
+    hybrid_recs_with_images.attrs['stage_timings'] = stage_timings
+    hybrid_recs_with_images.attrs['items_examined'] = items_examined
+    RECENT_RESULTS.put(result_key, hybrid_recs_with_images)
+    
     end_time = time.time()
     print(f"Recommendation time: {end_time - start_time:.2f} seconds")
     
     return hybrid_recs_with_images 
 
+def content_score_matrix(
+    anime_df: pd.DataFrame,
+    selections: List[List[str]],
+    genre_matrix: Optional[sparse.csr_matrix] = None
+) -> np.ndarray:
+    """
+    Content scores for many selections at once.
+    
+    Row i is the mean cosine similarity of every anime to the anime in
+    selections[i], i.e. what get_content_based_recommendations computes for one
+    selection. Rows of selections with no known anime are all NaN.
+    
+    genre_matrix defaults to get_genre_matrix(anime_df); callers scoring many
+    blocks pass it in so it is not looked up for each one.
+    """
+    if genre_matrix is None:
+        genre_matrix = get_genre_matrix(anime_df)
+    
+    # Averaging operator: row i holds 1/k at the positions of its k selected anime
+    title_index = get_title_index(anime_df)
+    rows, cols, vals = [], [], []
+    for i, selected in enumerate(selections):
+        positions = title_index.positions(selected)
+        rows.extend([i] * len(positions))
+        cols.extend(positions)
+        vals.extend([1.0 / max(len(positions), 1)] * len(positions))
+    selector = sparse.csr_matrix((vals, (rows, cols)), shape=(len(selections), len(anime_df)))
+    
+    # TF-IDF rows are L2-normalized, so cosine similarity is a dot product
+    scores = np.asarray((selector @ genre_matrix @ genre_matrix.T).todense())
+    scores[np.asarray(selector.sum(axis=1)).ravel() == 0] = np.nan
+    return scores
+
+def _top_k_mask(scores: np.ndarray, k: int) -> np.ndarray:
+    """Boolean mask of the k highest non-NaN scores in each row."""
+    filled = np.where(np.isnan(scores), -np.inf, scores)
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-filled, k - 1, axis=1)[:, :k]
+    mask = np.zeros(scores.shape, dtype=bool)
+    np.put_along_axis(mask, top, True, axis=1)
+    return mask & np.isfinite(filled)
+
+def _fuse_score_block(
+    component_scores: Dict[str, np.ndarray],
+    weights: Dict[str, float],
+    top_n: int
+) -> Tuple[np.ndarray, Dict[str, np.ndarray], np.ndarray]:
+    """
+    Fuse a block of per-request component scores the way hybrid_recommend does.
+    
+    Each component keeps its top 2 * top_n items per row, missing scores count as
+    0, scores are min-max normalized over the union, and the weights fall back as
+    in hybrid_recommend when a component has nothing for a row.
+    
+    Returns:
+        tuple: (top item positions, normalized component values at them, final scores)
+    """
+    in_top = {name: _top_k_mask(scores, top_n * 2) for name, scores in component_scores.items()}
+    union = np.logical_or.reduce(list(in_top.values()))
+    has = {name: mask.any(axis=1) for name, mask in in_top.items()}
+    
+    normalized = {}
+    for name, scores in component_scores.items():
+        values = np.where(in_top[name], np.nan_to_num(scores), 0.0)
+        low = np.where(union, values, np.inf).min(axis=1, keepdims=True)
+        high = np.where(union, values, -np.inf).max(axis=1, keepdims=True)
+        spread = high - low
+        normalized[name] = np.where(spread > 0, (values - low) / np.where(spread > 0, spread, 1), values)
+    
+    # Per-row weights, with the same fallbacks as hybrid_recommend
+    n_rows = union.shape[0]
+    row_weights = {name: np.full(n_rows, weights[name]) for name in component_scores}
+    svd_only = ~has['content'] & ~has['neural']
+    no_svd = ~has['svd'] & ~svd_only
+    no_content = ~has['content'] & ~svd_only & ~no_svd
+    no_neural = ~has['neural'] & ~svd_only & ~no_svd & ~no_content
+    for mask, (a, b, g) in ((svd_only, (1.0, 0.0, 0.0)),
+                            (no_content, (0.6, 0.4, 0.0)),
+                            (no_neural, (0.6, 0.0, 0.4))):
+        row_weights['svd'][mask], row_weights['neural'][mask], row_weights['content'][mask] = a, b, g
+    if no_svd.any():
+        total = (weights['neural'] * has['neural'] + weights['content'] * has['content'])[no_svd]
+        total = np.where(total > 0, total, 1.0)
+        row_weights['svd'][no_svd] = 0.0
+        row_weights['neural'][no_svd] = weights['neural'] * has['neural'][no_svd] / total
+        row_weights['content'][no_svd] = weights['content'] * has['content'][no_svd] / total
+    
+    final = sum(row_weights[name][:, None] * normalized[name] for name in component_scores)
+    final = np.where(union, final, -np.inf)
+    
+    k = min(top_n, final.shape[1])
+    top = np.argpartition(-final, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(final, top, axis=1), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    
+    top_values = {name: np.take_along_axis(values, top, axis=1) for name, values in normalized.items()}
+    return top, top_values, np.take_along_axis(final, top, axis=1)
+
+def hybrid_recommend_batch(
+    requests: List[Tuple[int, List[str]]],
+    ratings_df: pd.DataFrame,
+    anime_df: pd.DataFrame,
+    top_n: int = 10,
+    alpha: float = 0.4,
+    beta: float = 0.3,
+    gamma: float = 0.3,
+    block_size: int = 256,
+    dataset_version: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Get hybrid recommendations for many (user_id, selected_anime) requests at once.
+    
+    The SVD and neural models are trained once per dataset version on the same
+    uniform sample of BATCH_SAMPLE_SIZE ratings and shared by every batch, so
+    neither the training cost nor the model cache grows with the batch. As in
+    hybrid_recommend, each user's own ratings count: users outside the sample
+    are folded into the SVD from their ratings (fold_in_users), without
+    retraining. The neural component only scores users it was trained on.
+    Each component then scores a block of requests against the full catalog
+    as a single matrix-matrix product, and the scores are fused with the same
+    rules as hybrid_recommend.
+    
+    Args:
+        requests (list): (user_id, selected_anime) pairs
+        ratings_df (pd.DataFrame): DataFrame with user ratings
+        anime_df (pd.DataFrame): DataFrame with anime information
+        top_n (int): Number of recommendations per request
+        alpha (float): Weight for SVD
+        beta (float): Weight for neural network
+        gamma (float): Weight for content-based
+        block_size (int): Requests scored together (bounds memory)
+        dataset_version (str): Version of ratings_df (names the models and the rating store)
+        
+    Returns:
+        pd.DataFrame: One row per recommendation, with columns request, user_id,
+            rank, anime_id, predicted_rating, neural_score, content_score,
+            final_score, name, genre, type, rating
+    """
+    start_time = time.time()
+    columns = ['request', 'user_id', 'rank', 'anime_id', 'predicted_rating', 'neural_score',
+               'content_score', 'final_score', 'name', 'genre', 'type', 'rating']
+    if not requests:
+        return pd.DataFrame(columns=columns)
+    
+    user_ids = np.array([user_id for user_id, _ in requests])
+    
+    # Only a caller-supplied dataset version is trusted to name on-disk data
+    store = get_rating_store(ratings_df, dataset_version)
+    if dataset_version is None:
+        dataset_version = f"rows{len(ratings_df)}"
+    
+    # The same uniform sample for every batch of this dataset version
+    if len(ratings_df) > BATCH_SAMPLE_SIZE:
+        sampled_ratings = store.sample_with_users([], BATCH_SAMPLE_SIZE, random_state=42)
+    else:
+        sampled_ratings = ratings_df
+    
+    # One set of batch models per dataset version (part of the cache key), trained
+    # on the whole sample, whatever users a batch has
+    model_key = f"batch{BATCH_SAMPLE_SIZE}"
+    svd_model = load_or_train_model(
+        model_key, 'svd', partial(train_svd_model, sampled_ratings, sample_size=None), dataset_version
+    )
+    
+    use_neural = beta > 0.1
+    if use_neural:
+        # Its encoders only know the users and anime it was trained on
+        neural_model, user_encoder, anime_encoder = load_or_train_model(
+            model_key, 'neural', partial(train_neural_model, sampled_ratings, sample_size=None),
+            dataset_version
+        )
+    
+    anime_ids = anime_df['anime_id'].values
+    weights = {'svd': alpha, 'neural': beta if use_neural else 0.0, 'content': gamma}
+    genre_matrix = get_genre_matrix(anime_df)
+    title_index = get_title_index(anime_df)
+    
+    frames = []
+    for block_start in range(0, len(requests), block_size):
+        block = requests[block_start:block_start + block_size]
+        block_users = user_ids[block_start:block_start + block_size]
+        
+        # Users outside the training sample get SVD factors from their own ratings
+        folded = fold_in_users(svd_model, {int(u): store.user_rows(u) for u in np.unique(block_users)})
+        scores = {
+            'svd': svd_score_matrix(svd_model, block_users, anime_ids, folded),
+            'content': content_score_matrix(anime_df, [selected for _, selected in block], genre_matrix),
+            'neural': np.full((len(block), len(anime_ids)), np.nan)
+        }
+        
+        # Selected anime are never recommended by the content component
+        for row, (_, selected) in enumerate(block):
+            scores['content'][row, title_index.positions(selected)] = np.nan
+        
+        if use_neural:
+            # Users with a trained embedding
+            known_users = np.isin(block_users, user_encoder.classes_)
+            known_anime = np.isin(anime_ids, anime_encoder.classes_)
+            if known_users.any() and known_anime.any():
+                neural_block = neural_score_matrix(
+                    neural_model,
+                    user_encoder.transform(block_users[known_users]),
+                    anime_encoder.transform(anime_ids[known_anime])
+                )
+                scores['neural'][np.ix_(known_users, known_anime)] = neural_block
+                # Anime the user already rated are skipped, as in get_neural_recommendations
+                for row in np.flatnonzero(known_users):
+                    scores['neural'][row, np.isin(anime_ids, store.items_of(block_users[row]))] = np.nan
+        
+        top, top_values, final = _fuse_score_block(scores, weights, top_n)
+        
+        n_rows, k = top.shape
+        frames.append(pd.DataFrame({
+            'request': np.repeat(np.arange(block_start, block_start + n_rows), k),
+            'user_id': np.repeat(block_users, k),
+            'rank': np.tile(np.arange(1, k + 1), n_rows),
+            'anime_id': anime_ids[top.ravel()],
+            'predicted_rating': top_values['svd'].ravel(),
+            'neural_score': top_values['neural'].ravel(),
+            'content_score': top_values['content'].ravel(),
+            'final_score': final.ravel()
+        }))
+    
+    results = pd.concat(frames, ignore_index=True)
+    results = results[np.isfinite(results['final_score'])]
+    
+    # Add anime details
+    results = results.merge(
+        anime_df[['anime_id', 'name', 'genre', 'type', 'rating']],
+        on='anime_id',
+        how='left'
+    ).sort_values(['request', 'rank']).reset_index(drop=True)
+    
+    end_time = time.time()
+    print(f"Batch recommendation time for {len(requests)} requests: {end_time - start_time:.2f} seconds")
+    
+    return results[columns]
+
 def profiled_hybrid_recommend(*args, **kwargs):
     """
     Profile the hybrid_recommend function and save results to a file.
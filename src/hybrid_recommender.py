@@ -1,105 +1,387 @@
+import glob
+import json
+import os
+import threading
+import time
+from typing import List, Optional, Union
+
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from surprise import SVD, Dataset, Reader
-import os
+
+from .result_cache import dataset_fingerprint
+from utils.cache_storage import file_lock
+from utils.data_cache import load_table, fill_missing, ANIME_SCHEMA, RATINGS_SCHEMA
+from utils.title_index import TitleIndex
 
 # Get the project root directory
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-# Load datasets with correct paths
-anime_df = pd.read_csv(os.path.join(project_root, "data/anime.csv"))
-rating_df = pd.read_csv(os.path.join(project_root, "data/rating.csv"))
-ratings_df = rating_df[rating_df['rating'] != -1]
-
-# TF-IDF Vectorizer for genres
-anime_df['genre'] = anime_df['genre'].fillna('').str.lower()
-tfidf = TfidfVectorizer(token_pattern=r'[^,]+')
-tfidf_matrix = tfidf.fit_transform(anime_df['genre'])
-cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
-anime_df = anime_df.reset_index()
-
-# Build SVD model
-reader = Reader(rating_scale=(1, 10))
-data = Dataset.load_from_df(ratings_df[['user_id', 'anime_id', 'rating']], reader)
-trainset = data.build_full_trainset()
-svd = SVD()
-svd.fit(trainset)
+DEFAULT_ANIME_PATH = os.path.join(project_root, "data/anime.csv")
+DEFAULT_RATING_PATH = os.path.join(project_root, "data/rating.csv")
+DEFAULT_ARTIFACT_DIR = os.path.join(project_root, "cache/hybrid_recommender")
+
+# Content neighbors kept per title (recommend uses at most top_n + 19 of them)
+DEFAULT_NEIGHBORS = 100
+
+# Rows of the cosine similarity computed at once while building neighbors
+NEIGHBOR_BLOCK_SIZE = 1024
+
+# Arrays of a build, written as {name}-{build_id}.npy; meta.json names the current build's files
+ARTIFACT_ARRAYS = [
+    "neighbor_idx", "neighbor_sim",
+    "user_ids", "user_factors", "user_bias",
+    "item_factors", "item_bias"
+]
+
+def _load_catalog(anime_path: str) -> pd.DataFrame:
+    """The catalog as the recommender uses it (lower-cased genres, positional index)."""
+    anime_df = fill_missing(load_table(anime_path, ANIME_SCHEMA), {'genre': ''})
+    anime_df['genre'] = anime_df['genre'].str.lower()
+    return anime_df.reset_index()
+
+def build_artifacts(
+    anime_path: str = DEFAULT_ANIME_PATH,
+    rating_path: str = DEFAULT_RATING_PATH,
+    artifact_dir: str = DEFAULT_ARTIFACT_DIR,
+    n_neighbors: int = DEFAULT_NEIGHBORS
+) -> dict:
+    """
+    Precompute everything hybrid_recommend needs and write it as .npy files.
+
+    Content neighbors are the n_neighbors most genre-similar titles of every
+    title (TF-IDF cosine, computed in row blocks instead of a dense
+    n_items x n_items matrix). The SVD model is trained on all ratings and
+    stored as its factors and biases, with item rows aligned to catalog rows.
+    meta.json records the fingerprint (size and mtime) of both source files,
+    so artifacts built from older data are detected.
+
+    Every build writes its arrays under new file names and then atomically
+    replaces meta.json, which names them, so processes serving (and
+    memory-mapping) the previous build are never handed a half-written file.
+    Files of earlier builds are deleted afterwards; mappings that are still
+    open keep working. Builds are serialized by a file lock.
+
+    Args:
+        anime_path (str): Path to anime.csv
+        rating_path (str): Path to rating.csv
+        artifact_dir (str): Directory to write the artifacts to
+        n_neighbors (int): Neighbors kept per title
+
+    Returns:
+        dict: The metadata written to meta.json
+    """
+    # Surprise is only needed to build, not to serve
+    from surprise import SVD, Dataset, Reader
+
+    start_time = time.time()
+    # Taken before reading, so a file replaced during the build counts as changed
+    source_version = dataset_fingerprint(anime_path, rating_path)
+    os.makedirs(artifact_dir, exist_ok=True)
+    anime_df = _load_catalog(anime_path)
+    n_items = len(anime_df)
+    n_neighbors = min(n_neighbors, n_items - 1)
+
+    # TF-IDF rows are L2-normalized, so cosine similarity is a dot product
+    tfidf = TfidfVectorizer(token_pattern=r'[^,]+')
+    tfidf_matrix = tfidf.fit_transform(anime_df['genre'])
+
+    neighbor_idx = np.empty((n_items, n_neighbors), dtype=np.int32)
+    neighbor_sim = np.empty((n_items, n_neighbors), dtype=np.float32)
+    for block_start in range(0, n_items, NEIGHBOR_BLOCK_SIZE):
+        block_end = min(block_start + NEIGHBOR_BLOCK_SIZE, n_items)
+        sims = (tfidf_matrix[block_start:block_end] @ tfidf_matrix.T).toarray()
+        rows = np.arange(block_end - block_start)
+        sims[rows, rows + block_start] = -np.inf  # a title is not its own neighbor
+
+        top = np.argpartition(-sims, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind='stable')
+        neighbor_idx[block_start:block_end] = np.take_along_axis(top, order, axis=1)
+        neighbor_sim[block_start:block_end] = np.take_along_axis(top_sims, order, axis=1)
+
+    arrays = {'neighbor_idx': neighbor_idx, 'neighbor_sim': neighbor_sim}
+
+    # Build SVD model
+    rating_df = load_table(rating_path, RATINGS_SCHEMA)
+    ratings_df = rating_df[rating_df['rating'] != -1]
+    reader = Reader(rating_scale=(1, 10))
+    data = Dataset.load_from_df(ratings_df[['user_id', 'anime_id', 'rating']], reader)
+    trainset = data.build_full_trainset()
+    svd = SVD()
+    svd.fit(trainset)
+
+    # Users sorted by raw ID so they can be found with a binary search
+    raw_users = np.array([trainset.to_raw_uid(inner) for inner in range(trainset.n_users)])
+    user_order = np.argsort(raw_users)
+
+    # Item factors aligned to catalog rows; titles without ratings get zeros,
+    # which is what Surprise predicts for an unknown item
+    item_factors = np.zeros((n_items, svd.qi.shape[1]), dtype=np.float32)
+    item_bias = np.zeros(n_items, dtype=np.float32)
+    for row, anime_id in enumerate(anime_df['anime_id'].values):
+        if trainset.knows_item_raw(anime_id):
+            inner = trainset.to_inner_iid(anime_id)
+            item_factors[row] = svd.qi[inner]
+            item_bias[row] = svd.bi[inner]
+
+    arrays.update({
+        'user_ids': raw_users[user_order].astype(np.int64),
+        'user_factors': svd.pu[user_order].astype(np.float32),
+        'user_bias': svd.bu[user_order].astype(np.float32),
+        'item_factors': item_factors,
+        'item_bias': item_bias
+    })
+
+    meta_path = os.path.join(artifact_dir, "meta.json")
+    with file_lock(meta_path):
+        # New names for every build: nothing already mapped is overwritten
+        build_id = f"{time.time_ns():x}-{os.getpid()}"
+        files = {name: f"{name}-{build_id}.npy" for name in ARTIFACT_ARRAYS}
+        for name in ARTIFACT_ARRAYS:
+            with open(os.path.join(artifact_dir, files[name]), "wb") as f:
+                np.save(f, arrays[name])
+                f.flush()
+                os.fsync(f.fileno())
+
+        meta = {
+            'global_mean': float(trainset.global_mean),
+            'rating_scale': [1, 10],
+            'n_items': n_items,
+            'n_neighbors': n_neighbors,
+            'source_version': source_version,
+            'files': files,
+            'built_at': time.time()
+        }
+        # Switching meta.json publishes the build
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        current = set(files.values())
+        for path in glob.glob(os.path.join(artifact_dir, "*.npy")):
+            if os.path.basename(path) not in current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    print(f"Built hybrid recommender artifacts in {time.time() - start_time:.2f} seconds")
+    return meta
+
+class HybridRecommenderService:
+    """
+    Content + SVD recommender served from prebuilt artifacts.
+
+    Nothing is loaded when the object is created. The first call (or warmup())
+    reads the catalog and memory-maps the artifacts written by build_artifacts,
+    so it only pays for the mmap. Artifacts that are missing, or were built
+    from other versions of anime.csv or rating.csv, are an error: build them
+    at deploy time with `python -m src.hybrid_recommender`. build_if_missing
+    builds them inline instead (minutes), e.g. for development.
+    """
+
+    def __init__(
+        self,
+        anime_path: str = DEFAULT_ANIME_PATH,
+        rating_path: str = DEFAULT_RATING_PATH,
+        artifact_dir: str = DEFAULT_ARTIFACT_DIR,
+        build_if_missing: bool = False
+    ):
+        """
+        Args:
+            anime_path (str): Path to anime.csv
+            rating_path (str): Path to rating.csv (only read when building)
+            artifact_dir (str): Directory with the prebuilt artifacts
+            build_if_missing (bool): Build the artifacts on first use if absent or stale
+        """
+        self.anime_path = anime_path
+        self.rating_path = rating_path
+        self.artifact_dir = artifact_dir
+        self.build_if_missing = build_if_missing
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _read_meta(self) -> Optional[dict]:
+        """meta.json of the current build, or None if there is no complete build."""
+        try:
+            with open(os.path.join(self.artifact_dir, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        files = meta.get('files') or {}
+        if not all(name in files and os.path.exists(os.path.join(self.artifact_dir, files[name]))
+                   for name in ARTIFACT_ARRAYS):
+            return None
+        return meta
+
+    def artifacts_exist(self) -> bool:
+        return self._read_meta() is not None
+
+    def _load(self):
+        """Read the catalog and memory-map the artifacts (once)."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            source_version = dataset_fingerprint(self.anime_path, self.rating_path)
+            meta = self._read_meta()
+            if meta is None or meta.get('source_version') != source_version:
+                if not self.build_if_missing:
+                    problem = "not found" if meta is None else "out of date"
+                    raise FileNotFoundError(
+                        f"Hybrid recommender artifacts {problem} in {self.artifact_dir}; "
+                        "build them with `python -m src.hybrid_recommender`"
+                    )
+                if meta is not None:
+                    print(f"Hybrid recommender artifacts in {self.artifact_dir} are stale; rebuilding")
+                meta = build_artifacts(self.anime_path, self.rating_path, self.artifact_dir)
+
+            def load(name):
+                return np.load(os.path.join(self.artifact_dir, meta['files'][name]), mmap_mode='r')
+
+            self.meta = meta
+            self.anime_df = _load_catalog(self.anime_path)
+            if len(self.anime_df) != self.meta['n_items']:
+                raise ValueError(
+                    f"Artifacts in {self.artifact_dir} were built for a different catalog; rebuild them"
+                )
+            self.neighbor_idx = load("neighbor_idx")
+            self.neighbor_sim = load("neighbor_sim")
+            self.user_ids = load("user_ids")
+            self.user_factors = load("user_factors")
+            self.user_bias = load("user_bias")
+            self.item_factors = load("item_factors")
+            self.item_bias = load("item_bias")
+
+            self.title_index = TitleIndex(self.anime_df['name'].values)
+            self._loaded = True
+
+    def warmup(self) -> "HybridRecommenderService":
+        """Load everything now instead of on the first request."""
+        self._load()
+        return self
+
+    def _user_row(self, user_id: int) -> Optional[int]:
+        i = int(np.searchsorted(self.user_ids, user_id))
+        if i < len(self.user_ids) and self.user_ids[i] == user_id:
+            return i
+        return None
+
+    def predict(self, user_id: int, position: int) -> float:
+        """SVD rating estimate of the catalog row at position, as Surprise's SVD.predict."""
+        return float(self.predict_many(user_id, np.array([position]))[0])
+
+    def predict_many(self, user_id: int, positions: np.ndarray) -> np.ndarray:
+        """SVD rating estimates of several catalog rows in one matrix-vector product."""
+        self._load()
+        est = self.meta['global_mean'] + np.asarray(self.item_bias[positions], dtype=np.float64)
+        row = self._user_row(user_id)
+        if row is not None:
+            est += float(self.user_bias[row]) + self.item_factors[positions] @ self.user_factors[row]
+        low, high = self.meta['rating_scale']
+        return np.clip(est, low, high)
+
+    def resolve_title(self, title: str) -> Optional[int]:
+        """Catalog row of a title (normalized, with a fuzzy fallback), or None if unknown."""
+        self._load()
+        return self.title_index.first(title, fuzzy=True)
+
+    def hybrid_recommend(
+        self,
+        user_id: int,
+        anime_titles: Union[str, List[str]],
+        top_n: int = 5,
+        alpha: float = 0.6
+    ) -> Union[pd.DataFrame, str]:
+        """
+        Generate hybrid recommendations combining content-based and collaborative filtering.
+        Supports multiple anime titles as input.
+
+        Args:
+            user_id (int): User ID for collaborative filtering
+            anime_titles (str or list): Single anime title or list of anime titles
+            top_n (int): Number of recommendations to return
+            alpha (float): Weight for collaborative filtering (0-1)
+
+        Returns:
+            pd.DataFrame: DataFrame containing recommendations and scores
+        """
+        self._load()
+        anime_df = self.anime_df
+
+        # Convert single title to list
+        if isinstance(anime_titles, str):
+            anime_titles = [anime_titles]
+
+        # Resolve every title through the name index
+        positions = []
+        for title in anime_titles:
+            position = self.resolve_title(title)
+            if position is None:
+                return f"Anime titled '{title}' not found in dataset."
+            positions.append(position)
+        positions = np.array(positions)
+
+        # Precomputed most similar titles: one row of neighbors per input title
+        n_similar = min(top_n + 19, self.neighbor_idx.shape[1])
+        neighbors = np.asarray(self.neighbor_idx[positions, :n_similar])
+        sims = np.asarray(self.neighbor_sim[positions, :n_similar], dtype=np.float64)
+
+        # One SVD estimate per distinct neighbor
+        candidates, inverse = np.unique(neighbors, return_inverse=True)
+        inverse = inverse.reshape(neighbors.shape)
+        preds = self.predict_many(user_id, candidates)
+
+        # Calculate hybrid scores
+        scores = (1 - alpha) * sims + alpha * (preds[inverse] / 10)  # Normalize rating (1-10) to 0-1
+
+        # Average each candidate's scores over the titles it is a neighbor of
+        totals = np.zeros(len(candidates))
+        counts = np.zeros(len(candidates))
+        np.add.at(totals, inverse.ravel(), scores.ravel())
+        np.add.at(counts, inverse.ravel(), 1)
+        avg_scores = totals / counts
+
+        # Sort and get top N
+        top = np.argsort(-avg_scores, kind='stable')[:top_n]
+        rec_indices = candidates[top]
+        recommendations = list(zip(rec_indices, avg_scores[top]))
+
+        # Prepare result DataFrame
+        result = anime_df.loc[rec_indices, ['name', 'genre', 'type', 'rating']].copy()
+        result['final_score'] = [round(i[1], 3) for i in recommendations]
+
+        # Add placeholder image URLs if not present
+        if 'image_url' not in result.columns:
+            result['image_url'] = [f"https://via.placeholder.com/120/ff4baf/ffffff?text={name[:10]}"
+                                 for name in result['name']]
+
+        return result.reset_index(drop=True)
+
+# Shared service; importing this module loads nothing
+SERVICE = HybridRecommenderService()
+
+def warmup() -> HybridRecommenderService:
+    """Load the shared service's artifacts ahead of the first request."""
+    return SERVICE.warmup()
 
 def hybrid_recommend(user_id, anime_titles, top_n=5, alpha=0.6):
     """
     Generate hybrid recommendations combining content-based and collaborative filtering.
     Supports multiple anime titles as input.
-    
+
     Args:
         user_id (int): User ID for collaborative filtering
         anime_titles (str or list): Single anime title or list of anime titles
         top_n (int): Number of recommendations to return
         alpha (float): Weight for collaborative filtering (0-1)
-        
+
     Returns:
         pd.DataFrame: DataFrame containing recommendations and scores
     """
-    # Convert single title to list
-    if isinstance(anime_titles, str):
-        anime_titles = [anime_titles]
-    
-    # Initialize recommendation scores
-    all_recommendations = []
-    
-    for title in anime_titles:
-        # Find anime index
-        idx = anime_df[anime_df['name'].str.lower() == title.lower()].index
-        
-        if len(idx) == 0:
-            return f"Anime titled '{title}' not found in dataset."
-        
-        idx = idx[0]
-        
-        # Get similarity scores
-        sim_scores = list(enumerate(cosine_sim[idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)[1:top_n+20]
-        
-        # Calculate hybrid scores
-        for i, sim in sim_scores:
-            anime_id = anime_df.loc[i, 'anime_id']
-            pred = svd.predict(user_id, anime_id).est
-            final_score = (1 - alpha) * sim + alpha * (pred / 10)  # Normalize rating (1-10) to 0-1
-            all_recommendations.append({
-                'index': i,
-                'score': final_score,
-                'title': title
-            })
-    
-    # Aggregate scores for each anime
-    score_dict = {}
-    for rec in all_recommendations:
-        idx = rec['index']
-        if idx not in score_dict:
-            score_dict[idx] = {
-                'scores': [],
-                'titles': []
-            }
-        score_dict[idx]['scores'].append(rec['score'])
-        score_dict[idx]['titles'].append(rec['title'])
-    
-    # Calculate average scores
-    recommendations = []
-    for idx, data in score_dict.items():
-        avg_score = sum(data['scores']) / len(data['scores'])
-        recommendations.append((idx, avg_score))
-    
-    # Sort and get top N
-    recommendations = sorted(recommendations, key=lambda x: x[1], reverse=True)[:top_n]
-    rec_indices = [i[0] for i in recommendations]
-    
-    # Prepare result DataFrame
-    result = anime_df.loc[rec_indices, ['name', 'genre', 'type', 'rating']].copy()
-    result['final_score'] = [round(i[1], 3) for i in recommendations]
-    
-    # Add placeholder image URLs if not present
-    if 'image_url' not in result.columns:
-        result['image_url'] = [f"https://via.placeholder.com/120/ff4baf/ffffff?text={name[:10]}" 
-                             for name in result['name']]
-    
-    return result.reset_index(drop=True)
+    return SERVICE.hybrid_recommend(user_id, anime_titles, top_n, alpha)
+
+if __name__ == "__main__":
+    build_artifacts()
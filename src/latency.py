@@ -0,0 +1,171 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Starting estimates (seconds) used until real timings have been recorded.
+# "*_score" stages are per candidate, the rest are per call.
+DEFAULT_STAGE_ESTIMATES = {
+    'content': 0.05,
+    'svd_train': 0.5,
+    'svd_score': 0.00002,
+    'neural_train': 2.0,
+    'neural_score': 0.0002,
+    'merge': 0.01
+}
+
+# Candidate counts the recommenders use when there is no budget pressure
+DEFAULT_CANDIDATES = {
+    'svd': 5000,
+    'neural': 500
+}
+
+# Below this many candidates a scoring stage is skipped instead of shrunk
+MIN_CANDIDATES = 100
+
+class StageTimings:
+    """
+    Running per-stage latency estimates.
+
+    Each stage keeps an exponentially weighted moving average of its observed
+    duration, so the planner follows the current machine and load.
+    """
+
+    def __init__(self, smoothing: float = 0.2, defaults: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            smoothing (float): Weight of the newest observation (0-1)
+            defaults (dict): Initial estimates per stage, in seconds
+        """
+        self.smoothing = smoothing
+        self._estimates = dict(defaults or DEFAULT_STAGE_ESTIMATES)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, n_items: int = 1) -> None:
+        """Record an observed duration, normalized per item for scoring stages."""
+        value = seconds / max(n_items, 1)
+        with self._lock:
+            previous = self._estimates.get(stage)
+            if previous is None:
+                self._estimates[stage] = value
+            else:
+                self._estimates[stage] = (1 - self.smoothing) * previous + self.smoothing * value
+
+    def estimate(self, stage: str, n_items: int = 1) -> float:
+        """Estimated duration of a stage in seconds."""
+        with self._lock:
+            return self._estimates.get(stage, 0.0) * n_items
+
+    def snapshot(self) -> Dict[str, float]:
+        """Copy of the current estimates."""
+        with self._lock:
+            return dict(self._estimates)
+
+# Process-wide timings shared by all requests
+STAGE_TIMINGS = StageTimings()
+
+@dataclass
+class RequestPlan:
+    """What a budgeted request should run, and what was given up to fit the budget."""
+    stages: List[str] = field(default_factory=list)
+    candidates: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_CANDIDATES))
+    serve_cached: bool = False
+    estimated_seconds: float = 0.0
+    degradations: List[str] = field(default_factory=list)
+
+def _fit_scoring_stage(
+    name: str,
+    remaining: float,
+    trained: bool,
+    timings: StageTimings
+) -> Optional[int]:
+    """
+    Largest candidate count for a model stage that fits in the remaining time.
+
+    Returns:
+        int or None: Candidate count, or None if even MIN_CANDIDATES does not fit
+    """
+    fixed = 0.0 if trained else timings.estimate(f'{name}_train')
+    per_candidate = timings.estimate(f'{name}_score')
+    available = remaining - fixed
+    if available <= 0:
+        return None
+
+    full = DEFAULT_CANDIDATES[name]
+    if per_candidate <= 0:
+        return full
+
+    affordable = int(available / per_candidate)
+    if affordable < MIN_CANDIDATES:
+        return None
+    return min(full, affordable)
+
+def plan_request(
+    budget_seconds: float,
+    use_neural: bool,
+    trained: Dict[str, bool],
+    has_cached_result: bool = False,
+    concurrent: bool = False,
+    timings: StageTimings = STAGE_TIMINGS
+) -> RequestPlan:
+    """
+    Decide which stages a request can afford within its latency budget.
+
+    Stages are considered in order of value per cost: content (cheap), then SVD,
+    then neural. A model stage whose full candidate set does not fit is scored on
+    fewer candidates, and skipped if even the minimum does not fit. If no model
+    stage fits and an earlier result is available, the plan serves that instead.
+
+    Args:
+        budget_seconds (float): Time left for this request
+        use_neural (bool): Whether the neural stage was requested at all
+        trained (dict): Model type -> whether a trained model is already cached
+        has_cached_result (bool): Whether an earlier result can be served
+        concurrent (bool): Stages run in parallel (cost is the max, not the sum)
+        timings (StageTimings): Latency estimates to plan with
+
+    Returns:
+        RequestPlan: Stages, candidate counts and the degradations applied
+    """
+    plan = RequestPlan()
+    remaining = budget_seconds - timings.estimate('merge')
+
+    def spend(cost):
+        # In concurrent mode every stage gets the whole remaining budget
+        nonlocal remaining
+        if not concurrent:
+            remaining -= cost
+        plan.estimated_seconds = (max(plan.estimated_seconds, cost) if concurrent
+                                  else plan.estimated_seconds + cost)
+
+    content_cost = timings.estimate('content')
+    if content_cost <= remaining:
+        plan.stages.append('content')
+        spend(content_cost)
+    else:
+        plan.degradations.append('skipped_content')
+
+    model_stages = ['svd', 'neural'] if use_neural else ['svd']
+    for name in model_stages:
+        n_candidates = _fit_scoring_stage(name, remaining, trained.get(name, False), timings)
+        if n_candidates is None:
+            plan.degradations.append(f'skipped_{name}')
+            continue
+        if n_candidates < DEFAULT_CANDIDATES[name]:
+            plan.degradations.append(
+                f'{name}_candidates_{DEFAULT_CANDIDATES[name]}_to_{n_candidates}'
+            )
+        plan.stages.append(name)
+        plan.candidates[name] = n_candidates
+        cost = timings.estimate(f'{name}_score', n_candidates)
+        if not trained.get(name, False):
+            cost += timings.estimate(f'{name}_train')
+        spend(cost)
+
+    # Without any model stage the answer would be content-only; prefer an earlier full result
+    if 'svd' not in plan.stages and 'neural' not in plan.stages and has_cached_result:
+        plan.serve_cached = True
+        plan.stages = []
+        plan.estimated_seconds = 0.0
+        plan.degradations.append('served_cached_result')
+
+    return plan
@@ -0,0 +1,209 @@
+import os
+import glob
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.cache_storage import (
+    CacheIntegrityError, atomic_write_bytes, file_lock, read_checked_bytes
+)
+
+class ModelCache:
+    """
+    Bounded two-level cache for trained models.
+
+    Models are kept in memory up to a total byte budget and mirrored to
+    {cache_dir}/{key}.pkl up to a disk quota. When memory is over budget, each
+    model type proposes a victim according to its own policy ('lru' or 'lfu'),
+    and the least recently used of those proposals is evicted. On disk the
+    least recently used pickles are deleted first.
+
+    A model's size is the length of its pickle, which is computed anyway when
+    it is written to disk. Pickles are written atomically under a file lock
+    (see utils/cache_storage.py), so several server processes can share
+    cache_dir.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "cache",
+        memory_budget_bytes: int = 512 * 1024 * 1024,
+        disk_quota_bytes: int = 2 * 1024 * 1024 * 1024,
+        policies: Optional[Dict[str, str]] = None,
+        default_policy: str = "lru"
+    ):
+        """
+        Args:
+            cache_dir (str): Directory for the pickled models
+            memory_budget_bytes (int): Maximum total size of models kept in memory
+            disk_quota_bytes (int): Maximum total size of model pickles on disk
+            policies (dict): Model type -> 'lru' or 'lfu'
+            default_policy (str): Policy for model types not in policies
+        """
+        for policy in list((policies or {}).values()) + [default_policy]:
+            if policy not in ("lru", "lfu"):
+                raise ValueError(f"Unknown eviction policy '{policy}', use 'lru' or 'lfu'")
+        self.cache_dir = cache_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_quota_bytes = disk_quota_bytes
+        self.policies = dict(policies or {})
+        self.default_policy = default_policy
+
+        # key -> {'model', 'type', 'size', 'hits', 'last_access'}, in LRU order
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0,
+                         'evictions': 0, 'disk_evictions': 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def path_for(self, key: str) -> str:
+        """Disk location of a cached model."""
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key: str, model_type: str) -> Optional[Any]:
+        """Return the model from memory or disk, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['hits'] += 1
+                entry['last_access'] = time.time()
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return entry['model']
+
+        path = self.path_for(key)
+        try:
+            payload = read_checked_bytes(path)
+            model = pickle.loads(payload) if payload is not None else None
+        except (CacheIntegrityError, pickle.UnpicklingError, EOFError) as e:
+            print(f"Discarding corrupted cached model {path}: {e}")
+            self._remove_file(path)
+            model = None
+        except Exception as e:
+            # e.g. a model library that can't be imported in this process
+            print(f"Could not load cached model {path}: {e}")
+            model = None
+
+        if model is None:
+            with self._lock:
+                self.counters['misses'] += 1
+            return None
+
+        size = len(payload)
+        try:
+            # Mark the pickle as recently used for the disk quota
+            os.utime(path)
+        except OSError:
+            pass
+
+        with self._lock:
+            self.counters['disk_hits'] += 1
+            self._admit(key, model_type, model, size)
+        return model
+
+    def put(self, key: str, model_type: str, model: Any) -> None:
+        """Cache a model in memory and on disk, evicting as needed."""
+        try:
+            payload = pickle.dumps(model)
+        except Exception as e:
+            print(f"Could not serialize model {key}: {e}")
+            return
+
+        with self._lock:
+            self._admit(key, model_type, model, len(payload))
+
+        path = self.path_for(key)
+        try:
+            with file_lock(path):
+                atomic_write_bytes(path, payload)
+        except OSError as e:
+            print(f"Could not write cached model {path}: {e}")
+            return
+        self._enforce_disk_quota()
+
+    def _remove_file(self, path: str) -> None:
+        try:
+            with file_lock(path):
+                os.remove(path)
+        except OSError:
+            pass
+
+    def _admit(self, key: str, model_type: str, model: Any, size: int) -> None:
+        # Caller holds the lock
+        if key in self._entries:
+            self._memory_bytes -= self._entries.pop(key)['size']
+        if size > self.memory_budget_bytes:
+            # Too large to keep in memory at all; it stays on disk only
+            return
+        self._entries[key] = {'model': model, 'type': model_type, 'size': size,
+                              'hits': 1, 'last_access': time.time()}
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_budget_bytes and len(self._entries) > 1:
+            self._evict_one(protect=key)
+
+    def _evict_one(self, protect: str) -> None:
+        # Caller holds the lock. One proposal per model type, by that type's policy.
+        proposals = {}
+        for key, entry in self._entries.items():
+            if key == protect:
+                continue
+            model_type = entry['type']
+            policy = self.policies.get(model_type, self.default_policy)
+            rank = entry['hits'] if policy == "lfu" else 0
+            best = proposals.get(model_type)
+            # LRU order already breaks ties: the first entry seen is the oldest
+            if best is None or rank < best[0]:
+                proposals[model_type] = (rank, key)
+
+        if not proposals:
+            return
+        victim = min((key for _, key in proposals.values()),
+                     key=lambda k: self._entries[k]['last_access'])
+        self._memory_bytes -= self._entries.pop(victim)['size']
+        self.counters['evictions'] += 1
+
+    def _enforce_disk_quota(self) -> None:
+        """Delete the least recently used model pickles until under the disk quota."""
+        try:
+            files = [(path, os.stat(path)) for path in glob.glob(os.path.join(self.cache_dir, "*.pkl"))]
+        except OSError:
+            return
+        total = sum(stat.st_size for _, stat in files)
+        for path, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= self.disk_quota_bytes:
+                break
+            try:
+                with file_lock(path):
+                    os.remove(path)
+            except OSError:
+                continue
+            total -= stat.st_size
+            with self._lock:
+                self.counters['disk_evictions'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current memory use."""
+        with self._lock:
+            by_type = {}
+            for entry in self._entries.values():
+                by_type[entry['type']] = by_type.get(entry['type'], 0) + entry['size']
+            return {
+                **self.counters,
+                'entries': len(self._entries),
+                'memory_bytes': self._memory_bytes,
+                'memory_bytes_by_type': by_type
+            }
+
+    def clear(self) -> None:
+        """Drop all models from memory (disk pickles are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
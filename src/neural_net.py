@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 import os
 import pickle
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 import tensorflow as tf
 from tensorflow.keras.models import Model, Sequential, load_model, save_model
 from tensorflow.keras.layers import Input, Embedding, Flatten, Dense, Concatenate
@@ -265,29 +265,56 @@ class NeuralRecSys:
             self.n_anime = encoders_data['n_anime']
 
 
-def train_neural_model(ratings_df: pd.DataFrame) -> Tuple[Model, LabelEncoder, LabelEncoder]:
+def train_neural_model(
+    ratings_df: pd.DataFrame,
+    sample_size: Optional[int] = 500
+) -> Tuple[Model, LabelEncoder, LabelEncoder]:
     """
     Train a neural network model on ratings data.
     
+    The encoders only know the users and anime of the rows the model is
+    trained on (10% of the sample is held out for validation), so every
+    encoded user and anime has a trained embedding.
+    
     Args:
         ratings_df (pd.DataFrame): DataFrame containing user ratings
+        sample_size (int): Ratings to train on (None: all of them)
         
     Returns:
         tuple: (model, user_encoder, anime_encoder) - Trained model and encoders
     """
     # Remove negative ratings
-    ratings_df = ratings_df[ratings_df['rating'] != -1].copy()
+    ratings_df = ratings_df[ratings_df['rating'] != -1]
+    
+    # Train on a (shuffled) sample of the data for speed
+    if sample_size is not None and len(ratings_df) > sample_size:
+        sample_df = ratings_df.sample(sample_size, random_state=42)
+    else:
+        sample_df = ratings_df.sample(frac=1.0, random_state=42)
+    n_train = len(sample_df) - int(len(sample_df) * 0.1)
+    train_df = sample_df.iloc[:n_train].copy()
     
     # Encode user IDs and anime IDs
     user_encoder = LabelEncoder()
     anime_encoder = LabelEncoder()
     
-    ratings_df['user_encoded'] = user_encoder.fit_transform(ratings_df['user_id'])
-    ratings_df['anime_encoded'] = anime_encoder.fit_transform(ratings_df['anime_id'])
+    train_df['user_encoded'] = user_encoder.fit_transform(train_df['user_id'])
+    train_df['anime_encoded'] = anime_encoder.fit_transform(train_df['anime_id'])
+    
+    # Validation rows the encoders know
+    val_df = sample_df.iloc[n_train:]
+    val_df = val_df[val_df['user_id'].isin(user_encoder.classes_) &
+                    val_df['anime_id'].isin(anime_encoder.classes_)]
+    validation_data = None
+    if len(val_df):
+        validation_data = (
+            [user_encoder.transform(val_df['user_id']), anime_encoder.transform(val_df['anime_id'])],
+            val_df['rating']
+        )
     
     # Get number of unique users and anime
-    n_users = len(ratings_df['user_encoded'].unique())
-    n_anime = len(ratings_df['anime_encoded'].unique())
+    n_users = len(user_encoder.classes_)
+    n_anime = len(anime_encoder.classes_)
     
     # Build model - simplified architecture
     embedding_size = 20
@@ -313,17 +340,13 @@ def train_neural_model(ratings_df: pd.DataFrame) -> Tuple[Model, LabelEncoder, L
     model = Model(inputs=[user_input, anime_input], outputs=output)
     model.compile(optimizer=Adam(learning_rate=0.01), loss='mean_squared_error')
     
-    # Train model on a very small subset of data for speed
-    sample_size = min(500, len(ratings_df))
-    sample_df = ratings_df.sample(sample_size, random_state=42)
-    
     # Train model with minimal epochs
     model.fit(
-        [sample_df['user_encoded'], sample_df['anime_encoded']],
-        sample_df['rating'],
+        [train_df['user_encoded'], train_df['anime_encoded']],
+        train_df['rating'],
         epochs=3,
         batch_size=256,
-        validation_split=0.1,
+        validation_data=validation_data,
         verbose=0
     )
     
@@ -336,7 +359,9 @@ def get_neural_recommendations(
     user_encoder: LabelEncoder,
     anime_encoder: LabelEncoder,
     ratings_df: pd.DataFrame,
-    top_n: int = 10
+    top_n: int = 10,
+    max_candidates: int = 500,
+    candidate_ids: Optional[np.ndarray] = None
 ) -> pd.DataFrame:
     """
     Get neural network-based recommendations for a user.
@@ -349,6 +374,8 @@ def get_neural_recommendations(
         anime_encoder (LabelEncoder): Encoder for anime IDs
         ratings_df (pd.DataFrame): DataFrame with user ratings
         top_n (int): Number of recommendations to return
+        max_candidates (int): Maximum number of anime to score
+        candidate_ids (np.ndarray): Score only these anime (from a retrieval stage)
         
     Returns:
         pd.DataFrame: DataFrame with top recommendations
@@ -365,14 +392,20 @@ def get_neural_recommendations(
     user_anime_ids = set(ratings_df[ratings_df['user_id'] == user_id]['anime_id'])
     
     # Speed optimization: Only sample a subset of anime for prediction
-    all_anime_ids = anime_df['anime_id'].unique()
+    if candidate_ids is not None:
+        all_anime_ids = np.asarray(candidate_ids)
+    else:
+        all_anime_ids = anime_df['anime_id'].unique()
     candidate_anime_ids = [aid for aid in all_anime_ids if aid in anime_encoder.classes_ and aid not in user_anime_ids]
     
-    # Further limit candidates to speed up prediction
-    max_candidates = 500
-    if len(candidate_anime_ids) > max_candidates:
+    # Further limit candidates to speed up prediction (retrieved candidates are already ranked)
+    if candidate_ids is not None:
+        candidate_anime_ids = candidate_anime_ids[:max_candidates]
+    elif len(candidate_anime_ids) > max_candidates:
         # Get a random sample but add some of the most popular anime
-        popular_anime = anime_df.sort_values('rating', ascending=False).head(100)['anime_id'].values
+        popular_anime = anime_df.sort_values('rating', ascending=False).head(
+            min(100, max_candidates)
+        )['anime_id'].values
         popular_candidates = [aid for aid in popular_anime if aid in candidate_anime_ids]
         
         # Fill the rest with random candidates
@@ -458,3 +491,62 @@ def get_neural_recommendations_wrapper(
     )
     
     return recommendations
+
+# Activations of the Dense layers built by train_neural_model, in numpy
+_NUMPY_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0)
+}
+
+def neural_score_matrix(
+    model: Model,
+    user_encoded: np.ndarray,
+    anime_encoded: np.ndarray,
+    chunk_size: int = 64
+) -> np.ndarray:
+    """
+    Score every (user, anime) pair with the neural model at once.
+    
+    The first Dense layer acts on [user_vec, anime_vec], so it splits into a
+    user part and an anime part that are each one matrix product; only their
+    broadcast sum goes through the remaining layers. Users are processed in
+    chunks to bound memory.
+    
+    Args:
+        model (Model): Model built by train_neural_model
+        user_encoded (np.ndarray): Encoded user IDs (rows)
+        anime_encoded (np.ndarray): Encoded anime IDs (columns)
+        chunk_size (int): Users per chunk
+        
+    Returns:
+        np.ndarray: (len(user_encoded), len(anime_encoded)) predicted ratings
+    """
+    dense_layers = [layer for layer in model.layers if isinstance(layer, Dense)]
+    activations = [layer.get_config()['activation'] for layer in dense_layers]
+    
+    if any(activation not in _NUMPY_ACTIVATIONS for activation in activations):
+        # Unknown architecture, fall back to one large predict call
+        users = np.repeat(user_encoded, len(anime_encoded))
+        anime = np.tile(anime_encoded, len(user_encoded))
+        predictions = model.predict([users, anime], batch_size=8192, verbose=0)
+        return predictions.reshape(len(user_encoded), len(anime_encoded))
+    
+    user_vecs = model.get_layer('user_embedding').get_weights()[0][user_encoded]
+    anime_vecs = model.get_layer('anime_embedding').get_weights()[0][anime_encoded]
+    
+    first_kernel, first_bias = dense_layers[0].get_weights()
+    embedding_size = user_vecs.shape[1]
+    user_part = user_vecs @ first_kernel[:embedding_size]
+    anime_part = anime_vecs @ first_kernel[embedding_size:] + first_bias
+    rest = [(layer.get_weights(), _NUMPY_ACTIVATIONS[activation])
+            for layer, activation in zip(dense_layers[1:], activations[1:])]
+    first_activation = _NUMPY_ACTIVATIONS[activations[0]]
+    
+    scores = np.empty((len(user_encoded), len(anime_encoded)), dtype=np.float32)
+    for start in range(0, len(user_encoded), chunk_size):
+        hidden = first_activation(user_part[start:start + chunk_size, None, :] + anime_part[None, :, :])
+        for (kernel, bias), activation in rest:
+            hidden = activation(hidden @ kernel + bias)
+        scores[start:start + chunk_size] = hidden[..., 0]
+    
+    return scores
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils.cache_storage import file_lock
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STORE_DIR = os.path.join(PROJECT_ROOT, "cache/rating_store")
+
+# Arrays of a store, all .npy files in its directory
+STORE_ARRAYS = [
+    'user_ids', 'item_ids',                                         # dense index -> raw ID
+    'user_indptr', 'user_items', 'user_ratings', 'user_watched',    # CSR, rows = users
+    'item_indptr', 'item_users', 'item_ratings', 'item_watched'     # CSC, columns = items
+]
+
+def _index_dtype(n: int):
+    """Smallest index dtype scipy accepts for n entries."""
+    return np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+def _compressed(major: np.ndarray, minor: np.ndarray, n_major: int, ratings: np.ndarray, watched: np.ndarray):
+    """indptr, minor indices, ratings and watched flags ordered by (major, minor)."""
+    order = np.lexsort((minor, major))
+    index_dtype = _index_dtype(len(major))
+    indptr = np.zeros(n_major + 1, dtype=index_dtype)
+    np.cumsum(np.bincount(major, minlength=n_major), out=indptr[1:])
+    return indptr, minor[order].astype(index_dtype), ratings[order], watched[order]
+
+def build_store_arrays(ratings_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Compressed sparse arrays of a ratings table.
+
+    Users and items get dense indices (position in the sorted raw IDs). Every
+    rating appears once in the user-major (CSR) and once in the item-major
+    (CSC) layout. "Watched but not rated" entries (rating -1) are stored with
+    rating 0 and a True flag in the watched arrays.
+    """
+    user_ids, users = np.unique(ratings_df['user_id'].values, return_inverse=True)
+    item_ids, items = np.unique(ratings_df['anime_id'].values, return_inverse=True)
+    raw_ratings = ratings_df['rating'].values
+    watched = raw_ratings == -1
+    ratings = np.where(watched, 0, raw_ratings).astype(np.int8)
+
+    index_dtype = _index_dtype(max(len(user_ids), len(item_ids)))
+    users = users.astype(index_dtype)
+    items = items.astype(index_dtype)
+
+    arrays = {'user_ids': user_ids, 'item_ids': item_ids}
+    (arrays['user_indptr'], arrays['user_items'],
+     arrays['user_ratings'], arrays['user_watched']) = _compressed(users, items, len(user_ids), ratings, watched)
+    (arrays['item_indptr'], arrays['item_users'],
+     arrays['item_ratings'], arrays['item_watched']) = _compressed(items, users, len(item_ids), ratings, watched)
+    return arrays
+
+class RatingStore:
+    """
+    Ratings as CSR (by user) and CSC (by item) arrays with dense ID maps.
+
+    Stores built for a dataset version live on disk and are memory-mapped, so
+    every recommender and process reads the same pages; a user's or item's
+    ratings are slices of those arrays, never copies of the table.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], version: Optional[str] = None):
+        """
+        Args:
+            arrays (dict): Arrays from build_store_arrays (or memory-mapped files)
+            version (str): Dataset version the store was built for
+        """
+        for name in STORE_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.version = version
+        self.n_users = len(self.user_ids)
+        self.n_items = len(self.item_ids)
+
+    def __len__(self) -> int:
+        return len(self.user_items)
+
+    @classmethod
+    def open(cls, path: str) -> "RatingStore":
+        """Memory-map a store written by save()."""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in STORE_ARRAYS}
+        return cls(arrays, meta.get('version'))
+
+    def save(self, path: str) -> None:
+        """Write the arrays as .npy files; meta.json is written last and marks the store complete."""
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name in STORE_ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(meta_path, "w") as f:
+            json.dump({'version': self.version, 'n_ratings': len(self), 'built_at': time.time()}, f)
+
+    def user_index(self, user_id: int) -> int:
+        """Dense index of a raw user ID, or -1 if unknown."""
+        i = int(np.searchsorted(self.user_ids, user_id))
+        return i if i < self.n_users and self.user_ids[i] == user_id else -1
+
+    def item_index(self, anime_id: int) -> int:
+        """Dense index of a raw anime ID, or -1 if unknown."""
+        i = int(np.searchsorted(self.item_ids, anime_id))
+        return i if i < self.n_items and self.item_ids[i] == anime_id else -1
+
+    def user_bounds(self, user_id: int) -> Tuple[int, int]:
+        """Range [start, end) of a user's entries in the CSR arrays (empty if unknown)."""
+        u = self.user_index(user_id)
+        if u < 0:
+            # Unknown user: an empty range at the position it would sort to
+            position = int(self.user_indptr[np.searchsorted(self.user_ids, user_id)])
+            return position, position
+        return int(self.user_indptr[u]), int(self.user_indptr[u + 1])
+
+    def items_of(self, user_id: int, include_watched: bool = True) -> np.ndarray:
+        """Raw anime IDs a user rated (and, by default, watched without rating)."""
+        start, end = self.user_bounds(user_id)
+        items = self.user_items[start:end]
+        if not include_watched:
+            items = items[~self.user_watched[start:end]]
+        return self.item_ids[items]
+
+    def users_of(self, anime_id: int, include_watched: bool = True) -> np.ndarray:
+        """Raw user IDs who rated (and, by default, watched) an anime."""
+        i = self.item_index(anime_id)
+        if i < 0:
+            return self.user_ids[:0]
+        start, end = int(self.item_indptr[i]), int(self.item_indptr[i + 1])
+        users = self.item_users[start:end]
+        if not include_watched:
+            users = users[~self.item_watched[start:end]]
+        return self.user_ids[users]
+
+    def rows(self, positions: np.ndarray) -> pd.DataFrame:
+        """
+        Ratings at CSR positions as a (user_id, anime_id, rating) frame.
+
+        Watched-only entries come back with rating -1, as in the CSV.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        users = np.searchsorted(self.user_indptr, positions, side='right') - 1
+        ratings = np.where(self.user_watched[positions], -1, self.user_ratings[positions]).astype(np.int8)
+        return pd.DataFrame({
+            'user_id': self.user_ids[users],
+            'anime_id': self.item_ids[self.user_items[positions]],
+            'rating': ratings
+        })
+
+    def user_rows(self, user_id: int) -> pd.DataFrame:
+        """A user's ratings as a frame."""
+        start, end = self.user_bounds(user_id)
+        return self.rows(np.arange(start, end))
+
+    def sample_with_users(self, user_ids, sample_size: int, random_state: Optional[int] = None) -> pd.DataFrame:
+        """
+        All ratings of the given users plus a uniform sample of other users'
+        ratings, sample_size rows in total.
+
+        Positions are drawn among the rows outside the users' CSR ranges and
+        shifted past each range in turn, so no mask over the table is built.
+        """
+        bounds = sorted(self.user_bounds(user_id) for user_id in np.unique(user_ids))
+        own = [np.arange(start, end) for start, end in bounds]
+        n_own = sum(end - start for start, end in bounds)
+        n_others = len(self) - n_own
+        n = min(max(sample_size - n_own, 0), n_others)
+
+        rng = np.random.default_rng(random_state)
+        others = rng.choice(n_others, size=n, replace=False) if n > 0 else np.array([], dtype=np.int64)
+        others.sort()
+        for start, end in bounds:
+            others[others >= start] += end - start
+        return self.rows(np.concatenate(own + [others]))
+
+    def sample_with_user(self, user_id: int, sample_size: int, random_state: Optional[int] = None) -> pd.DataFrame:
+        """All of the user's ratings plus other users' ratings, sample_size rows in total."""
+        return self.sample_with_users([user_id], sample_size, random_state)
+
+    def to_csr(self) -> sparse.csr_matrix:
+        """Users x items matrix over the store's arrays (no copy); watched-only entries are 0."""
+        return sparse.csr_matrix(
+            (self.user_ratings, self.user_items, self.user_indptr),
+            shape=(self.n_users, self.n_items), copy=False
+        )
+
+    def to_csc(self) -> sparse.csc_matrix:
+        """Users x items matrix in item-major layout (no copy); watched-only entries are 0."""
+        return sparse.csc_matrix(
+            (self.item_ratings, self.item_users, self.item_indptr),
+            shape=(self.n_users, self.n_items), copy=False
+        )
+
+# Stores per ratings DataFrame / dataset version; the DataFrame is kept so an id is never reused
+_STORES = {}
+_STORES_MAX = 4
+_STORES_LOCK = threading.Lock()
+
+def get_rating_store(
+    ratings_df: pd.DataFrame,
+    dataset_version: Optional[str] = None,
+    store_dir: str = DEFAULT_STORE_DIR
+) -> RatingStore:
+    """
+    The rating store for a ratings DataFrame, built once.
+
+    With a dataset_version (e.g. src.result_cache.dataset_fingerprint of the
+    ratings file) the store is saved under store_dir and memory-mapped, so
+    other processes and later runs reuse it. Without one it is kept in memory.
+    """
+    key = (id(ratings_df), dataset_version)
+    with _STORES_LOCK:
+        entry = _STORES.get(key)
+        if entry is not None and entry[0] is ratings_df and len(entry[1]) == len(ratings_df):
+            return entry[1]
+
+    if dataset_version is None:
+        store = RatingStore(build_store_arrays(ratings_df))
+    else:
+        path = os.path.join(store_dir, hashlib.md5(dataset_version.encode()).hexdigest()[:16])
+        meta_path = os.path.join(path, "meta.json")
+        os.makedirs(path, exist_ok=True)
+        with file_lock(meta_path):
+            store = None
+            if os.path.exists(meta_path):
+                store = RatingStore.open(path)
+                if store.version != dataset_version or len(store) != len(ratings_df):
+                    store = None
+            if store is None:
+                start_time = time.time()
+                RatingStore(build_store_arrays(ratings_df), dataset_version).save(path)
+                store = RatingStore.open(path)
+                print(f"Built rating store in {time.time() - start_time:.2f} seconds")
+
+    with _STORES_LOCK:
+        _STORES[key] = (ratings_df, store)
+        while len(_STORES) > _STORES_MAX:
+            _STORES.pop(next(iter(_STORES)))
+    return store
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+def dataset_fingerprint(*paths: str) -> str:
+    """
+    Cheap version identifier for a set of data files.
+
+    Built from each file's path, size and modification time, so it changes
+    whenever a file is replaced or edited without reading any contents.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except OSError:
+            digest.update(f"{os.path.abspath(path)}:missing;".encode())
+    return digest.hexdigest()[:16]
+
+class RecommendationCache:
+    """
+    Thread-safe LRU + TTL cache of recommendation results.
+
+    Keys are built from the request (user, selection, rounded weights) and the
+    dataset and model versions, so no DataFrame is ever hashed. One instance is
+    shared by every session in the process (see RESULT_CACHE).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0,
+                 max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            max_entries (int): Maximum number of cached results
+            ttl_seconds (float): Seconds a result stays valid
+            max_bytes (int): Maximum total size of cached results
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, result)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(
+        user_id: int,
+        selected_anime: List[str],
+        weights: Tuple[float, ...],
+        dataset_version: str,
+        model_version: str,
+        ndigits: int = 2,
+        filters: Tuple = ()
+    ) -> Tuple:
+        """Build a cache key; the selection order and tiny weight differences don't matter.
+
+        filters is a hashable form of the active filters (src.filters.filters_key).
+        """
+        return (
+            int(user_id),
+            tuple(sorted(selected_anime)),
+            tuple(round(float(w), ndigits) for w in weights),
+            dataset_version,
+            model_version,
+            filters
+        )
+
+    def get(self, key: Tuple) -> Optional[pd.DataFrame]:
+        """Return a copy of the cached result, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _, result = entry
+            if expires_at < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Callers add columns to the frame they get, so never hand out the cached one
+        return result.copy()
+
+    def put(self, key: Tuple, result: pd.DataFrame) -> None:
+        """Store a result, evicting least recently used entries to stay within limits."""
+        size = int(result.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl_seconds, size, result.copy())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every cached result."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current size."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def _remove(self, key: Tuple) -> None:
+        # Caller holds the lock
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+# Shared by every session in the process
+RESULT_CACHE = RecommendationCache()
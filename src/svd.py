@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 from surprise import Dataset, Reader, SVD
 from surprise.model_selection import train_test_split, cross_validate
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import pickle
 import os
 
@@ -121,12 +121,13 @@ class SVDRecSys:
         # Recreate trainset for predictions
         self.prepare_data()
 
-def train_svd_model(ratings_df: pd.DataFrame) -> SVD:
+def train_svd_model(ratings_df: pd.DataFrame, sample_size: Optional[int] = 5000) -> SVD:
     """
     Train an SVD model on the ratings data.
     
     Args:
         ratings_df (pd.DataFrame): DataFrame containing user ratings
+        sample_size (int): Ratings to train on (None: all of them)
         
     Returns:
         SVD: Trained SVD model
@@ -135,8 +136,7 @@ def train_svd_model(ratings_df: pd.DataFrame) -> SVD:
     filtered_ratings = ratings_df[ratings_df['rating'] != -1].copy()
     
     # For large datasets, take a sample to speed up training
-    sample_size = min(5000, len(filtered_ratings))
-    if len(filtered_ratings) > sample_size:
+    if sample_size is not None and len(filtered_ratings) > sample_size:
         filtered_ratings = filtered_ratings.sample(sample_size, random_state=42)
     
     # Create Surprise reader and dataset
@@ -164,7 +164,9 @@ def get_svd_recommendations(
     model: SVD,
     user_id: int,
     anime_df: pd.DataFrame,
-    top_n: int = 10
+    top_n: int = 10,
+    max_candidates: int = 5000,
+    candidate_ids: Optional[np.ndarray] = None
 ) -> pd.DataFrame:
     """
     Get recommendations for a user using the trained SVD model.
@@ -174,21 +176,30 @@ def get_svd_recommendations(
         user_id (int): User ID to get recommendations for
         anime_df (pd.DataFrame): DataFrame containing anime information
         top_n (int): Number of recommendations to return
+        max_candidates (int): Maximum number of anime to score
+        candidate_ids (np.ndarray): Score only these anime (from a retrieval stage)
         
     Returns:
         pd.DataFrame: DataFrame containing top N recommendations
     """
-    # Get all anime IDs
-    all_anime_ids = anime_df['anime_id'].unique()
+    # Get all anime IDs, or the ones retrieved for this request
+    if candidate_ids is not None:
+        all_anime_ids = np.asarray(candidate_ids)
+    else:
+        all_anime_ids = anime_df['anime_id'].unique()
     
-    # For faster predictions, limit to a maximum of 5000 anime
-    if len(all_anime_ids) > 5000:
-        # Include some of the most popular anime
-        popular_anime = anime_df.nlargest(1000, 'members')['anime_id'].values
+    # For faster predictions, limit to a maximum of max_candidates anime
+    if candidate_ids is not None:
+        all_anime_ids = all_anime_ids[:max_candidates]
+    elif len(all_anime_ids) > max_candidates:
+        # Include some of the most popular anime (a fifth of the candidates)
+        popular_anime = anime_df.nlargest(max_candidates // 5, 'members')['anime_id'].values
         
         # Take a random sample for the rest
         remaining_anime = np.setdiff1d(all_anime_ids, popular_anime)
-        random_sample = np.random.choice(remaining_anime, 4000, replace=False)
+        random_sample = np.random.choice(
+            remaining_anime, max_candidates - len(popular_anime), replace=False
+        )
         
         all_anime_ids = np.concatenate([popular_anime, random_sample])
     
@@ -219,3 +230,102 @@ def get_svd_recommendations(
     )
     
     return recommendations
+
+def fold_in_users(model: SVD, user_ratings: Dict[int, pd.DataFrame]) -> Dict[int, Tuple[float, np.ndarray]]:
+    """
+    Bias and factors for users the model was not trained on, from their own ratings.
+    
+    With the item biases and factors fixed, the SVD objective for one user is a
+    ridge regression (Surprise regularizes per rating, so the penalty grows with
+    the user's number of ratings), solved in closed form without retraining.
+    
+    Args:
+        model (SVD): Trained SVD model
+        user_ratings (dict): Raw user ID -> that user's ratings (user_id, anime_id, rating)
+        
+    Returns:
+        dict: Raw user ID -> (bias, factors), for users unknown to the model
+            with at least one rating of an anime it knows
+    """
+    trainset = model.trainset
+    n_factors = model.pu.shape[1]
+    penalty = np.array([model.reg_bu] + [model.reg_pu] * n_factors)
+    
+    folded = {}
+    for user_id, ratings in user_ratings.items():
+        try:
+            trainset.to_inner_uid(user_id)
+            continue  # trained on, has its own factors
+        except ValueError:
+            pass
+        rated = ratings[ratings['rating'] != -1]
+        pairs = [(trainset.to_inner_iid(anime_id), rating)
+                 for anime_id, rating in zip(rated['anime_id'].values, rated['rating'].values)
+                 if trainset.knows_item_raw(anime_id)]
+        if not pairs:
+            continue
+        inner, values = map(np.array, zip(*pairs))
+        features = np.hstack([np.ones((len(inner), 1)), model.qi[inner]])
+        targets = values - trainset.global_mean - model.bi[inner]
+        solution = np.linalg.solve(
+            features.T @ features + np.diag(penalty * len(inner)), features.T @ targets
+        )
+        folded[int(user_id)] = (float(solution[0]), solution[1:])
+    return folded
+
+def svd_score_matrix(
+    model: SVD,
+    user_ids: np.ndarray,
+    anime_ids: np.ndarray,
+    folded_users: Optional[Dict[int, Tuple[float, np.ndarray]]] = None
+) -> np.ndarray:
+    """
+    Predict ratings for every (user, anime) pair at once.
+    
+    Equivalent to calling model.predict(user_id, anime_id).est for each pair,
+    but computed as one matrix product against the item factors.
+    
+    Args:
+        model (SVD): Trained SVD model
+        user_ids (np.ndarray): Raw user IDs (rows)
+        anime_ids (np.ndarray): Raw anime IDs (columns)
+        folded_users (dict): Bias and factors of users the model was not
+            trained on, from fold_in_users
+        
+    Returns:
+        np.ndarray: (len(user_ids), len(anime_ids)) predicted ratings
+    """
+    trainset = model.trainset
+    n_factors = model.pu.shape[1]
+    
+    def inner_ids(raw_ids, to_inner):
+        inner = np.full(len(raw_ids), -1, dtype=np.int64)
+        for i, raw_id in enumerate(raw_ids):
+            try:
+                inner[i] = to_inner(raw_id)
+            except ValueError:
+                continue
+        return inner
+    
+    user_inner = inner_ids(user_ids, trainset.to_inner_uid)
+    anime_inner = inner_ids(anime_ids, trainset.to_inner_iid)
+    known_users = user_inner >= 0
+    known_anime = anime_inner >= 0
+    
+    # Unknown users and anime contribute zero bias and zero factors
+    bu = np.where(known_users, model.bu[user_inner], 0.0)
+    bi = np.where(known_anime, model.bi[anime_inner], 0.0)
+    pu = np.zeros((len(user_ids), n_factors))
+    pu[known_users] = model.pu[user_inner[known_users]]
+    qi = np.zeros((len(anime_ids), n_factors))
+    qi[known_anime] = model.qi[anime_inner[known_anime]]
+    
+    for row in np.flatnonzero(~known_users):
+        folded = (folded_users or {}).get(int(user_ids[row]))
+        if folded is not None:
+            bu[row], pu[row] = folded
+    
+    scores = trainset.global_mean + bu[:, None] + bi[None, :] + pu @ qi.T
+    
+    lower, upper = trainset.rating_scale
+    return np.clip(scores, lower, upper)
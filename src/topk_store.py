@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from utils.title_index import get_title_index
+
+# Component score columns, in storage order
+COMPONENTS = ['predicted_rating', 'neural_score', 'content_score']
+
+DEFAULT_STORE_PATH = "cache/topk"
+
+def _history_seeds(ratings_df: pd.DataFrame, anime_df: pd.DataFrame, n_seeds: int) -> pd.Series:
+    """Each user's highest rated titles, used as the content selection offline."""
+    rated = ratings_df[ratings_df['rating'] != -1]
+    rated = rated.sort_values(['user_id', 'rating'], ascending=[True, False])
+    rated = rated.groupby('user_id').head(n_seeds)
+    rated = rated.merge(anime_df[['anime_id', 'name']], on='anime_id')
+    return rated.groupby('user_id')['name'].apply(list)
+
+def build_topk_store(
+    ratings_df: pd.DataFrame,
+    anime_df: pd.DataFrame,
+    path: str = DEFAULT_STORE_PATH,
+    user_ids: Optional[List[int]] = None,
+    k: int = 100,
+    n_seeds: int = 5,
+    alpha: float = 0.4,
+    beta: float = 0.3,
+    gamma: float = 0.3
+) -> int:
+    """
+    Precompute every user's top-k fused candidates and component scores.
+
+    The content component is seeded with each user's highest rated titles. k
+    should be comfortably larger than the number of recommendations served, so
+    that re-weighting at serving time still has good candidates to choose from.
+
+    Files written to path:
+        users.npy      sorted user IDs
+        slots.npy      user_id -> row in the arrays below, -1 if absent
+        anime_ids.npy  (n_users, k) int32 candidate anime IDs, -1 padded
+        scores.npy     (n_users, k, 3) float32 normalized component scores
+        meta.json      k, component names and build time
+
+    Args:
+        ratings_df (pd.DataFrame): DataFrame with user ratings
+        anime_df (pd.DataFrame): DataFrame with anime information
+        path (str): Output directory
+        user_ids (list): Users to precompute (default: every user with ratings)
+        k (int): Candidates kept per user
+        n_seeds (int): History titles used as the content selection
+        alpha (float): SVD weight used to rank candidates
+        beta (float): Neural weight used to rank candidates
+        gamma (float): Content weight used to rank candidates
+
+    Returns:
+        int: Number of users written
+    """
+    # Imported here so that serving does not pull in the model libraries
+    from .hybrid import hybrid_recommend_batch
+
+    start_time = time.time()
+    seeds = _history_seeds(ratings_df, anime_df, n_seeds)
+    if user_ids is None:
+        user_ids = ratings_df['user_id'].unique()
+    users = np.unique(np.asarray(user_ids, dtype=np.int64))
+
+    requests = [(int(user_id), seeds.get(user_id, [])) for user_id in users]
+    results = hybrid_recommend_batch(
+        requests, ratings_df, anime_df, top_n=k, alpha=alpha, beta=beta, gamma=gamma
+    )
+
+    os.makedirs(path, exist_ok=True)
+    anime_ids = np.lib.format.open_memmap(
+        os.path.join(path, "anime_ids.npy"), mode='w+', dtype=np.int32, shape=(len(users), k)
+    )
+    scores = np.lib.format.open_memmap(
+        os.path.join(path, "scores.npy"), mode='w+', dtype=np.float32,
+        shape=(len(users), k, len(COMPONENTS))
+    )
+    anime_ids[:] = -1
+    scores[:] = 0.0
+
+    # Requests were built in user order, so request index == row
+    rows = results['request'].values
+    ranks = results['rank'].values - 1
+    anime_ids[rows, ranks] = results['anime_id'].values
+    scores[rows, ranks] = results[COMPONENTS].values
+    anime_ids.flush()
+    scores.flush()
+
+    # Dense user_id -> row map for O(1) lookups
+    slots = np.full(int(users.max()) + 1 if len(users) else 0, -1, dtype=np.int32)
+    slots[users] = np.arange(len(users), dtype=np.int32)
+    np.save(os.path.join(path, "users.npy"), users)
+    np.save(os.path.join(path, "slots.npy"), slots)
+
+    with open(os.path.join(path, "meta.json"), 'w') as f:
+        json.dump({
+            'k': k,
+            'components': COMPONENTS,
+            'n_users': int(len(users)),
+            'built_at': time.time()
+        }, f, indent=2)
+
+    print(f"Top-{k} store for {len(users)} users written to {path} in {time.time() - start_time:.2f} seconds")
+    return len(users)
+
+class TopKStore:
+    """
+    Read-only, memory-mapped view of a store written by build_topk_store.
+
+    Serving a user is an array lookup plus a re-weighting of their k stored
+    candidates. The content component is re-scored against the current
+    selection over those k candidates only, so the models never run.
+    """
+
+    def __init__(self, path: str, anime_df: pd.DataFrame):
+        """
+        Args:
+            path (str): Directory written by build_topk_store
+            anime_df (pd.DataFrame): DataFrame with anime information
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.slots = np.load(os.path.join(path, "slots.npy"), mmap_mode='r')
+        self.anime_ids = np.load(os.path.join(path, "anime_ids.npy"), mmap_mode='r')
+        self.scores = np.load(os.path.join(path, "scores.npy"), mmap_mode='r')
+
+        # Genre vectors for re-scoring the content component
+        self.anime_df = anime_df.reset_index(drop=True)
+        self._positions = pd.Series(self.anime_df.index, index=self.anime_df['anime_id'])
+        self._positions = self._positions[~self._positions.index.duplicated()]
+        tfidf = TfidfVectorizer(stop_words='english')
+        self._genre_matrix = tfidf.fit_transform(self.anime_df['genre'].fillna(''))
+
+    @classmethod
+    def open(cls, anime_df: pd.DataFrame, path: str = DEFAULT_STORE_PATH) -> Optional['TopKStore']:
+        """Open the store at path, or return None if it has not been built."""
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return cls(path, anime_df)
+
+    def __contains__(self, user_id: int) -> bool:
+        return 0 <= user_id < len(self.slots) and self.slots[user_id] >= 0
+
+    def _content_scores(self, anime_ids: np.ndarray, selected_anime: List[str]) -> Optional[np.ndarray]:
+        """Mean genre similarity of the candidates to the selected anime."""
+        selected = get_title_index(self.anime_df).positions(selected_anime)
+        if len(selected) == 0:
+            return None
+        positions = self._positions.reindex(anime_ids).values
+        known = ~np.isnan(positions)
+        scores = np.zeros(len(anime_ids))
+        similarity = self._genre_matrix[positions[known].astype(int)] @ self._genre_matrix[selected].T
+        scores[known] = np.asarray(similarity.mean(axis=1)).ravel()
+        return scores
+
+    def recommend(
+        self,
+        user_id: int,
+        selected_anime: Optional[List[str]] = None,
+        alpha: float = 0.4,
+        beta: float = 0.3,
+        gamma: float = 0.3,
+        top_n: int = 10,
+        allowed_ids: Optional[np.ndarray] = None
+    ) -> Optional[pd.DataFrame]:
+        """
+        Re-weight a user's precomputed candidates.
+
+        Args:
+            user_id (int): User ID
+            selected_anime (list): Current selection; re-scores the content
+                component and is excluded from the results
+            alpha (float): Weight for SVD
+            beta (float): Weight for neural network
+            gamma (float): Weight for content-based
+            top_n (int): Number of recommendations to return
+            allowed_ids (np.ndarray): Keep only these anime (e.g. from src/filters.py)
+
+        Returns:
+            pd.DataFrame or None: Recommendations in hybrid_recommend's format,
+                or None if the user is not in the store or fewer than top_n of
+                the stored candidates pass allowed_ids
+        """
+        if user_id not in self:
+            return None
+
+        row = self.slots[user_id]
+        valid = self.anime_ids[row] >= 0
+        if allowed_ids is not None:
+            valid &= np.isin(self.anime_ids[row], allowed_ids)
+            if valid.sum() < top_n:
+                return None
+        anime_ids = np.asarray(self.anime_ids[row][valid])
+        components = np.array(self.scores[row][valid], dtype=np.float64)
+
+        if selected_anime:
+            content = self._content_scores(anime_ids, selected_anime)
+            if content is not None:
+                low, high = content.min(), content.max()
+                components[:, 2] = (content - low) / (high - low) if high > low else content
+
+        # Components the user has no scores for give their weight to the others
+        weights = np.array([alpha, beta, gamma])
+        weights[~components.any(axis=0)] = 0.0
+        if weights.sum() > 0:
+            weights = weights / weights.sum()
+
+        recs = pd.DataFrame(components, columns=COMPONENTS)
+        recs.insert(0, 'anime_id', anime_ids)
+        recs['final_score'] = components @ weights
+
+        recs = recs.merge(
+            self.anime_df[['anime_id', 'name', 'genre', 'type', 'rating']],
+            on='anime_id'
+        )
+        if selected_anime:
+            selected = get_title_index(self.anime_df).positions(selected_anime)
+            recs = recs[~recs['anime_id'].isin(self.anime_df['anime_id'].values[selected])]
+
+        return recs.sort_values('final_score', ascending=False).head(top_n).reset_index(drop=True)
+
+def main():
+    """Build the top-K store from the data directory."""
+    parser = argparse.ArgumentParser(description="Precompute top-K recommendations for KawaiiRecSys")
+    parser.add_argument("-o", "--out", default=DEFAULT_STORE_PATH, help="Output directory")
+    parser.add_argument("-k", type=int, default=100, help="Candidates kept per user")
+    parser.add_argument("--seeds", type=int, default=5,
+                        help="Highest rated titles used as each user's content selection")
+    args = parser.parse_args()
+
+    from utils.helpers import load_anime_data
+    from utils.data_cache import load_table, RATINGS_SCHEMA
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ratings_df = load_table(os.path.join(project_root, "data/ratings.csv"), RATINGS_SCHEMA)
+    build_topk_store(ratings_df, load_anime_data(), args.out, k=args.k, n_seeds=args.seeds)
+
+if __name__ == "__main__":
+    main()
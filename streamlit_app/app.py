@@ -13,13 +13,21 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
 # Import from our new modular structure
-from src.hybrid import hybrid_recommend, profiled_hybrid_recommend
+from src.hybrid import hybrid_recommend, profiled_hybrid_recommend, MODEL_VERSION
+from src.topk_store import TopKStore
+from src.result_cache import RESULT_CACHE
+from src.dataset import load_dataset
+from src.event_log import (
+    EventLog, start_compactor, EVENT_FAVORITE, EVENT_FEEDBACK, EVENT_STATUS, EVENT_WATCHLIST, STATUS_CODES
+)
+from src.filters import catalog_mask, filters_key
 from utils.helpers import (
-    get_anime_image,
+    load_image_cache,
     genre_to_color,
-    load_anime_data,
     get_random_quote
 )
+from utils.image_fetcher import ImageFetcher, start_image_refresher, PLACEHOLDER_IMAGE
+from utils.image_prewarm import ImagePrewarmer
 
 # Streamlit page setup
 st.set_page_config(
@@ -522,50 +530,112 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# Streamlit cache for data loading
-@st.cache_data
-def cached_load_anime_data():
-    return load_anime_data()
+# Log of user events (ratings, feedback, favorites, watchlist, statuses), compacted in the background
+@st.cache_resource
+def get_event_log():
+    event_log = EventLog()
+    start_compactor(event_log)
+    return event_log
+
+# Current version of the data files and compacted ratings (reloaded only when either changes)
+def get_dataset():
+    return load_dataset(os.path.join(project_root, "data"), event_log=get_event_log())
+
+# Precomputed top-K store (built offline with `python -m src.topk_store`), per dataset version
+@st.cache_resource
+def get_topk_store(dataset_version, _catalog):
+    return TopKStore.open(_catalog)
 
-# Streamlit cache for recommendations
-@st.cache_data
-def get_recommendations(user_id, selected_anime, alpha, beta, gamma, ratings_df, anime_df, enable_profiling=False):
+# Process-wide cache for recommendations, keyed on versions instead of DataFrame contents
+def get_recommendations(user_id, selected_anime, alpha, beta, gamma, dataset, enable_profiling=False, filters=None):
+    store = get_topk_store(dataset.version, dataset.catalog)
+    model_version = MODEL_VERSION
+    if store is not None:
+        model_version += f"+topk{store.meta.get('built_at', 0)}"
+    
+    cache_key = RESULT_CACHE.make_key(
+        user_id, selected_anime, (alpha, beta, gamma), dataset.version, model_version,
+        filters=filters_key(filters)
+    )
+    if not enable_profiling:
+        recs = RESULT_CACHE.get(cache_key)
+        if recs is not None:
+            return recs
+    
+    recs = compute_recommendations(
+        user_id, selected_anime, alpha, beta, gamma, dataset, store, enable_profiling, filters
+    )
+    RESULT_CACHE.put(cache_key, recs)
+    return recs
+
+def compute_recommendations(user_id, selected_anime, alpha, beta, gamma, dataset, store, enable_profiling=False, filters=None):
+    # Known users are served from the precomputed store without running the models
+    if store is not None and not enable_profiling:
+        allowed_ids = None
+        if filters:
+            mask = catalog_mask(dataset.catalog, filters, user_id, dataset.ratings, dataset.version)
+            allowed_ids = dataset.catalog['anime_id'].values[mask]
+        recs = store.recommend(user_id, selected_anime, alpha, beta, gamma, top_n=5, allowed_ids=allowed_ids)
+        if recs is not None and not recs.empty:
+            return recs
+    
     if enable_profiling:
         return profiled_hybrid_recommend(
             user_id=user_id,
             selected_anime=selected_anime,
-            ratings_df=ratings_df,
-            anime_df=anime_df,
             top_n=5,
             alpha=alpha,
             beta=beta,
-            gamma=gamma
+            gamma=gamma,
+            filters=filters,
+            dataset=dataset
         )
     else:
         return hybrid_recommend(
             user_id=user_id,
             selected_anime=selected_anime,
-            ratings_df=ratings_df,
-            anime_df=anime_df,
             top_n=5,
             alpha=alpha,
             beta=beta,
-            gamma=gamma
+            gamma=gamma,
+            filters=filters,
+            dataset=dataset
         )
 
-# Load anime data - Pre-load at startup to reduce delay
-anime_df = cached_load_anime_data()
+# Load the dataset - Pre-load at startup to reduce delay
+dataset = get_dataset()
+anime_df = dataset.catalog
 anime_list = anime_df['name'].tolist()
 
-# Pre-load ratings data at startup (cached)
-@st.cache_data
-def load_ratings_data():
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    data_path = os.path.join(project_root, "data/ratings.csv")
-    return pd.read_csv(data_path)
+def record_event(anime_name, event_type, value):
+    """Append a user event for the current user; failures never block the UI."""
+    position = dataset.title_index.first(anime_name)
+    user_id = st.session_state.get('active_user_id')
+    if position is None or user_id is None:
+        return
+    anime_id = int(anime_df['anime_id'].iloc[position])
+    try:
+        get_event_log().append(user_id, anime_id, event_type, value)
+    except OSError as e:
+        print(f"Failed to record event: {e}")
+
+# Card images: cached ones are shown at once, cold ones are fetched concurrently
+# and show a placeholder if they are not back within IMAGE_WAIT_SECONDS
+IMAGE_WAIT_SECONDS = 1.5
+
+@st.cache_resource
+def get_image_fetcher():
+    fetcher = ImageFetcher(load_image_cache())
+    # Retries failed lookups after their backoff and refreshes old images
+    start_image_refresher(fetcher)
+    return fetcher
 
-# Load ratings data at startup
-ratings_df = load_ratings_data()
+# Fills the image cache for the most popular titles in the background (resumes across restarts)
+@st.cache_resource
+def get_image_prewarmer(dataset_version, _catalog):
+    prewarmer = ImagePrewarmer(_catalog, load_image_cache())
+    prewarmer.start()
+    return prewarmer
 
 # Function to handle feedback clicks without using nested columns
 def handle_feedback(anime_name, feedback_type):
@@ -573,6 +643,7 @@ def handle_feedback(anime_name, feedback_type):
         st.session_state.feedback = {}
     
     st.session_state.feedback[anime_name] = feedback_type
+    record_event(anime_name, EVENT_FEEDBACK, 1 if feedback_type == "like" else -1)
     st.toast(f"You {feedback_type}d {anime_name}!")
 
 # Netflix-style recommendation display
@@ -581,7 +652,9 @@ def show_netflix_style_recommendations(df, explanations=None):
         st.warning("No recommendations found. Try different settings or anime selections.")
         return
         
-    df["image_url"] = df["name"].apply(get_anime_image)
+    anime_ids = df["anime_id"] if "anime_id" in df.columns else [None] * len(df)
+    image_urls = get_image_fetcher().resolve(list(zip(df["name"], anime_ids)), wait_seconds=IMAGE_WAIT_SECONDS)
+    df["image_url"] = [url or PLACEHOLDER_IMAGE for url in image_urls]
     
     # Create columns for each recommendation
     cols = st.columns(len(df))
@@ -628,6 +701,7 @@ def show_netflix_style_recommendations(df, explanations=None):
                     else:
                         st.session_state.watchlist.add(anime_name)
                         st.toast(f"Added {anime_name} to watchlist")
+                    record_event(anime_name, EVENT_WATCHLIST, int(anime_name in st.session_state.watchlist))
                     save_user_data()  # Auto-save
                     st.rerun()
             
@@ -641,6 +715,7 @@ def show_netflix_style_recommendations(df, explanations=None):
                     else:
                         st.session_state.favorites.add(anime_name)
                         st.toast(f"Added {anime_name} to favorites")
+                    record_event(anime_name, EVENT_FAVORITE, int(anime_name in st.session_state.favorites))
                     save_user_data()  # Auto-save
                     st.rerun()
             
@@ -665,9 +740,20 @@ def show_netflix_style_recommendations(df, explanations=None):
                     status_names = {"none": "No status", "plan_to_watch": "Plan to Watch", 
                                   "watching": "Currently Watching", "completed": "Completed"}
                     st.toast(f"{anime_name}: {status_names[new_status]}")
+                    record_event(anime_name, EVENT_STATUS, STATUS_CODES[new_status])
                     save_user_data()  # Auto-save
                     st.rerun()
-            
+
+            # Like/dislike feedback
+            feedback = st.session_state.get('feedback', {}).get(anime_name)
+            like_col, dislike_col = st.columns(2)
+            with like_col:
+                if st.button("👍", key=f"like_{idx}", help="Like", disabled=feedback == "like"):
+                    handle_feedback(anime_name, "like")
+            with dislike_col:
+                if st.button("👎", key=f"dislike_{idx}", help="Dislike", disabled=feedback == "dislike"):
+                    handle_feedback(anime_name, "dislike")
+
             # Enhanced explanation with better styling
             if explanations and idx < len(explanations):
                 st.markdown(f"""
@@ -1191,6 +1277,7 @@ c1, c2, c3, c4, c5, c6, c7 = st.columns([0.6, 2.1, 0.8, 0.8, 0.8, 1.1, 0.8])
 
 with c1:
     user_id = st.number_input("User ID", min_value=1, max_value=10000, value=42, label_visibility="collapsed")
+    st.session_state.active_user_id = int(user_id)
     st.caption("User ID")
 
 with c2:
@@ -1228,7 +1315,7 @@ with c7:
     with list_col:
         if st.button("📚", help="View Watchlist"):
             if st.session_state.watchlist:
-                watchlist_anime = anime_df[anime_df['name'].isin(st.session_state.watchlist)]
+                watchlist_anime = anime_df.iloc[dataset.title_index.positions(st.session_state.watchlist)]
                 if not watchlist_anime.empty:
                     watchlist_recs = []
                     for _, anime in watchlist_anime.iterrows():
@@ -1253,8 +1340,9 @@ if st.session_state.recommending:
     
     # Get recommendations
     st.session_state.recommendations = get_recommendations(
-        user_id, selected_anime, alpha, beta, gamma, ratings_df, anime_df, 
-        enable_profiling=st.session_state.profiling
+        user_id, selected_anime, alpha, beta, gamma, dataset, 
+        enable_profiling=st.session_state.profiling,
+        filters=st.session_state.active_filters
     )
     
     # Create explanations
@@ -1447,6 +1535,12 @@ if st.session_state.watchlist or st.session_state.favorites or st.session_state.
     else:
         st.caption("⚠️ Data not yet saved to disk")
 
+# Image prewarm progress
+prewarm = get_image_prewarmer(dataset.version, anime_df).progress()
+if prewarm['running']:
+    st.caption(f"🖼️ Prewarming posters: {prewarm['position']}/{prewarm['total']} titles checked, "
+               f"{prewarm['fetched']} fetched")
+
 # Footer with random anime quote (more compact)
 quote = get_random_quote()
 st.markdown(f'<div class="quote-footer">"{quote}"</div>', unsafe_allow_html=True)
@@ -0,0 +1,39 @@
+import pytest
+
+from src.event_log import EventLog, EVENT_FEEDBACK, EVENT_RATING
+
+@pytest.fixture
+def event_log(tmp_path):
+    return EventLog(str(tmp_path / "events"), fsync=False)
+
+def test_delta_reads_events_after_a_position(event_log):
+    start = event_log.position()
+    event_log.append(1, 20, EVENT_RATING, 9)
+    event_log.append(1, 20, EVENT_FEEDBACK, 1)
+
+    events, end, complete = event_log.delta(start)
+    assert complete
+    assert list(events['event_type']) == [EVENT_RATING, EVENT_FEEDBACK]
+
+    event_log.append(2, 20, EVENT_RATING, 3)
+    events, _, complete = event_log.delta(end)
+    assert complete
+    assert list(events['user_id']) == [2]
+
+def test_compaction_keeps_latest_rating_and_bumps_generation(event_log):
+    assert event_log.compact() == 0
+    assert event_log.generation() == 0
+
+    event_log.append(1, 20, EVENT_RATING, 4, timestamp_ms=1)
+    event_log.append(1, 20, EVENT_RATING, 9, timestamp_ms=2)
+    event_log.append(1, 20, EVENT_FEEDBACK, 1, timestamp_ms=3)
+    assert event_log.compact() == 3
+    assert event_log.pending_count() == 0
+
+    generation, ratings = event_log.compacted_ratings()
+    assert generation == 1
+    assert ratings.to_dict('records') == [{'user_id': 1, 'anime_id': 20, 'rating': 9}]
+
+    # Nothing pending: no new generation
+    assert event_log.compact() == 0
+    assert event_log.generation() == 1
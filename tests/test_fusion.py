@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.fusion import fuse_sort, fuse_threshold
+
+COLUMNS = ['predicted_rating', 'neural_score', 'content_score']
+
+def component_frames(seed, n_items=200, size=60):
+    """Overlapping component lists, like the stages return (2 * top_n rows each)."""
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for col, low, high in (('predicted_rating', 1.0, 10.0), ('neural_score', 0.0, 1.0),
+                           ('content_score', 0.0, 1.0)):
+        anime_ids = rng.choice(n_items, size=size, replace=False)
+        frames[col] = pd.DataFrame({'anime_id': anime_ids, col: rng.uniform(low, high, size)})
+    return frames
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("weights", [(0.4, 0.3, 0.3), (0.6, 0.0, 0.4), (0.0, 0.5, 0.5)])
+def test_threshold_ranks_like_sort(seed, weights):
+    frames = component_frames(seed)
+    weights = dict(zip(COLUMNS, weights))
+
+    by_sort = fuse_sort(frames, weights, 10).reset_index(drop=True)
+    by_threshold, examined = fuse_threshold(frames, weights, 10)
+
+    assert by_threshold['anime_id'].tolist() == by_sort['anime_id'].tolist()
+    for col in COLUMNS + ['final_score']:
+        np.testing.assert_allclose(by_threshold[col].values, by_sort[col].values)
+    assert examined <= len(set().union(*(f['anime_id'] for f in frames.values())))
+
+def test_missing_component_scores_count_as_zero_before_normalizing():
+    frames = {
+        'predicted_rating': pd.DataFrame({'anime_id': [1, 2], 'predicted_rating': [8.0, 6.0]}),
+        'content_score': pd.DataFrame({'anime_id': [3], 'content_score': [0.5]}),
+        'neural_score': pd.DataFrame()
+    }
+    weights = {'predicted_rating': 0.6, 'neural_score': 0.0, 'content_score': 0.4}
+
+    by_threshold, _ = fuse_threshold(frames, weights, 3)
+    by_sort = fuse_sort(frames, weights, 3).reset_index(drop=True)
+
+    # Ratings normalize over [0, 8] (item 3 has none), not over their own [6, 8]
+    assert by_sort['predicted_rating'].tolist() == [1.0, 0.75, 0.0]
+    assert by_threshold['anime_id'].tolist() == by_sort['anime_id'].tolist() == [1, 2, 3]
+    np.testing.assert_allclose(by_threshold['final_score'].values, by_sort['final_score'].values)
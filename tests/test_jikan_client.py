@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from utils import jikan_api
+from utils.image_cache import ImageCache
+from utils.image_fetcher import ImageFetcher
+from utils.jikan_api import JikanCache, JikanClient
+from utils.jikan_stub import start_stub_server
+
+# Two titles from data/anime.csv
+FMA_BROTHERHOOD = 5114
+STEINS_GATE = 9253
+
+@pytest.fixture
+def stub():
+    """The Jikan stub allowing one request per second."""
+    server, base_url = start_stub_server(rate_limit=1)
+    yield server, base_url
+    server.shutdown()
+
+@pytest.fixture
+def jikan_cache(tmp_path):
+    return JikanCache(str(tmp_path / "jikan_cache.sqlite3"))
+
+def make_client(base_url, cache, **options):
+    options.setdefault('backoff', 0.01)
+    return JikanClient(base_url, cache=cache, limiter=None, **options)
+
+def test_rate_limited_request_is_retried(stub, jikan_cache):
+    server, base_url = stub
+    client = make_client(base_url, jikan_cache)
+
+    first = client.anime(FMA_BROTHERHOOD)
+    started = time.monotonic()
+    # Over the stub's limit: answered with 429 and Retry-After: 1, then retried
+    second = client.anime(STEINS_GATE)
+
+    assert first['mal_id'] == FMA_BROTHERHOOD
+    assert second['mal_id'] == STEINS_GATE
+    assert server.stub.requests == 3
+    assert time.monotonic() - started >= 1.0
+
+def test_rate_limited_request_fails_without_retries(stub, jikan_cache):
+    server, base_url = stub
+    client = make_client(base_url, jikan_cache, max_retries=0)
+
+    assert client.anime(FMA_BROTHERHOOD) is not None
+    assert client.anime(STEINS_GATE) is None
+    assert server.stub.requests == 2
+
+def test_stale_payload_is_served_when_jikan_fails(stub, jikan_cache):
+    server, base_url = stub
+    fresh = make_client(base_url, jikan_cache).anime(FMA_BROTHERHOOD)
+    server.shutdown()
+    server.server_close()
+
+    # Every cached payload is stale with ttl=0, and the server is gone
+    client = make_client(base_url, jikan_cache, ttl=0, max_retries=1, timeout=0.5)
+    assert client.anime(FMA_BROTHERHOOD) == fresh
+    assert client.anime(STEINS_GATE) is None
+
+def test_failed_fetches_back_off(tmp_path):
+    cache = ImageCache(str(tmp_path / "image_cache.sqlite3"), negative_ttl=10, negative_ttl_max=25)
+
+    delays = []
+    for _ in range(3):
+        entry = cache.record_failure(STEINS_GATE, "Steins;Gate")
+        delays.append(entry.retry_at - entry.updated_at)
+    assert entry.failures == 3
+    assert entry.url == ''
+    assert delays[0] == pytest.approx(10, abs=1)
+    assert delays[1] == pytest.approx(20, abs=1)
+    assert delays[2] == pytest.approx(25, abs=1)  # doubled to 40, capped
+    assert not cache.is_due(entry)
+    assert cache.is_due(entry, now=entry.retry_at)
+
+    # A URL found earlier survives a failed refresh
+    cache.put(FMA_BROTHERHOOD, "Fullmetal Alchemist: Brotherhood", "https://example.org/fma.jpg")
+    assert cache.record_failure(FMA_BROTHERHOOD, None).url == "https://example.org/fma.jpg"
+
+def test_fetcher_records_failure_for_unknown_anime(stub, jikan_cache, tmp_path, monkeypatch):
+    server, base_url = stub
+    monkeypatch.setattr(jikan_api, "_CLIENT", make_client(base_url, jikan_cache))
+    cache = ImageCache(str(tmp_path / "image_cache.sqlite3"))
+    fetcher = ImageFetcher(cache)
+
+    # The stub answers 404 for an unknown ID and finds nothing for the title
+    url = fetcher.submit("No such anime", 999999999).result(timeout=10)
+
+    entry = cache.get_entry(999999999)
+    assert entry.failures == 1
+    assert not cache.is_due(entry)
+    assert url == fetcher.resolve([("No such anime", 999999999)])[0]
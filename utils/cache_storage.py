@@ -0,0 +1,125 @@
+import os
+import hashlib
+import pickle
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Header of files written by this module: magic + SHA-256 of the payload
+MAGIC = b"KRSCACHE1\n"
+DIGEST_SIZE = hashlib.sha256().digest_size
+
+class CacheIntegrityError(Exception):
+    """A cache file exists but its contents are truncated or corrupted."""
+
+@contextmanager
+def file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """
+    Hold an advisory lock for a cache file across processes.
+
+    The lock is taken on a sibling "{path}.lock" file, so it does not
+    interfere with the atomic rename of the file itself.
+
+    Args:
+        path (str): Cache file to lock
+        shared (bool): Take a shared (reader) lock instead of an exclusive one
+    """
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            # msvcrt has no shared locks; lock the first byte exclusively
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def atomic_write_bytes(path: str, payload: bytes) -> None:
+    """
+    Write payload to path so that readers see either the old or the new file.
+
+    The data (with a checksum header) goes to a temporary file in the same
+    directory, is flushed to disk, and is then renamed over path.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(hashlib.sha256(payload).digest())
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def read_checked_bytes(path: str) -> Optional[bytes]:
+    """
+    Read a file written by atomic_write_bytes and verify its checksum.
+
+    Files without the header (written before this module existed) are
+    returned as they are.
+
+    Returns:
+        bytes or None: The payload, or None if the file does not exist
+
+    Raises:
+        CacheIntegrityError: If the checksum does not match
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if not data.startswith(MAGIC):
+        return data
+
+    header_end = len(MAGIC) + DIGEST_SIZE
+    digest, payload = data[len(MAGIC):header_end], data[header_end:]
+    if len(digest) != DIGEST_SIZE or hashlib.sha256(payload).digest() != digest:
+        raise CacheIntegrityError(f"Checksum mismatch in {path}")
+    return payload
+
+def read_pickle(path: str) -> Optional[Any]:
+    """
+    Load a pickle cache file (checksummed or plain), e.g. the legacy image cache.
+
+    Corrupted files are removed so the next writer replaces them.
+
+    Returns:
+        The unpickled object, or None if the file is missing or corrupted
+    """
+    try:
+        payload = read_checked_bytes(path)
+        if payload is None:
+            return None
+        return pickle.loads(payload)
+    except (CacheIntegrityError, pickle.UnpicklingError, EOFError) as e:
+        print(f"[Cache] Discarding corrupted cache file {path}: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .cache_storage import file_lock
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, "cache/columnar")
+
+# Bump when the on-disk layout changes
+FORMAT_VERSION = 1
+
+# Column types of the known tables: numeric dtypes are downcast, 'category'
+# columns are stored as codes + categories, 'string' columns as plain strings
+ANIME_SCHEMA = {
+    'anime_id': 'int32',
+    'name': 'string',
+    'genre': 'category',
+    'type': 'category',
+    'episodes': 'category',  # numbers, plus 'Unknown' for airing shows
+    'rating': 'float32',
+    'members': 'int32'
+}
+
+RATINGS_SCHEMA = {
+    'user_id': 'int32',
+    'anime_id': 'int32',
+    'rating': 'int8'  # 1-10, or -1 for watched but not rated
+}
+
+def _file_digest(path: str) -> str:
+    """SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _table_dir(csv_path: str, cache_dir: str) -> str:
+    """Cache directory of one CSV file (its name plus a hash of its full path)."""
+    abs_path = os.path.abspath(csv_path)
+    stem = os.path.splitext(os.path.basename(abs_path))[0]
+    return os.path.join(cache_dir, f"{stem}-{hashlib.md5(abs_path.encode()).hexdigest()[:8]}")
+
+def _downcast(series: pd.Series, dtype: str) -> np.ndarray:
+    """
+    Values of a numeric column in the requested dtype.
+
+    Integer columns with missing values become floating point, and values
+    outside the dtype's range keep 64 bits, so nothing is silently wrapped.
+    """
+    values = pd.to_numeric(series, errors='coerce')
+    target = np.dtype(dtype)
+    if np.issubdtype(target, np.integer):
+        if values.isna().any():
+            return values.to_numpy(dtype=np.float32 if target.itemsize <= 2 else np.float64)
+        info = np.iinfo(target)
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            return values.to_numpy(dtype=np.int64)
+    return values.to_numpy(dtype=target)
+
+def _column_kind(series: pd.Series, declared: Optional[str]) -> str:
+    if declared is not None:
+        return declared
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return str(series.dtype)
+    return 'string'
+
+def _write_table(df: pd.DataFrame, table_dir: str, schema: Dict[str, str]) -> list:
+    """Write each column of df to table_dir and return the column descriptions."""
+    columns = []
+    for position, name in enumerate(df.columns):
+        kind = _column_kind(df[name], schema.get(name))
+        column = {'name': name, 'kind': kind, 'file': f"{position}"}
+        if kind == 'category':
+            categorical = pd.Categorical(df[name].astype(object))
+            np.save(os.path.join(table_dir, f"{position}.npy"), categorical.codes)
+            column['categories'] = [str(c) for c in categorical.categories]
+        elif kind == 'string':
+            values = [None if pd.isna(v) else str(v) for v in df[name].astype(object)]
+            with open(os.path.join(table_dir, f"{position}.json"), 'w', encoding='utf-8') as f:
+                json.dump(values, f, ensure_ascii=False)
+        else:
+            np.save(os.path.join(table_dir, f"{position}.npy"), _downcast(df[name], kind))
+        columns.append(column)
+    return columns
+
+def _read_table(table_dir: str, meta: Dict[str, Any]) -> pd.DataFrame:
+    """Load the columns listed in meta."""
+    data = {}
+    for column in meta['columns']:
+        path = os.path.join(table_dir, column['file'])
+        if column['kind'] == 'category':
+            codes = np.load(path + ".npy")
+            data[column['name']] = pd.Categorical.from_codes(codes, categories=column['categories'])
+        elif column['kind'] == 'string':
+            with open(path + ".json", encoding='utf-8') as f:
+                data[column['name']] = pd.Series(json.load(f))
+        else:
+            data[column['name']] = np.load(path + ".npy")
+    return pd.DataFrame(data)
+
+def _write_meta(meta_path: str, meta: Dict[str, Any]) -> None:
+    """Write meta.json atomically; it marks the table as complete."""
+    directory = os.path.dirname(meta_path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def _read_meta(meta_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _is_fresh(meta: Optional[Dict[str, Any]], stat: os.stat_result, schema: Dict[str, str]) -> bool:
+    return (
+        meta is not None
+        and meta.get('format') == FORMAT_VERSION
+        and meta.get('schema') == schema
+        and meta.get('size') == stat.st_size
+        and meta.get('mtime_ns') == stat.st_mtime_ns
+    )
+
+def load_table(
+    csv_path: str,
+    schema: Optional[Dict[str, str]] = None,
+    cache_dir: str = DEFAULT_CACHE_DIR
+) -> pd.DataFrame:
+    """
+    Load a CSV file through a columnar binary cache.
+
+    The first load parses the CSV and stores every column as its own .npy
+    (numeric, downcast to the schema's dtype; categorical codes) or .json
+    (strings) file. Later loads read those files instead of parsing. The
+    cache is reused while the CSV's size and mtime are unchanged; if they
+    changed but its SHA-1 did not (e.g. a touch or copy), the cache is kept
+    too, otherwise it is rebuilt. Parse errors are raised as by pd.read_csv.
+
+    Args:
+        csv_path (str): Path to the CSV file
+        schema (dict): Column -> 'int32', 'int8', 'float32', ..., 'category' or
+            'string'; other columns keep the type pandas infers
+        cache_dir (str): Root directory of the cache
+
+    Returns:
+        pd.DataFrame: The table
+    """
+    schema = dict(schema or {})
+    stat = os.stat(csv_path)
+    table_dir = _table_dir(csv_path, cache_dir)
+    meta_path = os.path.join(table_dir, "meta.json")
+
+    try:
+        os.makedirs(table_dir, exist_ok=True)
+        with file_lock(meta_path, shared=True):
+            meta = _read_meta(meta_path)
+            if _is_fresh(meta, stat, schema):
+                return _read_table(table_dir, meta)
+
+        with file_lock(meta_path):
+            # Another process may have rebuilt the table meanwhile
+            meta = _read_meta(meta_path)
+            if _is_fresh(meta, stat, schema):
+                return _read_table(table_dir, meta)
+
+            digest = _file_digest(csv_path)
+            if meta is not None and meta.get('format') == FORMAT_VERSION \
+                    and meta.get('schema') == schema and meta.get('sha1') == digest:
+                # Same contents, new file metadata
+                meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                _write_meta(meta_path, meta)
+                return _read_table(table_dir, meta)
+
+            start_time = time.time()
+            df = pd.read_csv(csv_path)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            meta = {
+                'format': FORMAT_VERSION,
+                'source': os.path.abspath(csv_path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha1': digest,
+                'schema': schema,
+                'n_rows': len(df),
+                'columns': _write_table(df, table_dir, schema)
+            }
+            _write_meta(meta_path, meta)
+            print(f"Cached {os.path.basename(csv_path)} as columns in {time.time() - start_time:.2f} seconds")
+            return _read_table(table_dir, meta)
+    except OSError as e:
+        # Cache not writable: fall back to parsing the CSV
+        print(f"Columnar cache unavailable for {csv_path}: {e}")
+        df = pd.read_csv(csv_path)
+        for name, kind in schema.items():
+            if name in df.columns and kind not in ('category', 'string'):
+                df[name] = _downcast(df[name], kind)
+        return df
+
+def fill_missing(df: pd.DataFrame, values: Dict[str, Any]) -> pd.DataFrame:
+    """DataFrame.fillna(values) that also works on categorical columns."""
+    df = df.copy()
+    for column, value in values.items():
+        if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype) \
+                and value not in df[column].cat.categories:
+            df[column] = df[column].cat.add_categories([value])
+    return df.fillna(values)
@@ -2,14 +2,17 @@ import pandas as pd
 import os
 import streamlit as st
 from .jikan_api import fetch_anime_image, fetch_anime_data
+from .image_cache import get_image_cache, fallback_image, ImageCache
+from .image_fetcher import search_image_url
+from .data_cache import load_table, fill_missing, ANIME_SCHEMA, RATINGS_SCHEMA
+from .ingest import stream_ratings, DEFAULT_CHUNK_SIZE
 import numpy as np
 import random
-import requests
 import json
 import time
 from typing import Dict, List, Tuple, Any, Optional
 import colorsys
-import pickle
+import sqlite3
 
 # Anime quotes for the footer
 ANIME_QUOTES = [
@@ -34,22 +37,22 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 os.makedirs(os.path.join(PROJECT_ROOT, "cache"), exist_ok=True)
 os.makedirs(os.path.join(PROJECT_ROOT, "cache", "images"), exist_ok=True)
 
-# Image cache dictionary
-IMAGE_CACHE = {}
+# Title -> anime_id of the catalog, for keying the image cache
+_CATALOG_IDS = None
 
 def get_random_quote() -> str:
     """Get a random anime quote."""
     return random.choice(ANIME_QUOTES)
 
-def load_anime_data() -> pd.DataFrame:
-    """Load and preprocess anime data."""
-    # Load anime.csv
-    anime_path = os.path.join(PROJECT_ROOT, "data/anime.csv")
-    anime_df = pd.read_csv(anime_path)
+def load_anime_data(anime_path: Optional[str] = None) -> pd.DataFrame:
+    """Load and preprocess anime data (data/anime.csv unless anime_path is given)."""
+    # Load anime.csv (through the columnar cache)
+    anime_path = anime_path or os.path.join(PROJECT_ROOT, "data/anime.csv")
+    anime_df = load_table(anime_path, ANIME_SCHEMA)
     
     # Clean the data
     anime_df.dropna(subset=['name'], inplace=True)
-    anime_df.fillna({'genre': 'Unknown', 'type': 'Unknown', 'rating': 0, 'members': 0}, inplace=True)
+    anime_df = fill_missing(anime_df, {'genre': 'Unknown', 'type': 'Unknown', 'rating': 0, 'members': 0})
     
     # Filter out anime with very few members
     anime_df = anime_df[anime_df['members'] >= 100]
@@ -94,104 +97,72 @@ def genre_to_color(genre_string: str) -> str:
         hue = sum(ord(c) for c in main_genre) % 360 / 360
         return hsv_to_hex(hue, 0.6, 0.8)
 
-def save_image_to_cache(anime_name: str, image_url: str) -> None:
+def catalog_anime_ids() -> Dict[str, int]:
+    """Title -> anime_id for data/anime.csv (first row wins for duplicate titles)."""
+    global _CATALOG_IDS
+    if _CATALOG_IDS is None:
+        try:
+            anime_df = load_table(os.path.join(PROJECT_ROOT, "data/anime.csv"), ANIME_SCHEMA)
+            anime_df = anime_df.dropna(subset=['name']).drop_duplicates(subset=['name'])
+            _CATALOG_IDS = dict(zip(anime_df['name'], anime_df['anime_id'].astype(int)))
+        except (OSError, pd.errors.ParserError) as e:
+            print(f"[Cache] Could not read anime.csv for image keys: {e}")
+            _CATALOG_IDS = {}
+    return _CATALOG_IDS
+
+def load_image_cache() -> ImageCache:
+    """The SQLite image cache (the old pickle cache is imported on first use)."""
+    return get_image_cache(name_to_id=catalog_anime_ids())
+
+def save_image_to_cache(anime_name: str, image_url: str, anime_id: Optional[int] = None) -> None:
     """Save image URL to cache."""
-    cache_path = os.path.join(PROJECT_ROOT, "cache", "images", "image_cache.pkl")
+    if anime_id is None:
+        anime_id = catalog_anime_ids().get(anime_name)
+    if anime_id is None:
+        # Not in the catalog, so there is no key to store it under
+        return
     
-    # Update memory cache
-    IMAGE_CACHE[anime_name] = image_url
-    
-    # Update disk cache
     try:
-        # Load existing cache if it exists
-        if os.path.exists(cache_path):
-            with open(cache_path, 'rb') as f:
-                disk_cache = pickle.load(f)
-        else:
-            disk_cache = {}
-            
-        # Update and save
-        disk_cache[anime_name] = image_url
-        with open(cache_path, 'wb') as f:
-            pickle.dump(disk_cache, f)
-    except:
-        # If caching fails, just continue
-        pass
+        load_image_cache().put(anime_id, anime_name, image_url)
+    except sqlite3.Error as e:
+        print(f"[Cache] Could not update image cache: {e}")
 
-def load_image_cache() -> Dict[str, str]:
-    """Load image cache from disk."""
-    cache_path = os.path.join(PROJECT_ROOT, "cache", "images", "image_cache.pkl")
+def get_anime_image(anime_name: str, anime_id: Optional[int] = None) -> str:
+    """Get anime image URL for display (looked up by anime_id when given, else by title)."""
+    if anime_id is None:
+        anime_id = catalog_anime_ids().get(anime_name)
+    fallback = fallback_image(anime_id if anime_id is not None else anime_name)
     
-    # If memory cache is populated, use it
-    if IMAGE_CACHE:
-        return IMAGE_CACHE
-        
-    # Load from disk if available
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, 'rb') as f:
-                IMAGE_CACHE.update(pickle.load(f))
-            return IMAGE_CACHE
-        except:
-            # If loading fails, return empty dict
-            return {}
-    
-    return {}
-
-def get_anime_image(anime_name: str) -> str:
-    """Get anime image URL for display."""
-    # Load image cache
+    # Check cache first (failed lookups are cached too, until their retry time)
     image_cache = load_image_cache()
+    entry = image_cache.get_entry(anime_id) if anime_id is not None else image_cache.get_entry_by_name(anime_name)
+    if entry is not None and not image_cache.is_due(entry):
+        return entry.url or fallback
     
-    # Check cache first
-    if anime_name in image_cache:
-        return image_cache[anime_name]
+    # Try to get image from Jikan API (MyAnimeList), rate limited with all other requests
+    image_url = search_image_url(anime_name, anime_id=anime_id)
+    if image_url is None:
+        # Rate limiting or error - back off, and keep any image found earlier
+        if anime_id is not None:
+            entry = image_cache.record_failure(anime_id, anime_name)
+        return entry.url if entry is not None and entry.url else fallback
     
-    # Fallback images
-    fallback_images = [
-        "https://cdn.myanimelist.net/images/anime/10/47347.jpg",
-        "https://cdn.myanimelist.net/images/anime/5/73199.jpg",
-        "https://cdn.myanimelist.net/images/anime/1208/94745.jpg",
-        "https://cdn.myanimelist.net/images/anime/13/17405.jpg",
-        "https://cdn.myanimelist.net/images/anime/9/9453.jpg"
-    ]
-    
-    try:
-        # Try to get image from Jikan API (MyAnimeList)
-        search_url = f"https://api.jikan.moe/v4/anime?q={anime_name.replace(' ', '%20')}&limit=1"
-        response = requests.get(search_url, timeout=2)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('data') and len(data['data']) > 0:
-                image_url = data['data'][0]['images']['jpg']['image_url']
-                
-                # Cache the result
-                save_image_to_cache(anime_name, image_url)
-                
-                return image_url
-        
-        # Rate limiting or error - use fallback
-        fallback = random.choice(fallback_images)
-        save_image_to_cache(anime_name, fallback)
-        return fallback
-        
-    except Exception as e:
-        # If API fails, use a fallback image
-        fallback = random.choice(fallback_images)
-        save_image_to_cache(anime_name, fallback)
-        return fallback
+    # Cache the result
+    save_image_to_cache(anime_name, image_url, anime_id)
+    return image_url
 
 def enrich_with_images(recommendations_df: pd.DataFrame) -> pd.DataFrame:
     """Add image URLs to recommendations DataFrame."""
     # Just return as is - image URLs will be fetched by the UI
     return recommendations_df
 
-def get_anime_details(title: str) -> dict:
-    """Get detailed anime information using Jikan API."""
-    return fetch_anime_data(title)
+def get_anime_details(title: str, anime_id: Optional[int] = None) -> dict:
+    """Get detailed anime information using Jikan API (cached per anime_id)."""
+    if anime_id is None:
+        anime_id = catalog_anime_ids().get(title)
+    return fetch_anime_data(title, anime_id)
 
-def load_and_merge_data():
+def load_and_merge_data(streaming: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE):
     """
     Loads and merges anime and ratings data from CSV files.
     
@@ -201,9 +172,20 @@ def load_and_merge_data():
     3. Merges data on anime_id
     4. Handles missing values and data quality issues
     
+    In streaming mode ratings.csv is read and validated chunk_size rows at a
+    time and nothing is merged up front: the result is a NormalizedRatings
+    (utils.ingest) whose ratings point at anime rows by position, with the
+    line numbers of rejected rows in bad_rows. Call its merged() for a
+    denormalized frame of the rows you need.
+    
+    Args:
+        streaming (bool): Return a normalized store instead of a merged frame
+        chunk_size (int): Rows of ratings.csv parsed at a time in streaming mode
+    
     Returns:
         tuple: (merged_df, error_message)
             - merged_df: pandas DataFrame with merged data if successful, None if error
+              (NormalizedRatings in streaming mode)
             - error_message: str describing any error, None if successful
             
     Required files:
@@ -221,9 +203,13 @@ def load_and_merge_data():
         return None, f"Missing required file: {ratings_path}"
     
     try:
-        # Load data with explicit column types
-        anime = pd.read_csv(anime_path)
-        ratings = pd.read_csv(ratings_path)
+        # Load data with explicit column types (through the columnar cache);
+        # in streaming mode only the header of ratings.csv is read here
+        anime = load_table(anime_path, ANIME_SCHEMA)
+        if streaming:
+            ratings = pd.read_csv(ratings_path, nrows=0)
+        else:
+            ratings = load_table(ratings_path, RATINGS_SCHEMA)
         
         # Validate required columns
         required_anime_cols = ['anime_id', 'title', 'genre']
@@ -237,6 +223,17 @@ def load_and_merge_data():
         if missing_ratings_cols:
             return None, f"Missing columns in ratings.csv: {', '.join(missing_ratings_cols)}"
         
+        if streaming:
+            # Ratings of untitled anime are rejected, as the merge below drops them
+            anime = anime.dropna(subset=['anime_id', 'title']).reset_index(drop=True)
+            store = stream_ratings(ratings_path, anime, chunk_size=chunk_size)
+            if store.n_bad:
+                shown = ", ".join(f"line {line}: {reason}" for line, reason in store.bad_rows[:5])
+                print(f"Skipped {store.n_bad} invalid rows in ratings.csv ({shown})")
+            if len(store) == 0:
+                return None, "No valid data after merging and cleaning"
+            return store, None
+        
         # Clean and validate data
         ratings['rating'] = pd.to_numeric(ratings['rating'], errors='coerce')
         ratings = ratings.dropna(subset=['rating'])
@@ -0,0 +1,333 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .cache_storage import read_pickle
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, "cache", "images", "image_cache.sqlite3")
+LEGACY_PICKLE_PATH = os.path.join(PROJECT_ROOT, "cache", "images", "image_cache.pkl")
+
+# Entries kept in the in-memory LRU in front of SQLite
+DEFAULT_LRU_SIZE = 4096
+
+# Found images are refetched in the background after this long
+POSITIVE_TTL = 30 * 24 * 3600
+
+# After a failed fetch the next attempt waits NEGATIVE_TTL, doubling with
+# every further failure up to NEGATIVE_TTL_MAX
+NEGATIVE_TTL = 10 * 60
+NEGATIVE_TTL_MAX = 24 * 3600
+
+# Shown for titles without an image; picked by key, so every worker shows the same one
+FALLBACK_IMAGES = [
+    "https://cdn.myanimelist.net/images/anime/10/47347.jpg",
+    "https://cdn.myanimelist.net/images/anime/5/73199.jpg",
+    "https://cdn.myanimelist.net/images/anime/1208/94745.jpg",
+    "https://cdn.myanimelist.net/images/anime/13/17405.jpg",
+    "https://cdn.myanimelist.net/images/anime/9/9453.jpg"
+]
+
+# SQLite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+_SCHEMA = [
+    # url is '' while no image is known; failures counts consecutive failed
+    # fetches and retry_at is the earliest time of the next attempt
+    """CREATE TABLE IF NOT EXISTS images (
+        anime_id INTEGER PRIMARY KEY,
+        name TEXT,
+        url TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        failures INTEGER NOT NULL DEFAULT 0,
+        retry_at REAL NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS images_name ON images (name)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+]
+
+_COLUMNS = "anime_id, name, url, updated_at, failures, retry_at"
+
+_UPSERT = """
+    INSERT INTO images (anime_id, name, url, updated_at, failures, retry_at) VALUES (?, ?, ?, ?, 0, 0)
+    ON CONFLICT (anime_id) DO UPDATE SET
+        name = excluded.name, url = excluded.url, updated_at = excluded.updated_at,
+        failures = 0, retry_at = 0
+"""
+
+# A failure keeps any URL found earlier; only the retry schedule changes
+_RECORD_FAILURE = """
+    INSERT INTO images (anime_id, name, url, updated_at, failures, retry_at) VALUES (?, ?, '', ?, 1, ? + ?)
+    ON CONFLICT (anime_id) DO UPDATE SET
+        failures = images.failures + 1,
+        retry_at = excluded.updated_at + min(? * (1 << min(images.failures, 20)), ?)
+"""
+
+# Fallbacks stored as real images by earlier versions: forget them, due for a fetch now
+_FORGET_FALLBACKS = "UPDATE images SET url = '', failures = 1, retry_at = 0 WHERE url IN ({})".format(
+    ",".join("?" * len(FALLBACK_IMAGES))
+)
+
+class ImageEntry(NamedTuple):
+    """One cached image: url is '' if none is known yet (a negative entry)."""
+    anime_id: int
+    name: Optional[str]
+    url: str
+    updated_at: float
+    failures: int
+    retry_at: float
+
+def fallback_image(key) -> str:
+    """Fallback poster for an anime_id or title, the same in every process."""
+    return FALLBACK_IMAGES[zlib.crc32(str(key).encode('utf-8')) % len(FALLBACK_IMAGES)]
+
+class ImageCache:
+    """
+    Image URLs per anime_id in SQLite (WAL mode), with an LRU in front.
+
+    Every write is a small transaction on one row (or one batch), so the cost
+    of a write does not grow with the cache and concurrent writers, threads
+    or processes, never overwrite each other's entries. WAL lets readers
+    proceed while a writer commits. Entries can also be looked up by name
+    through an index, for callers that only know the title.
+
+    Failed fetches are cached too, as negative entries: the title shows its
+    fallback_image() and is not fetched again before retry_at, which backs
+    off exponentially with consecutive failures. is_due() tells callers when
+    an entry (negative, or positive but older than the TTL) should be
+    refreshed; callers keep serving it meanwhile.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, lru_size: int = DEFAULT_LRU_SIZE,
+                 ttl: float = POSITIVE_TTL, negative_ttl: float = NEGATIVE_TTL,
+                 negative_ttl_max: float = NEGATIVE_TTL_MAX):
+        """
+        Args:
+            db_path (str): SQLite database file
+            lru_size (int): Entries kept in memory
+            ttl (float): Seconds before a found image is refreshed
+            negative_ttl (float): Seconds before the first retry of a failed fetch
+            negative_ttl_max (float): Longest wait between retries
+        """
+        self.db_path = db_path
+        self.lru_size = lru_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_ttl_max = negative_ttl_max
+        self._lru = OrderedDict()  # ('id', anime_id) or ('name', name) -> ImageEntry
+        self._lru_lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connection() as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            # Caches created before negative entries existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+            if 'failures' not in columns:
+                conn.execute("ALTER TABLE images ADD COLUMN failures INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE images ADD COLUMN retry_at REAL NOT NULL DEFAULT 0")
+                conn.execute(_FORGET_FALLBACKS, FALLBACK_IMAGES)
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection (sqlite3 connections are not shared between threads)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # LRU
+
+    def _remember(self, entry: ImageEntry) -> None:
+        with self._lru_lock:
+            keys = [('id', entry.anime_id)] + ([('name', entry.name)] if entry.name is not None else [])
+            for key in keys:
+                self._lru[key] = entry
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _recall(self, key: Tuple) -> Optional[ImageEntry]:
+        with self._lru_lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+            return entry
+
+    # Reads
+
+    def is_due(self, entry: ImageEntry, now: Optional[float] = None) -> bool:
+        """Whether an entry should be fetched again (it stays usable until then)."""
+        now = time.time() if now is None else now
+        expired = not entry.url or now - entry.updated_at >= self.ttl
+        return expired and now >= entry.retry_at
+
+    def get_entry(self, anime_id: int) -> Optional[ImageEntry]:
+        """Cached entry of an anime (positive or negative), or None."""
+        return self.get_entries([anime_id]).get(int(anime_id))
+
+    def get_entry_by_name(self, name: str) -> Optional[ImageEntry]:
+        """Cached entry of an anime by its title, or None."""
+        entry = self._recall(('name', name))
+        if entry is not None:
+            return entry
+        row = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM images WHERE name = ? ORDER BY anime_id LIMIT 1", (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = ImageEntry(*row)
+        self._remember(entry)
+        return entry
+
+    def get_entries(self, anime_ids: Iterable[int]) -> Dict[int, ImageEntry]:
+        """Cached entries of several anime (missing ones are left out), in one query per batch."""
+        found, missing = {}, []
+        for anime_id in dict.fromkeys(int(a) for a in anime_ids):
+            entry = self._recall(('id', anime_id))
+            if entry is None:
+                missing.append(anime_id)
+            else:
+                found[anime_id] = entry
+
+        conn = self._connection()
+        for start in range(0, len(missing), _MAX_PARAMS):
+            batch = missing[start:start + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            for row in conn.execute(f"SELECT {_COLUMNS} FROM images WHERE anime_id IN ({placeholders})", batch):
+                entry = ImageEntry(*row)
+                found[entry.anime_id] = entry
+                self._remember(entry)
+        return found
+
+    def get(self, anime_id: int) -> Optional[str]:
+        """Cached URL of an anime, or None (also for negative entries)."""
+        entry = self.get_entry(anime_id)
+        return entry.url if entry is not None and entry.url else None
+
+    def get_by_name(self, name: str) -> Optional[str]:
+        """Cached URL of an anime by its title, or None (also for negative entries)."""
+        entry = self.get_entry_by_name(name)
+        return entry.url if entry is not None and entry.url else None
+
+    def get_many(self, anime_ids: Iterable[int]) -> Dict[int, str]:
+        """Cached URLs of several anime; missing and negative ones are left out."""
+        return {anime_id: entry.url for anime_id, entry in self.get_entries(anime_ids).items() if entry.url}
+
+    def due_for_refresh(self, limit: int = 50) -> List[Tuple[int, Optional[str]]]:
+        """(anime_id, name) of entries due for a fetch, longest waiting first."""
+        now = time.time()
+        return self._connection().execute(
+            """SELECT anime_id, name FROM images
+               WHERE (url = '' OR updated_at <= ?) AND retry_at <= ?
+               ORDER BY retry_at, updated_at LIMIT ?""",
+            (now - self.ttl, now, limit)
+        ).fetchall()
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    # Writes
+
+    def put(self, anime_id: int, name: Optional[str], url: str) -> None:
+        """Insert or replace one entry."""
+        self.put_many([(anime_id, name, url)])
+
+    def put_many(self, entries: Iterable[Tuple[int, Optional[str], str]]) -> int:
+        """
+        Insert or replace entries in one transaction.
+
+        Args:
+            entries (iterable): (anime_id, name, url) tuples
+
+        Returns:
+            int: Number of entries written
+        """
+        now = time.time()
+        rows = [(int(anime_id), name, url, now) for anime_id, name, url in entries]
+        if not rows:
+            return 0
+        conn = self._connection()
+        with conn:
+            conn.executemany(_UPSERT, rows)
+        for anime_id, name, url, updated_at in rows:
+            self._remember(ImageEntry(anime_id, name, url, updated_at, 0, 0.0))
+        return len(rows)
+
+    def record_failure(self, anime_id: int, name: Optional[str]) -> ImageEntry:
+        """
+        Record a failed fetch: the next attempt waits negative_ttl, doubled per
+        consecutive failure up to negative_ttl_max. A URL found earlier is kept.
+
+        Returns:
+            ImageEntry: The updated entry
+        """
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute(_RECORD_FAILURE, (
+                int(anime_id), name, now, now, self.negative_ttl, self.negative_ttl, self.negative_ttl_max
+            ))
+            row = conn.execute(f"SELECT {_COLUMNS} FROM images WHERE anime_id = ?", (int(anime_id),)).fetchone()
+        entry = ImageEntry(*row)
+        self._remember(entry)
+        return entry
+
+    # Migration
+
+    def migrate_pickle(self, pickle_path: str, name_to_id: Dict[str, int]) -> int:
+        """
+        Import the old name -> URL pickle once.
+
+        Titles that are not in name_to_id cannot be keyed and are skipped, and
+        the random fallbacks it stored are imported as negative entries due
+        for a fetch. The import is recorded in the meta table, so later calls
+        do nothing.
+
+        Returns:
+            int: Number of entries imported
+        """
+        conn = self._connection()
+        key = f"migrated:{os.path.basename(pickle_path)}"
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+            return 0
+        legacy = read_pickle(pickle_path) or {}
+        entries = [(name_to_id[name], name, url) for name, url in legacy.items() if name in name_to_id]
+        count = self.put_many(entries)
+        with conn:
+            conn.execute(_FORGET_FALLBACKS, FALLBACK_IMAGES)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(count)))
+        with self._lru_lock:
+            self._lru.clear()
+        if legacy:
+            print(f"[Cache] Migrated {count} of {len(legacy)} image URLs from {os.path.basename(pickle_path)}")
+        return count
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+def get_image_cache(
+    db_path: str = DEFAULT_DB_PATH,
+    name_to_id: Optional[Dict[str, int]] = None,
+    legacy_path: str = LEGACY_PICKLE_PATH
+) -> ImageCache:
+    """
+    The shared image cache for db_path, opened once per process.
+
+    On first open the old pickle cache is imported, keyed through
+    name_to_id (title -> anime_id).
+    """
+    with _CACHES_LOCK:
+        cache = _CACHES.get(db_path)
+        if cache is None:
+            cache = ImageCache(db_path)
+            if name_to_id is not None and os.path.exists(legacy_path):
+                cache.migrate_pickle(legacy_path, name_to_id)
+            _CACHES[db_path] = cache
+        return cache
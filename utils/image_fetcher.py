@@ -0,0 +1,221 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .image_cache import ImageCache, fallback_image
+
+# Jikan's published limits: 3 requests per second and 60 per minute
+JIKAN_RATE_LIMITS = [(3, 1.0), (60, 60.0)]
+
+# Shown while a card's image is still being fetched
+PLACEHOLDER_IMAGE = "https://via.placeholder.com/225x320/1c1c1e/ff4baf?text=Loading"
+
+class TokenBucket:
+    """Allows `capacity` requests at once, refilled at `rate` per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is)."""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class RateLimiter:
+    """
+    Several token buckets that must all have a token, shared by every thread.
+
+    With JIKAN_RATE_LIMITS a burst of 3 goes out at once, then requests are
+    spaced to stay under both the per-second and the per-minute limit.
+    """
+
+    def __init__(self, limits: Iterable[Tuple[int, float]] = JIKAN_RATE_LIMITS):
+        """
+        Args:
+            limits (iterable): (requests, per seconds) pairs
+        """
+        self._buckets = [TokenBucket(n / period, n) for n, period in limits]
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take a token from every bucket, waiting as long as needed.
+
+        Args:
+            timeout (float): Give up after this many seconds (None waits forever)
+
+        Returns:
+            bool: True if the request may go out
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                for bucket in self._buckets:
+                    bucket.refill(now)
+                delay = max(bucket.wait_time() for bucket in self._buckets)
+                if delay == 0:
+                    for bucket in self._buckets:
+                        bucket.tokens -= 1
+                    return True
+            if deadline is not None and now + delay > deadline:
+                return False
+            time.sleep(delay)
+
+# Shared by every Jikan request of the process
+JIKAN_LIMITER = RateLimiter()
+
+def search_image_url(anime_name: str, timeout: float = 2.0, anime_id: Optional[int] = None,
+                     by_title: bool = True, max_retries: Optional[int] = None) -> Optional[str]:
+    """
+    Poster URL of an anime: its own payload when anime_id is known, else the
+    first Jikan search result for the title.
+
+    Goes through the shared Jikan client, so the request uses its pooled
+    connections, rate limiter, retries and payload cache.
+
+    Args:
+        anime_name (str): Title, searched for when there is no anime_id payload
+        timeout (float): Timeout of each request in seconds
+        anime_id (int): MyAnimeList ID, looked up first when given
+        by_title (bool): Fall back to a title search (False: at most one lookup)
+        max_retries (int): Retries per request (default: the client's)
+
+    Returns:
+        str or None: The URL, or None if there is no result or the request failed
+    """
+    from .jikan_api import get_jikan_client
+    client = get_jikan_client()
+    payload = None
+    if anime_id is not None:
+        payload = client.anime(anime_id, timeout=timeout, max_retries=max_retries)
+    if payload is None and by_title:
+        payload = client.search(anime_name, timeout=timeout, max_retries=max_retries)
+    try:
+        return payload['images']['jpg']['image_url']
+    except (TypeError, KeyError):
+        return None
+
+class ImageFetcher:
+    """
+    Resolves card images concurrently.
+
+    Cached URLs are returned at once; the rest are fetched on a thread pool
+    through the shared Jikan client (and its rate limiter) and written to the
+    cache as they arrive. A title already being fetched is not requested
+    again, callers share its future instead.
+
+    Titles whose fetch failed show their fallback_image() until the cache's
+    backoff allows another attempt, and entries due for a refresh are served
+    as they are while the refresh runs in the background.
+    """
+
+    def __init__(self, cache: ImageCache, max_workers: int = 4, timeout: float = 2.0):
+        """
+        Args:
+            cache (ImageCache): Cache to read from and fill
+            max_workers (int): Concurrent requests
+            timeout (float): Timeout of each request in seconds
+        """
+        self.cache = cache
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-fetch")
+        self._in_flight: Dict[object, Future] = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, anime_name: str, anime_id: Optional[int]) -> str:
+        url = search_image_url(anime_name, self.timeout, anime_id)
+        if anime_id is None:
+            return url or fallback_image(anime_name)
+        if url is None:
+            # Negative entry: not retried before its backoff ends; an older URL is kept
+            entry = self.cache.record_failure(anime_id, anime_name)
+            return entry.url or fallback_image(anime_id)
+        self.cache.put(anime_id, anime_name, url)
+        return url
+
+    def submit(self, anime_name: str, anime_id: Optional[int] = None) -> Future:
+        """Fetch a title's image in the background (or join the fetch already running)."""
+        key = anime_id if anime_id is not None else anime_name
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._fetch, anime_name, anime_id)
+            self._in_flight[key] = future
+
+        def done(_):
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+        future.add_done_callback(done)
+        return future
+
+    def resolve(self, titles: List[Tuple[str, Optional[int]]], wait_seconds: float = 0.0) -> List[Optional[str]]:
+        """
+        Image URLs for a list of (name, anime_id) pairs.
+
+        Cached images (and fallbacks of failed ones) are looked up in one
+        batch; entries due for a refresh are refetched in the background
+        without waiting. Uncached titles are fetched concurrently and waited
+        for at most wait_seconds in total.
+
+        Returns:
+            list: URL per title, None for those still being fetched
+        """
+        entries = self.cache.get_entries(anime_id for _, anime_id in titles if anime_id is not None)
+        now = time.time()
+        urls, pending = [], {}
+        for i, (anime_name, anime_id) in enumerate(titles):
+            if anime_id is not None:
+                entry = entries.get(int(anime_id))
+            else:
+                entry = self.cache.get_entry_by_name(anime_name)
+            if entry is None:
+                urls.append(None)
+                pending[i] = self.submit(anime_name, anime_id)
+                continue
+            urls.append(entry.url or fallback_image(anime_id if anime_id is not None else anime_name))
+            if anime_id is not None and self.cache.is_due(entry, now):
+                self.submit(anime_name, int(anime_id))
+
+        if pending and wait_seconds > 0:
+            wait(list(pending.values()), timeout=wait_seconds)
+        for i, future in pending.items():
+            if future.done() and future.exception() is None:
+                urls[i] = future.result()
+        return urls
+
+    def refresh_due(self, limit: int = 20) -> int:
+        """Start background fetches for up to `limit` cache entries due for a refresh."""
+        due = self.cache.due_for_refresh(limit)
+        for anime_id, anime_name in due:
+            self.submit(anime_name or "", anime_id)
+        return len(due)
+
+def start_image_refresher(fetcher: ImageFetcher, interval: float = 300.0, batch: int = 20) -> threading.Thread:
+    """
+    Refresh due image cache entries (failed fetches past their backoff, old
+    images past the TTL) in a background thread, `batch` every `interval` seconds.
+
+    Returns:
+        threading.Thread: The (daemon) refresher thread
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                fetcher.refresh_due(batch)
+            except Exception as e:
+                print(f"[Cache] Image refresh failed: {e}")
+
+    thread = threading.Thread(target=run, name="image-refresh", daemon=True)
+    thread.start()
+    return thread
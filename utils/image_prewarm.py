@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .image_cache import ImageCache
+from .image_fetcher import RateLimiter, search_image_url
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STATE_PATH = os.path.join(PROJECT_ROOT, "cache", "images", "prewarm_state.json")
+
+# The prewarmer's own limits, below Jikan's, so interactive fetches keep headroom
+PREWARM_RATE_LIMITS = [(1, 1.0), (30, 60.0)]
+
+# Titles checked against the cache per query
+BATCH_SIZE = 200
+
+class ImagePrewarmer:
+    """
+    Fills the image cache for the most popular titles ahead of time.
+
+    Titles are walked by members, most popular first; cached ones are
+    skipped in batches and the others are fetched one at a time through
+    both the prewarmer's own limiter and the limiter shared with the UI, so
+    prewarming never uses the whole Jikan allowance. Each title is looked up
+    by anime_id only, without retries or a title search, so it costs at most
+    one request and a run makes at most `budget` requests. The position in the ranking is saved after every
+    title, so a restarted run continues where the last one stopped.
+    """
+
+    def __init__(self, anime_df: pd.DataFrame, cache: ImageCache, budget: int = 500,
+                 state_path: str = DEFAULT_STATE_PATH, limiter: Optional[RateLimiter] = None,
+                 timeout: float = 5.0):
+        """
+        Args:
+            anime_df (pd.DataFrame): Catalog with anime_id, name and members
+            cache (ImageCache): Cache to fill
+            budget (int): Maximum Jikan requests per run
+            state_path (str): JSON file with the saved position
+            limiter (RateLimiter): Prewarm limiter (default: PREWARM_RATE_LIMITS)
+            timeout (float): Timeout of each request in seconds
+        """
+        ranked = anime_df.dropna(subset=['name']).copy()
+        ranked['members'] = pd.to_numeric(ranked['members'], errors='coerce').fillna(0)
+        ranked = ranked.sort_values(['members', 'anime_id'], ascending=[False, True], kind='stable')
+        self.anime_ids = ranked['anime_id'].to_numpy(dtype=np.int64)
+        self.names = ranked['name'].astype(str).tolist()
+        # Identifies the ranking, so a saved position is only reused for the same one
+        self.ranking_digest = hashlib.md5(self.anime_ids.tobytes()).hexdigest()
+
+        self.cache = cache
+        self.budget = budget
+        self.state_path = state_path
+        self.limiter = limiter or RateLimiter(PREWARM_RATE_LIMITS)
+        self.timeout = timeout
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._progress = {
+            'position': 0, 'total': len(self.anime_ids), 'requests': 0,
+            'fetched': 0, 'failed': 0, 'already_cached': 0, 'running': False, 'finished': False
+        }
+
+    # State
+
+    def _load_position(self) -> int:
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if state.get('ranking') != self.ranking_digest:
+            return 0
+        return int(state.get('position', 0))
+
+    def _save_position(self, position: int) -> None:
+        tmp_path = self.state_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({'ranking': self.ranking_digest, 'position': position,
+                           'total': len(self.anime_ids), 'updated_at': time.time()}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"[Prewarm] Could not save progress: {e}")
+
+    def progress(self) -> Dict:
+        """Snapshot of the current run: position, total, requests, fetched, failed, ..."""
+        with self._lock:
+            return dict(self._progress)
+
+    def _update(self, **changes) -> None:
+        with self._lock:
+            for key, value in changes.items():
+                self._progress[key] = value
+
+    # Running
+
+    def run(self, on_progress: Optional[Callable[[Dict], None]] = None, report_every: int = 25) -> Dict:
+        """
+        Prewarm until the budget is spent, the ranking is done or stop() is called.
+
+        Args:
+            on_progress (callable): Called with progress() after every report_every requests
+            report_every (int): Requests between progress reports
+
+        Returns:
+            dict: Final progress
+        """
+        position = self._load_position()
+        requests_made = fetched = failed = already_cached = 0
+        self._update(position=position, running=True, finished=False)
+
+        while position < len(self.anime_ids) and requests_made < self.budget and not self._stop.is_set():
+            batch_ids = self.anime_ids[position:position + BATCH_SIZE]
+            entries = self.cache.get_entries(batch_ids)
+            now = time.time()
+            # Cached, or failed recently and still backing off
+            cached = {anime_id for anime_id, entry in entries.items() if not self.cache.is_due(entry, now)}
+
+            for anime_id in batch_ids:
+                if requests_made >= self.budget or self._stop.is_set():
+                    break
+                if int(anime_id) in cached:
+                    already_cached += 1
+                else:
+                    self.limiter.acquire()
+                    # One request at most, so the budget holds
+                    url = search_image_url(self.names[position], self.timeout, int(anime_id),
+                                           by_title=False, max_retries=0)
+                    requests_made += 1
+                    if url is None:
+                        # Negative entry; retried by the refresher once its backoff ends
+                        self.cache.record_failure(int(anime_id), self.names[position])
+                        failed += 1
+                    else:
+                        self.cache.put(int(anime_id), self.names[position], url)
+                        fetched += 1
+                position += 1
+                self._update(position=position, requests=requests_made, fetched=fetched,
+                             failed=failed, already_cached=already_cached)
+                if int(anime_id) not in cached:
+                    self._save_position(position)
+                    if on_progress is not None and requests_made % report_every == 0:
+                        on_progress(self.progress())
+
+        self._save_position(position)
+        self._update(position=position, running=False, finished=position >= len(self.anime_ids))
+        final = self.progress()
+        print(f"[Prewarm] {final['position']}/{final['total']} titles, {final['fetched']} fetched, "
+              f"{final['failed']} failed, {final['requests']} requests")
+        if on_progress is not None:
+            on_progress(final)
+        return final
+
+    def start(self) -> threading.Thread:
+        """Run in a background (daemon) thread; does nothing if already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_safely, name="image-prewarm", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run_safely(self) -> None:
+        try:
+            self.run()
+        except Exception as e:
+            self._update(running=False)
+            print(f"[Prewarm] Stopped after an error: {e}")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask a running prewarm to stop after the current request."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+def main():
+    """Prewarm the image cache from the command line."""
+    parser = argparse.ArgumentParser(description="Prewarm the KawaiiRecSys image cache by popularity")
+    parser.add_argument("--budget", type=int, default=500, help="Maximum Jikan requests")
+    parser.add_argument("--reset", action="store_true", help="Start again from the most popular title")
+    args = parser.parse_args()
+
+    from .helpers import load_anime_data, load_image_cache
+    if args.reset and os.path.exists(DEFAULT_STATE_PATH):
+        os.remove(DEFAULT_STATE_PATH)
+    prewarmer = ImagePrewarmer(load_anime_data(), load_image_cache(), budget=args.budget)
+    prewarmer.run(on_progress=lambda p: print(
+        f"[Prewarm] {p['position']}/{p['total']} titles, {p['requests']}/{args.budget} requests"
+    ))
+
+if __name__ == "__main__":
+    main()
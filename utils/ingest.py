@@ -0,0 +1,152 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Rows of ratings.csv parsed at a time
+DEFAULT_CHUNK_SIZE = 500_000
+
+# Bad rows reported individually (all are counted)
+MAX_REPORTED_ROWS = 100
+
+RATING_RANGE = (-1, 10)  # -1 is watched but not rated
+
+class NormalizedRatings:
+    """
+    Ratings joined to the catalog by integer position instead of by copying.
+
+    ratings holds user_id, anime_idx (row position in anime) and rating, so
+    memory grows by a few bytes per rating; anime metadata is only copied
+    into rows when merged() is asked for them.
+    """
+
+    def __init__(self, anime: pd.DataFrame, ratings: pd.DataFrame,
+                 bad_rows: List[Tuple[int, str]], n_bad: int):
+        """
+        Args:
+            anime (pd.DataFrame): The catalog (positional index)
+            ratings (pd.DataFrame): user_id, anime_idx, rating
+            bad_rows (list): (line number, reason) of the first rejected rows
+            n_bad (int): Total number of rejected rows
+        """
+        self.anime = anime
+        self.ratings = ratings
+        self.bad_rows = bad_rows
+        self.n_bad = n_bad
+
+    def __len__(self) -> int:
+        return len(self.ratings)
+
+    def merged(self, rows: Optional[slice] = None) -> pd.DataFrame:
+        """
+        Denormalized frame for all rows or a slice, laid out like
+        ratings.merge(anime, on='anime_id') (clashing columns get _x / _y).
+
+        Args:
+            rows (slice): Rows of the ratings to merge, e.g. slice(0, 1000)
+
+        Returns:
+            pd.DataFrame: Rating columns followed by the anime columns
+        """
+        ratings = self.ratings if rows is None else self.ratings.iloc[rows]
+        anime = self.anime.take(ratings['anime_idx'].values).reset_index(drop=True)
+        left = pd.DataFrame({
+            'user_id': ratings['user_id'].values,
+            'anime_id': anime['anime_id'].values,
+            'rating': ratings['rating'].values
+        })
+        right = anime.drop(columns=['anime_id'])
+        clashing = set(left.columns) & set(right.columns)
+        left = left.rename(columns={c: f"{c}_x" for c in clashing})
+        right = right.rename(columns={c: f"{c}_y" for c in clashing})
+        return pd.concat([left, right], axis=1)
+
+def _validate_chunk(chunk: pd.DataFrame, first_line: int, anime_ids: np.ndarray):
+    """
+    Parse one chunk of ratings and find its invalid rows.
+
+    Returns:
+        tuple: (user_ids, anime positions, ratings of the valid rows,
+            line numbers of the invalid rows, reasons)
+    """
+    user_id = pd.to_numeric(chunk['user_id'], errors='coerce').values
+    anime_id = pd.to_numeric(chunk['anime_id'], errors='coerce').values
+    rating = pd.to_numeric(chunk['rating'], errors='coerce').values
+
+    reasons = np.full(len(chunk), None, dtype=object)
+    reasons[np.isnan(rating) | (rating != np.round(rating))] = "rating is not an integer"
+    out_of_range = ~np.isnan(rating) & ((rating < RATING_RANGE[0]) | (rating > RATING_RANGE[1]))
+    reasons[out_of_range] = f"rating outside {RATING_RANGE[0]}..{RATING_RANGE[1]}"
+
+    # Position of each anime_id in the (sorted) catalog IDs
+    positions = np.searchsorted(anime_ids, np.nan_to_num(anime_id, nan=-1))
+    positions = np.minimum(positions, len(anime_ids) - 1)
+    unknown = np.isnan(anime_id) | (anime_ids[positions] != anime_id)
+    reasons[unknown] = "anime_id not in anime.csv"
+    reasons[np.isnan(user_id) | (user_id != np.round(user_id))] = "user_id is not an integer"
+
+    bad = reasons != None  # noqa: E711 (element-wise)
+    lines = first_line + np.flatnonzero(bad)
+    valid = ~bad
+    return (user_id[valid].astype(np.int32), positions[valid].astype(np.int32),
+            rating[valid].astype(np.int8), lines, reasons[bad])
+
+def stream_ratings(
+    ratings_path: str,
+    anime: pd.DataFrame,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_reported: int = MAX_REPORTED_ROWS
+) -> NormalizedRatings:
+    """
+    Read and validate ratings.csv in chunks against the catalog.
+
+    Each chunk is parsed as text, validated (integer user_id, anime_id present
+    in the catalog, integer rating in -1..10), and its valid rows are reduced
+    to compact user_id / anime position / rating arrays. Peak memory is one
+    chunk plus the compact arrays, never a ratings x catalog frame.
+
+    Args:
+        ratings_path (str): Path to ratings.csv
+        anime (pd.DataFrame): Catalog with an anime_id column
+        chunk_size (int): Rows parsed at a time
+        max_reported (int): Bad rows kept with their line numbers
+
+    Returns:
+        NormalizedRatings: Valid ratings, plus the rejected rows' line numbers and reasons
+    """
+    anime = anime.reset_index(drop=True)
+    # Sorted catalog IDs, and the row each one came from
+    order = np.argsort(anime['anime_id'].values, kind='stable')
+    anime_ids = anime['anime_id'].values[order].astype(np.float64)
+
+    users, positions, ratings = [], [], []
+    bad_rows, n_bad = [], 0
+    first_line = 2  # line 1 is the header
+    reader = pd.read_csv(
+        ratings_path, usecols=['user_id', 'anime_id', 'rating'], dtype=str,
+        chunksize=chunk_size, skip_blank_lines=False
+    )
+    for chunk in reader:
+        chunk_users, chunk_positions, chunk_ratings, lines, reasons = _validate_chunk(
+            chunk, first_line, anime_ids
+        )
+        users.append(chunk_users)
+        positions.append(order[chunk_positions].astype(np.int32))
+        ratings.append(chunk_ratings)
+
+        n_bad += len(lines)
+        for line, reason in zip(lines, reasons):
+            if len(bad_rows) >= max_reported:
+                break
+            bad_rows.append((int(line), reason))
+        first_line += len(chunk)
+
+    def joined(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    normalized = pd.DataFrame({
+        'user_id': joined(users, np.int32),
+        'anime_idx': joined(positions, np.int32),
+        'rating': joined(ratings, np.int8)
+    })
+    return NormalizedRatings(anime, normalized, bad_rows, n_bad)
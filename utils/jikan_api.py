@@ -1,48 +1,262 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
 import requests
-from typing import Dict, Optional, Union
+from requests.adapters import HTTPAdapter
+
+from .image_fetcher import JIKAN_LIMITER, RateLimiter
+
+# Set JIKAN_BASE_URL to point the client elsewhere, e.g. at utils/jikan_stub.py
+JIKAN_BASE_URL = os.environ.get("JIKAN_BASE_URL", "https://api.jikan.moe/v4").rstrip("/")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(PROJECT_ROOT, "cache", "jikan", "jikan_cache.sqlite3")
+
+# Payloads older than this are fetched again (and only served when Jikan fails)
+DEFAULT_TTL = 7 * 24 * 3600
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 10.0)
 
-def fetch_anime_image(title: str) -> str:
+PLACEHOLDER_IMAGE = "https://via.placeholder.com/120/ff4baf/ffffff?text=No+Image"
+
+class JikanCache:
+    """
+    Jikan response payloads in SQLite (WAL mode) with their fetch time.
+
+    Full anime payloads are keyed by anime_id (the MyAnimeList ID, as in
+    anime.csv); search results are keyed by the normalized query and point
+    at the anime_id of their first hit.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS anime (
+                anime_id INTEGER PRIMARY KEY, payload TEXT NOT NULL, fetched_at REAL NOT NULL
+            )""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS searches (
+                query TEXT PRIMARY KEY, anime_id INTEGER, payload TEXT, fetched_at REAL NOT NULL
+            )""")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_anime(self, anime_id: int):
+        """(payload, fetched_at) of an anime, or None."""
+        row = self._connection().execute(
+            "SELECT payload, fetched_at FROM anime WHERE anime_id = ?", (int(anime_id),)
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put_anime(self, anime_id: int, payload: Dict[str, Any]) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO anime (anime_id, payload, fetched_at) VALUES (?, ?, ?)",
+                (int(anime_id), json.dumps(payload), time.time())
+            )
+
+    def get_search(self, query: str):
+        """(payload or None for no hits, fetched_at) of a search, or None if never searched."""
+        row = self._connection().execute(
+            "SELECT payload, fetched_at FROM searches WHERE query = ?", (query,)
+        ).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]) if row[0] is not None else None), row[1]
+
+    def put_search(self, query: str, payload: Optional[Dict[str, Any]]) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO searches (query, anime_id, payload, fetched_at) VALUES (?, ?, ?, ?)",
+                (query, payload.get('mal_id') if payload else None,
+                 json.dumps(payload) if payload is not None else None, time.time())
+            )
+
+class JikanClient:
+    """
+    Jikan API client with pooled keep-alive connections and a persistent cache.
+
+    All requests share one requests.Session (and its connection pool), go
+    through the shared Jikan rate limiter, and time out explicitly. A 429 or
+    5xx response is retried with exponential backoff, honouring Retry-After.
+    Payloads are cached for `ttl` seconds; when a refresh fails, the stale
+    payload is returned instead of nothing.
+    """
+
+    def __init__(self, base_url: str = JIKAN_BASE_URL, cache: Optional[JikanCache] = None,
+                 ttl: float = DEFAULT_TTL, timeout=DEFAULT_TIMEOUT, max_retries: int = 3,
+                 backoff: float = 1.0, limiter: Optional[RateLimiter] = JIKAN_LIMITER,
+                 pool_size: int = 8):
+        """
+        Args:
+            base_url (str): API root, e.g. https://api.jikan.moe/v4
+            cache (JikanCache): Payload cache (default: cache/jikan/jikan_cache.sqlite3)
+            ttl (float): Seconds a cached payload stays fresh
+            timeout: Request timeout, seconds or (connect, read)
+            max_retries (int): Retries of a rate-limited or failed request
+            backoff (float): First retry delay in seconds, doubled for each retry
+            limiter (RateLimiter): Limiter shared with other Jikan callers (None disables it)
+            pool_size (int): Connections kept open
+        """
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache if cache is not None else JikanCache()
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.limiter = limiter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _get(self, path: str, params: Optional[Dict[str, Any]] = None,
+             timeout=None, max_retries: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        GET a JSON document.
+
+        Returns:
+            dict or None: The document, or None for a 404
+
+        Raises:
+            requests.RequestException: If the request still fails after the retries
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                response = self.session.get(
+                    f"{self.base_url}{path}", params=params, timeout=timeout or self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == max_retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(1, 1.5))
+                continue
+
+            if response.status_code == 404:
+                return None
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == max_retries:
+                    response.raise_for_status()
+                retry_after = response.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else \
+                    self.backoff * 2 ** attempt * random.uniform(1, 1.5)
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json()
+        return None
+
+    def anime(self, anime_id: int, **request_options) -> Optional[Dict[str, Any]]:
+        """
+        Full payload of an anime (/anime/{id}/full).
+
+        Args:
+            anime_id (int): MyAnimeList ID
+            **request_options: timeout / max_retries for this call
+
+        Returns:
+            dict or None: The payload, or None if Jikan has no such anime
+        """
+        cached = self.cache.get_anime(anime_id)
+        if cached is not None and time.time() - cached[1] < self.ttl:
+            return cached[0]
+        try:
+            document = self._get(f"/anime/{int(anime_id)}/full", **request_options)
+        except (requests.RequestException, ValueError) as e:
+            print(f"[Jikan Error] anime {anime_id}: {e}")
+            return cached[0] if cached is not None else None
+        if document is None or not document.get('data'):
+            return None
+        self.cache.put_anime(anime_id, document['data'])
+        return document['data']
+
+    def search(self, title: str, **request_options) -> Optional[Dict[str, Any]]:
+        """
+        Payload of the first search result for a title.
+
+        Args:
+            title (str): Title to search for
+            **request_options: timeout / max_retries for this call
+
+        Returns:
+            dict or None: The payload, or None if nothing matched (or Jikan failed
+                and nothing is cached)
+        """
+        query = " ".join(title.casefold().split())
+        cached = self.cache.get_search(query)
+        if cached is not None and time.time() - cached[1] < self.ttl:
+            return cached[0]
+        try:
+            document = self._get("/anime", params={"q": title, "limit": 1}, **request_options)
+        except (requests.RequestException, ValueError) as e:
+            print(f"[Jikan Error] {title}: {e}")
+            return cached[0] if cached is not None else None
+        payload = document['data'][0] if document and document.get('data') else None
+        self.cache.put_search(query, payload)
+        return payload
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_jikan_client() -> JikanClient:
+    """The shared client of this process."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = JikanClient()
+        return _CLIENT
+
+def fetch_anime_image(title: str, anime_id: Optional[int] = None) -> str:
     """
     Fetch the anime poster image from Jikan API.
     Returns a URL string or a placeholder if not found.
     """
+    client = get_jikan_client()
+    anime = client.anime(anime_id) if anime_id is not None else client.search(title)
     try:
-        response = requests.get(
-            "https://api.jikan.moe/v4/anime",
-            params={"q": title, "limit": 1}
-        )
-        data = response.json()
-        return data["data"][0]["images"]["jpg"]["large_image_url"]
-    except Exception as e:
-        print(f"[Jikan Error] {title}: {e}")
-        return "https://via.placeholder.com/120/ff4baf/ffffff?text=No+Image"
-
-def fetch_anime_data(title: str) -> Dict[str, Union[str, None]]:
-    """
-    Fetch detailed anime data from Jikan API.
+        return anime["images"]["jpg"]["large_image_url"]
+    except (TypeError, KeyError):
+        return PLACEHOLDER_IMAGE
+
+def fetch_anime_data(title: str, anime_id: Optional[int] = None) -> Dict[str, Union[str, None]]:
+    """
+    Fetch detailed anime data from Jikan API (by anime_id when known, else by title search).
     Returns a dictionary with image, synopsis, and other details.
     """
-    try:
-        response = requests.get(
-            "https://api.jikan.moe/v4/anime",
-            params={"q": title, "limit": 1}
-        )
-        data = response.json()
-        anime = data["data"][0]
-        
-        return {
-            "image_url": anime["images"]["jpg"]["large_image_url"],
-            "synopsis": anime.get("synopsis"),
-            "trailer_url": anime.get("trailer", {}).get("url"),
-            "episodes": anime.get("episodes"),
-            "genres": [genre["name"] for genre in anime.get("genres", [])]
-        }
-    except Exception as e:
-        print(f"[Jikan Error] {title}: {e}")
+    client = get_jikan_client()
+    anime = client.anime(anime_id) if anime_id is not None else client.search(title)
+    if anime is None:
         return {
-            "image_url": "https://via.placeholder.com/120/ff4baf/ffffff?text=No+Image",
+            "image_url": PLACEHOLDER_IMAGE,
             "synopsis": None,
             "trailer_url": None,
             "episodes": None,
             "genres": None
-        } 
\ No newline at end of file
+        }
+
+    return {
+        "image_url": (anime.get("images") or {}).get("jpg", {}).get("large_image_url") or PLACEHOLDER_IMAGE,
+        "synopsis": anime.get("synopsis"),
+        "trailer_url": (anime.get("trailer") or {}).get("url"),
+        "episodes": anime.get("episodes"),
+        "genres": [genre["name"] for genre in anime.get("genres", [])]
+    }
@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ANIME_PATH = os.path.join(PROJECT_ROOT, "data", "anime.csv")
+
+POSTER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="225" height="320">'
+    '<rect width="100%" height="100%" fill="#1c1c1e"/>'
+    '<text x="50%" y="50%" fill="#ff4baf" font-size="20" text-anchor="middle">{anime_id}</text></svg>'
+)
+
+class JikanStub:
+    """
+    Local stand-in for the Jikan API, serving data/anime.csv.
+
+    It answers the endpoints the client uses (/v4/anime?q=... and
+    /v4/anime/{id}/full) with payloads in Jikan's shape, serves placeholder
+    posters, and enforces a per-second rate limit with 429 responses like the
+    real API. To work offline:
+
+        python -m utils.jikan_stub --port 8765
+        JIKAN_BASE_URL=http://127.0.0.1:8765/v4 streamlit run streamlit_app/app.py
+    """
+
+    def __init__(self, anime_path: str = DEFAULT_ANIME_PATH, rate_limit: int = 3, latency: float = 0.0):
+        """
+        Args:
+            anime_path (str): Catalog to serve
+            rate_limit (int): Requests per second before 429s (0 disables the limit)
+            latency (float): Seconds added to every API response
+        """
+        anime_df = pd.read_csv(anime_path)
+        self.anime = {int(row.anime_id): row for row in anime_df.itertuples(index=False)}
+        self.titles = [(str(row.name).casefold(), int(row.anime_id))
+                       for row in anime_df.itertuples(index=False) if isinstance(row.name, str)]
+        self.rate_limit = rate_limit
+        self.latency = latency
+        self.base_url = ""
+        self.requests = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Count a request; False if it exceeds the per-second limit."""
+        with self._lock:
+            self.requests += 1
+            if not self.rate_limit:
+                return True
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate_limit:
+                return False
+            self._recent.append(now)
+            return True
+
+    def payload(self, anime_id: int) -> Optional[Dict]:
+        row = self.anime.get(anime_id)
+        if row is None:
+            return None
+        poster = f"{self.base_url}/images/anime/{anime_id}.svg"
+        genres = [g.strip() for g in row.genre.split(',')] if isinstance(row.genre, str) else []
+        episodes = pd.to_numeric(row.episodes, errors='coerce')
+        return {
+            "mal_id": anime_id,
+            "title": row.name,
+            "type": row.type if isinstance(row.type, str) else None,
+            "episodes": None if pd.isna(episodes) else int(episodes),
+            "score": None if pd.isna(row.rating) else float(row.rating),
+            "members": int(row.members),
+            "synopsis": f"Offline stub entry for {row.name}.",
+            "images": {"jpg": {"image_url": poster, "large_image_url": poster}},
+            "trailer": {"url": None},
+            "genres": [{"name": g} for g in genres]
+        }
+
+    def search(self, query: str, limit: int) -> list:
+        """Exact (case-insensitive) title matches first, then substring matches."""
+        query = query.casefold().strip()
+        exact = [anime_id for title, anime_id in self.titles if title == query]
+        partial = [anime_id for title, anime_id in self.titles if query in title and title != query]
+        return [self.payload(anime_id) for anime_id in (exact + partial)[:limit]]
+
+def _handler(stub: JikanStub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, as with the real API
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, document: Dict, headers=None):
+            self._send(status, json.dumps(document).encode(), headers=headers)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            poster = re.fullmatch(r"/images/anime/(\d+)\.svg", url.path)
+            if poster:
+                self._send(200, POSTER_SVG.format(anime_id=poster.group(1)).encode(), "image/svg+xml")
+                return
+
+            if not stub.allow():
+                self._json(429, {"status": 429, "type": "RateLimitException",
+                                 "message": "You are being rate-limited."}, {"Retry-After": "1"})
+                return
+            if stub.latency:
+                time.sleep(stub.latency)
+
+            full = re.fullmatch(r"/v4/anime/(\d+)(?:/full)?", url.path)
+            if full:
+                payload = stub.payload(int(full.group(1)))
+                if payload is None:
+                    self._json(404, {"status": 404, "type": "BadResponseException", "message": "Not Found"})
+                else:
+                    self._json(200, {"data": payload})
+            elif url.path == "/v4/anime":
+                params = parse_qs(url.query)
+                query = params.get("q", [""])[0]
+                limit = int(params.get("limit", ["25"])[0])
+                self._json(200, {"data": stub.search(query, limit)})
+            else:
+                self._json(404, {"status": 404, "message": "Not Found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, **stub_options) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Serve the stub from a background thread.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port (0 picks a free one)
+        **stub_options: anime_path, rate_limit, latency for JikanStub
+
+    Returns:
+        tuple: (server, base URL to use as JIKAN_BASE_URL); call server.shutdown() to stop
+    """
+    stub = JikanStub(**stub_options)
+    server = ThreadingHTTPServer((host, port), _handler(stub))
+    server.daemon_threads = True
+    server.stub = stub
+    stub.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="jikan-stub", daemon=True).start()
+    return server, f"{stub.base_url}/v4"
+
+def main():
+    """Run the stub in the foreground."""
+    parser = argparse.ArgumentParser(description="Offline Jikan API stub for KawaiiRecSys")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate-limit", type=int, default=3, help="Requests per second before 429s (0: no limit)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API response")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.host, args.port, rate_limit=args.rate_limit, latency=args.latency)
+    print(f"Jikan stub listening; set JIKAN_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
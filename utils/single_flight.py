@@ -0,0 +1,80 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .cache_storage import file_lock
+
+class _Call:
+    """One in-flight computation and the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one computation.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs block and receive the same result (or exception). Once the call
+    finishes the key is forgotten, so later calls compute again; caching the
+    result is the caller's job.
+
+    Passing lock_path extends this across processes: the leader also holds an
+    advisory file lock while computing, and the function should first re-check
+    the shared cache, since another process may have filled it meanwhile.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], lock_path: Optional[str] = None) -> Any:
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Args:
+            key (hashable): Identifies the computation
+            fn (callable): Computation to run, without arguments
+            lock_path (str): Optional file to lock for cross-process coalescing
+
+        Returns:
+            The result of fn
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if lock_path is not None:
+                with file_lock(lock_path):
+                    call.result = fn()
+            else:
+                call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        """Number of computations currently running."""
+        with self._lock:
+            return len(self._calls)
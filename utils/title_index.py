@@ -0,0 +1,165 @@
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Characters that separate words once punctuation is removed
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+def normalize_title(title: str) -> str:
+    """
+    Normalized form of a title for lookups.
+
+    NFKC-normalizes (full-width characters, ligatures), casefolds, replaces
+    punctuation with spaces and collapses whitespace, so
+    "Fullmetal Alchemist: Brotherhood" and "fullmetal alchemist brotherhood"
+    are the same key.
+    """
+    if not isinstance(title, str):
+        return ""
+    title = unicodedata.normalize("NFKC", title).casefold()
+    return _NON_WORD.sub(" ", title).strip()
+
+def _ngrams(text: str, n: int) -> List[str]:
+    """Character n-grams of a normalized title, padded so short titles still have some."""
+    padded = f" {text} "
+    if len(padded) < n:
+        return [padded]
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+class TitleIndex:
+    """
+    Title -> catalog positions, built once per catalog.
+
+    Lookups try the exact name, then the normalized name (both O(1) dict
+    lookups), and optionally fall back to character n-gram similarity for
+    near misses (typos, missing words). Positions are row positions in the
+    catalog the index was built from; a name can have several.
+    """
+
+    def __init__(self, names: Sequence[str], ngram: int = 3):
+        """
+        Args:
+            names (sequence): Catalog titles, in catalog order
+            ngram (int): n-gram length used by the fuzzy fallback
+        """
+        self.names = np.asarray(names, dtype=object)
+        self.ngram = ngram
+
+        exact = defaultdict(list)
+        normalized = defaultdict(list)
+        for position, name in enumerate(self.names):
+            exact[name].append(position)
+            normalized[normalize_title(name)].append(position)
+        self._exact = {name: np.array(p) for name, p in exact.items()}
+        self._normalized = {key: np.array(p) for key, p in normalized.items()}
+
+        # The n-gram index is only built on the first fuzzy lookup
+        self._gram_postings = None
+        self._gram_counts = None
+        self._keys = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _build_ngrams(self):
+        with self._lock:
+            if self._gram_postings is not None:
+                return
+            keys = list(self._normalized)
+            postings = defaultdict(list)
+            counts = np.empty(len(keys), dtype=np.int32)
+            for key_id, key in enumerate(keys):
+                grams = set(_ngrams(key, self.ngram))
+                counts[key_id] = len(grams)
+                for gram in grams:
+                    postings[gram].append(key_id)
+            self._keys = keys
+            self._gram_counts = counts
+            self._gram_postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def fuzzy_lookup(self, title: str, min_similarity: float = 0.5) -> np.ndarray:
+        """
+        Positions of the most similar title by n-gram Dice similarity.
+
+        Only titles sharing at least one n-gram with the query are scored.
+
+        Returns:
+            np.ndarray: Positions of the best match, empty if none reaches min_similarity
+        """
+        self._build_ngrams()
+        grams = set(_ngrams(normalize_title(title), self.ngram))
+        postings = [self._gram_postings[g] for g in grams if g in self._gram_postings]
+        if not postings:
+            return np.array([], dtype=np.int64)
+
+        shared = np.bincount(np.concatenate(postings), minlength=len(self._keys))
+        similarity = 2.0 * shared / (len(grams) + self._gram_counts)
+        best = int(np.argmax(similarity))
+        if similarity[best] < min_similarity:
+            return np.array([], dtype=np.int64)
+        return self._normalized[self._keys[best]]
+
+    def lookup(self, title: str, fuzzy: bool = False, min_similarity: float = 0.5) -> np.ndarray:
+        """
+        Catalog positions of a title.
+
+        Args:
+            title (str): Title to find
+            fuzzy (bool): Fall back to n-gram similarity if there is no exact match
+            min_similarity (float): Minimum similarity (0-1) for a fuzzy match
+
+        Returns:
+            np.ndarray: Matching positions (empty if not found)
+        """
+        positions = self._exact.get(title)
+        if positions is None:
+            positions = self._normalized.get(normalize_title(title))
+        if positions is None and fuzzy:
+            positions = self.fuzzy_lookup(title, min_similarity)
+        if positions is None:
+            return np.array([], dtype=np.int64)
+        return positions
+
+    def first(self, title: str, fuzzy: bool = False, min_similarity: float = 0.5) -> Optional[int]:
+        """First catalog position of a title, or None if not found."""
+        positions = self.lookup(title, fuzzy, min_similarity)
+        return int(positions[0]) if len(positions) else None
+
+    def positions(self, titles: Iterable[str], fuzzy: bool = False) -> np.ndarray:
+        """Sorted, distinct catalog positions of several titles (unknown titles are skipped)."""
+        found = [self.lookup(title, fuzzy) for title in titles]
+        found = [p for p in found if len(p)]
+        if not found:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def mask(self, titles: Iterable[str], fuzzy: bool = False) -> np.ndarray:
+        """Boolean mask over the catalog rows of several titles."""
+        mask = np.zeros(len(self.names), dtype=bool)
+        mask[self.positions(titles, fuzzy)] = True
+        return mask
+
+# Indexes per catalog DataFrame; the DataFrame is kept so an id is never reused
+_INDEXES: Dict[int, tuple] = {}
+_INDEXES_MAX = 4
+_INDEXES_LOCK = threading.Lock()
+
+def get_title_index(anime_df) -> TitleIndex:
+    """Build the title index for a catalog once and reuse it."""
+    key = id(anime_df)
+    with _INDEXES_LOCK:
+        entry = _INDEXES.get(key)
+        if entry is not None and entry[0] is anime_df and len(entry[1]) == len(anime_df):
+            return entry[1]
+
+    index = TitleIndex(anime_df['name'].values)
+    with _INDEXES_LOCK:
+        _INDEXES[key] = (anime_df, index)
+        while len(_INDEXES) > _INDEXES_MAX:
+            _INDEXES.pop(next(iter(_INDEXES)))
+    return index